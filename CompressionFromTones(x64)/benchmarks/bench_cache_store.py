@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_store import ProcessedFilesStore
+
+# Per-file write cost of the SQLite processed_files store against the old
+# "rewrite the whole JSON file after every file" cache.
+
+def fake_path(i):
+    return f"/srv/scans/dept{i % 97:02d}/batch{i // 1000:05d}/invoice_{i:07d}.pdf"
+
+def bench_sqlite(entries, work_dir):
+    store = ProcessedFilesStore(os.path.join(work_dir, "cache.sqlite3"))
+    start = time.perf_counter()
+    for i in range(entries):
+        store[fake_path(i)] = 100_000 + i
+    write_time = time.perf_counter() - start
+    lookups = min(entries, 100_000)
+    start = time.perf_counter()
+    for i in random.sample(range(entries), lookups):
+        store.get(fake_path(i))
+    lookup_time = time.perf_counter() - start
+    store.close()
+    return {"entries": entries, "write_s": round(write_time, 3),
+            "writes_per_s": round(entries / write_time),
+            "lookup_us": round(lookup_time / lookups * 1e6, 2),
+            "db_mb": round(os.path.getsize(os.path.join(work_dir, "cache.sqlite3")) / (1024 * 1024), 1)}
+
+def bench_json(entries, work_dir):
+    path = os.path.join(work_dir, "cache.json")
+    cache = {}
+    start = time.perf_counter()
+    for i in range(entries):
+        cache[fake_path(i)] = 100_000 + i
+        with open(path, "w") as f:
+            json.dump(cache, f)
+    write_time = time.perf_counter() - start
+    return {"entries": entries, "write_s": round(write_time, 3),
+            "writes_per_s": round(entries / write_time)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the processed_files cache backends.")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--json-entries", type=int, default=5_000,
+                        help="The JSON cache is quadratic, so it is measured on a smaller set")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        print("sqlite:", json.dumps(bench_sqlite(args.entries, work_dir)))
+        if args.json_entries:
+            print("json:  ", json.dumps(bench_json(args.json_entries, work_dir)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+# End-to-end benchmark of compress.py on a deterministic synthetic corpus.
+#   python benchmarks/bench_compression.py --output results.json
+#   python benchmarks/bench_compression.py --baseline results.json --fail-on-regression
+# Every preset/engine combination runs in its own process with a throwaway HOME, so the
+# config, caches and preflight history of the machine never leak into the numbers.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPRESS_SCRIPT = os.path.join(APP_DIR, "compress.py")
+CORPUS_VERSION = 1
+PRESETS = ["screen", "ebook", "printer", "prepress"]
+ENGINES = ["process", "session"]
+# metric -> True when higher is better
+COMPARED_METRICS = {"files_per_s": True, "mb_per_s": True, "latency_p50_s": False, "latency_p95_s": False,
+                    "peak_rss_mb": False, "ratio": False}
+
+# ----------------- Synthetic PDF Writer -----------------
+def write_pdf(path, pages):
+    # pages: list of (content bytes, {image name: (width, height, raw gray bytes)})
+    objects = [None, None]  # 1: catalog, 2: page tree
+    page_refs = []
+    for content, images in pages:
+        xobjects = []
+        for name, (width, height, pixels) in images.items():
+            data = zlib.compress(pixels, 1)
+            objects.append(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                           b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream"
+                           % (width, height, len(data), data))
+            xobjects.append(b"/%s %d 0 R" % (name.encode(), len(objects)))
+        data = zlib.compress(content)
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(data), data))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> "
+                       b"/XObject << %s >> >> >>" % (content_ref, b" ".join(xobjects)))
+        page_refs.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Count %d /Kids [%s] >>" % (
+        len(page_refs), b" ".join(b"%d 0 R" % ref for ref in page_refs))
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def text_page(rng, lines=50):
+    words = ["invoice", "total", "amount", "delivery", "account", "period", "balance", "ref", "net", "tax"]
+    ops = [b"BT /F1 11 Tf 14 TL 56 740 Td"]
+    for _ in range(lines):
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(6, 12)))
+        ops.append(b"(%s) '" % line.encode())
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+def vector_page(rng, segments=20000):
+    ops = [b"0.2 w"]
+    for _ in range(segments):
+        ops.append(b"%.2f %.2f m %.2f %.2f l S" % (rng.uniform(0, 612), rng.uniform(0, 792),
+                                                   rng.uniform(0, 612), rng.uniform(0, 792)))
+    return b"\n".join(ops)
+
+def scan_pixels(rng, width, height):
+    # Paper-white rows mixed with noisy "ink" rows from a small pool, so Flate gets some but not
+    # most of the redundancy a real scan has
+    pool = [bytes(rng.randint(235, 255) for _ in range(width)) for _ in range(8)]
+    pool += [rng.randbytes(width) for _ in range(24)]
+    return b"".join(rng.choice(pool) for _ in range(height))
+
+def scanned_page(rng, dpi):
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    content = b"q 612 0 0 792 0 0 cm /Im0 Do Q"
+    return content, {"Im0": (width, height, scan_pixels(rng, width, height))}
+
+def build_document(kind, rng, scale):
+    if kind == "text":
+        return [(text_page(rng), {}) for _ in range(max(1, int(20 * scale)))]
+    if kind == "scanned":
+        return [scanned_page(rng, 300) for _ in range(max(1, int(4 * scale)))]
+    if kind == "vector":
+        return [(vector_page(rng), {}) for _ in range(max(1, int(6 * scale)))]
+    if kind == "precompressed":
+        # Already at screen resolution and incompressible: nothing left for gs to remove
+        return [(b"q 612 0 0 792 0 0 cm /Im0 Do Q", {"Im0": (612, 792, rng.randbytes(612 * 792))})
+                for _ in range(max(1, int(3 * scale)))]
+    if kind == "tiny":
+        return [(b"BT /F1 12 Tf 72 720 Td (Receipt %d) Tj ET" % rng.randint(0, 10 ** 9), {})]
+    if kind == "huge":
+        return [scanned_page(rng, 200) for _ in range(max(1, int(40 * scale)))]
+    raise ValueError(kind)
+
+CORPUS_LAYOUT = {"text": 4, "scanned": 3, "vector": 3, "precompressed": 3, "tiny": 10, "huge": 1}
+
+def generate_corpus(corpus_dir, seed, scale):
+    manifest_path = os.path.join(corpus_dir, "corpus.json")
+    wanted = {"version": CORPUS_VERSION, "seed": seed, "scale": scale, "layout": CORPUS_LAYOUT}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f).get("spec") == wanted:
+                return
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    files = {}
+    for kind, count in CORPUS_LAYOUT.items():
+        os.makedirs(os.path.join(corpus_dir, kind))
+        for i in range(count):
+            rng = random.Random(f"{seed}:{kind}:{i}")
+            path = os.path.join(corpus_dir, kind, f"{kind}_{i:02d}.pdf")
+            write_pdf(path, build_document(kind, rng, scale))
+            files[os.path.relpath(path, corpus_dir)] = os.path.getsize(path)
+    with open(manifest_path, "w") as f:
+        json.dump({"spec": wanted, "files": files}, f, indent=2)
+
+# ----------------- Runner -----------------
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+def run_child(command, env):
+    # os.wait4 reports the child's peak RSS including the gs processes it waited for
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if not hasattr(os, "wait4"):
+        _, stderr = process.communicate()
+        return process.returncode, None, stderr
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stderr.close()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = usage.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else usage.ru_maxrss / 1024
+    return process.returncode, peak, stderr
+
+def folder_sizes(folder):
+    sizes = {}
+    for root_dir, _, files in os.walk(folder):
+        for file in files:
+            if file.endswith(".pdf"):
+                path = os.path.join(root_dir, file)
+                sizes[os.path.relpath(path, folder)] = os.path.getsize(path)
+    return sizes
+
+def bench_configuration(corpus_dir, preset, engine, jobs, preflight):
+    with tempfile.TemporaryDirectory(prefix="pdfc-bench-") as work_dir:
+        home = os.path.join(work_dir, "home")
+        data = os.path.join(work_dir, "data")
+        os.makedirs(home)
+        shutil.copytree(corpus_dir, data, ignore=shutil.ignore_patterns("corpus.json"))
+        before = folder_sizes(data)
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        command = [sys.executable, COMPRESS_SCRIPT, data, "--quality", preset, "--engine", engine]
+        if jobs:
+            command += ["--jobs", str(jobs)]
+        if not preflight:
+            command.append("--no-preflight")
+        start = time.perf_counter()
+        returncode, peak_rss, stderr = run_child(command, env)
+        elapsed = time.perf_counter() - start
+        if returncode != 0:
+            raise RuntimeError(f"compress.py exited with {returncode}: {stderr.decode(errors='replace')[-2000:]}")
+        after = folder_sizes(data)
+        conn = sqlite3.connect(os.path.join(home, ".pdf_compressor_cache.sqlite3"))
+        latencies = [row[0] for row in conn.execute("SELECT wall_time FROM compression_runs")]
+        conn.close()
+    bytes_in, bytes_out = sum(before.values()), sum(after.values())
+    kinds = {}
+    for rel, size in before.items():
+        kind = rel.split(os.sep)[0]
+        totals = kinds.setdefault(kind, [0, 0])
+        totals[0] += size
+        totals[1] += after.get(rel, size)
+    return {
+        "preset": preset, "engine": engine, "files": len(before), "gs_runs": len(latencies),
+        "wall_s": round(elapsed, 3),
+        "files_per_s": round(len(before) / elapsed, 3),
+        "mb_per_s": round(bytes_in / (1024 * 1024) / elapsed, 3),
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        "bytes_in": bytes_in, "bytes_out": bytes_out,
+        "ratio": round(bytes_out / bytes_in, 4) if bytes_in else None,
+        "ratio_by_kind": {kind: round(out / size, 4) for kind, (size, out) in sorted(kinds.items()) if size},
+    }
+
+# ----------------- Baseline Comparison -----------------
+def compare(results, baseline, tolerance):
+    # Returns (report lines, number of regressions beyond tolerance)
+    old = {(r["preset"], r["engine"]): r for r in baseline["results"]}
+    lines, regressions = [], 0
+    for result in results["results"]:
+        key = (result["preset"], result["engine"])
+        if key not in old:
+            lines.append(f"{key[0]}/{key[1]}: no baseline")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, now = old[key].get(metric), result.get(metric)
+            if not before or now is None:
+                continue
+            change = (now - before) / before
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            regressions += worse
+            lines.append(f"{key[0]}/{key[1]} {metric}: {before} -> {now} ({change:+.1%})"
+                         + ("  REGRESSION" if worse else ""))
+    return lines, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compress.py on a synthetic PDF corpus.")
+    parser.add_argument("--corpus", default=os.path.join(tempfile.gettempdir(), "pdfc-bench-corpus"),
+                        help="Corpus folder; regenerated only when seed/scale change")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the page counts of the corpus")
+    parser.add_argument("--presets", nargs="+", choices=PRESETS, default=PRESETS)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="Passed to compress.py (default: CPU count)")
+    parser.add_argument("--preflight", action="store_true", help="Keep the preflight skip logic enabled")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    # Generated in a fresh process: the children forked later would otherwise start with (and
+    # report as their peak RSS) the memory this process used to build the images
+    generator = multiprocessing.get_context("spawn").Process(target=generate_corpus,
+                                                             args=(args.corpus, args.seed, args.scale))
+    generator.start()
+    generator.join()
+    if generator.exitcode != 0:
+        return 1
+    results = {"corpus": {"seed": args.seed, "scale": args.scale, "version": CORPUS_VERSION},
+               "jobs": args.jobs or os.cpu_count(), "preflight": args.preflight, "python": sys.version.split()[0],
+               "platform": sys.platform, "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": []}
+    for preset in args.presets:
+        for engine in args.engines:
+            result = bench_configuration(args.corpus, preset, engine, args.jobs, args.preflight)
+            results["results"].append(result)
+            print(json.dumps(result), flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressions = compare(results, json.load(f), args.tolerance)
+        print("\n".join(lines))
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
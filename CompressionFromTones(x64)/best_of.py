@@ -0,0 +1,92 @@
+import os
+import time
+import tempfile
+import subprocess
+from gs_process import ProcessTracker, GhostscriptCancelled, spawn, output_size
+
+# "Best of" mode: run several PDFSETTINGS presets at once and keep the smallest output.
+# pdfwrite output only grows while gs runs, so a run whose partial output is already larger
+# than the best finished result (or than the input) can never win and is killed early.
+
+PRESET_ORDER = ["screen", "ebook", "printer", "prepress"]  # Lowest to highest quality
+POLL_INTERVAL = 0.2
+
+def candidate_presets(min_preset, presets=None):
+    floor = PRESET_ORDER.index(min_preset) if min_preset in PRESET_ORDER else 0
+    allowed = PRESET_ORDER[floor:]
+    if presets:
+        allowed = [p for p in allowed if p in presets]
+    return allowed
+
+def _stop(tracker, process, stderr_file, reason="lost"):
+    tracker.kill(process, reason)
+    tracker.discard(process)
+    process.wait()
+    stderr_file.close()
+
+def run_best_of(build_command, file_path, presets, popen_kwargs=None, tracker=None, timeout=None):
+    # build_command(preset, output_file) -> gs argument list.
+    # Returns {"preset", "output", "size", "finished", "cancelled", "failed", "errors"}.
+    # Raises GhostscriptCancelled when the tracker cancels the trial, TimeoutExpired past `timeout`.
+    tracker = tracker or ProcessTracker()
+    deadline = time.monotonic() + timeout if timeout else None
+    input_size = os.path.getsize(file_path)
+    base, ext = os.path.splitext(file_path)
+    running = {}
+    for preset in presets:
+        output_file = f"{base}_{preset}_compressed{ext}"
+        # stderr goes to a file: nobody reads a pipe while we poll, and a full one would block gs
+        stderr_file = tempfile.TemporaryFile(mode="w+")
+        process = spawn(build_command(preset, output_file), popen_kwargs, stdout=subprocess.DEVNULL,
+                        stderr=stderr_file, text=True)
+        tracker.add(process)
+        running[preset] = (process, output_file, stderr_file)
+    finished, cancelled, failed, errors = {}, [], [], {}
+    try:
+        while running:
+            for preset, (process, output_file, stderr_file) in list(running.items()):
+                if process.poll() is None:
+                    continue
+                del running[preset]
+                if tracker.discard(process) == "cancelled":
+                    raise GhostscriptCancelled("Ghostscript run cancelled")
+                stderr_file.seek(0)
+                stderr = stderr_file.read()
+                stderr_file.close()
+                if process.returncode == 0 and os.path.exists(output_file):
+                    finished[preset] = (output_file, output_size(output_file))
+                else:
+                    failed.append(preset)
+                    errors[preset] = stderr
+            best_size = min([size for _, size in finished.values()] + [input_size])
+            for preset, (process, output_file, stderr_file) in list(running.items()):
+                if output_size(output_file) > best_size:
+                    _stop(tracker, process, stderr_file)
+                    del running[preset]
+                    cancelled.append(preset)
+            if running and deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(file_path, timeout)
+            if running:
+                time.sleep(POLL_INTERVAL)
+    except BaseException:
+        for preset in presets:
+            output_file = f"{base}_{preset}_compressed{ext}"
+            if os.path.exists(output_file) and preset not in running:
+                os.remove(output_file)
+        raise
+    finally:
+        for process, _, stderr_file in running.values():
+            _stop(tracker, process, stderr_file, "cancelled")
+        for preset, (_, output_file, _) in running.items():
+            if os.path.exists(output_file):
+                os.remove(output_file)
+    winner = min(finished, key=lambda p: finished[p][1]) if finished else None
+    for preset in presets:
+        output_file = f"{base}_{preset}_compressed{ext}"
+        if preset != winner and os.path.exists(output_file):
+            os.remove(output_file)
+    result = {"preset": winner, "output": None, "size": None, "finished": sorted(finished),
+              "cancelled": cancelled, "failed": failed, "errors": errors}
+    if winner:
+        result["output"], result["size"] = finished[winner]
+    return result
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+CACHE_DB_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_cache.sqlite3")
+LEGACY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_cache.json")
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+# ----------------- Processed Files Store -----------------
+class ProcessedFilesStore:
+    # Dict-like view of processed_files (path -> size in bytes) backed by SQLite.
+    # Every write is its own small WAL transaction, so a crash loses at most the file in flight.
+    def __init__(self, path=CACHE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = _connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS processed_files ("
+                          "path TEXT PRIMARY KEY, size INTEGER NOT NULL, updated REAL NOT NULL)")
+
+    def __contains__(self, file_path):
+        return self.get(file_path) is not None
+
+    def __getitem__(self, file_path):
+        value = self.get(file_path)
+        if value is None:
+            raise KeyError(file_path)
+        return value
+
+    def get(self, file_path, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM processed_files WHERE path = ?", (file_path,)).fetchone()
+        return row[0] if row else default
+
+    def __setitem__(self, file_path, size):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO processed_files (path, size, updated) VALUES (?, ?, ?)",
+                              (file_path, size, time.time()))
+
+    def __delitem__(self, file_path):
+        with self.lock:
+            self.conn.execute("DELETE FROM processed_files WHERE path = ?", (file_path,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM processed_files").fetchone()[0]
+
+    def update(self, entries):
+        with self.lock:
+            now = time.time()
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO processed_files (path, size, updated) VALUES (?, ?, ?)",
+                                      ((path, size, now) for path, size in entries.items()))
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def migrate_json(self, json_path=LEGACY_CACHE_FILE):
+        # One-time import of the old JSON cache; the file is kept as *.migrated for rollback
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        self.update({path: size for path, size in entries.items() if isinstance(size, int)})
+        os.replace(json_path, json_path + ".migrated")
+        return len(entries)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ----------------- Content Result Store -----------------
+class ContentResultStore:
+    # Compression outcome per (input digest, gs quality). output_digest/output_path let a
+    # duplicate reuse the compressed bytes, and let a moved output be recognised as done.
+    def __init__(self, path=CACHE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = _connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS content_results ("
+                          "input_digest TEXT NOT NULL, quality TEXT NOT NULL, outcome TEXT NOT NULL, "
+                          "input_size INTEGER NOT NULL, output_digest TEXT, output_size INTEGER, "
+                          "output_path TEXT, updated REAL NOT NULL, PRIMARY KEY (input_digest, quality))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS content_results_output "
+                          "ON content_results (output_digest)")
+
+    def _row(self, row):
+        if row is None:
+            return None
+        keys = ("input_digest", "quality", "outcome", "input_size", "output_digest", "output_size", "output_path")
+        return dict(zip(keys, row))
+
+    def lookup(self, digest, quality):
+        with self.lock:
+            row = self.conn.execute("SELECT input_digest, quality, outcome, input_size, output_digest, "
+                                    "output_size, output_path FROM content_results "
+                                    "WHERE input_digest = ? AND quality = ?", (digest, quality)).fetchone()
+        return self._row(row)
+
+    def lookup_output(self, digest):
+        with self.lock:
+            row = self.conn.execute("SELECT input_digest, quality, outcome, input_size, output_digest, "
+                                    "output_size, output_path FROM content_results "
+                                    "WHERE output_digest = ? LIMIT 1", (digest,)).fetchone()
+        return self._row(row)
+
+    def record(self, digest, quality, outcome, input_size, output_digest=None, output_size=None, output_path=None):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO content_results (input_digest, quality, outcome, input_size, "
+                              "output_digest, output_size, output_path, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (digest, quality, outcome, input_size, output_digest, output_size, output_path,
+                               time.time()))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ----------------- Preflight Log -----------------
+class PreflightStore:
+    # Predicted vs actual savings per pre-scanned file, for tuning preflight_min_savings
+    def __init__(self, path=CACHE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = _connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS preflight_results ("
+                          "path TEXT NOT NULL, quality TEXT NOT NULL, verdict TEXT NOT NULL, reason TEXT, "
+                          "predicted_ratio REAL, actual_ratio REAL, audited INTEGER NOT NULL DEFAULT 0, "
+                          "updated REAL NOT NULL, PRIMARY KEY (path, quality))")
+
+    def record(self, file_path, quality, verdict, reason, predicted_ratio, actual_ratio=None, audited=False):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO preflight_results (path, quality, verdict, reason, "
+                              "predicted_ratio, actual_ratio, audited, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (file_path, quality, verdict, reason, predicted_ratio, actual_ratio, int(audited),
+                               time.time()))
+
+    def summary(self, min_savings):
+        with self.lock:
+            rows = self.conn.execute("SELECT verdict, reason, predicted_ratio, actual_ratio, audited "
+                                     "FROM preflight_results").fetchall()
+        report = {"scanned": len(rows), "skipped": 0, "compressed": 0, "skip_reasons": {},
+                  "measured": 0, "mean_abs_error": None, "audited_skips": 0, "wrongly_skipped": 0}
+        errors = []
+        for verdict, reason, predicted, actual, audited in rows:
+            if verdict == "skip":
+                report["skipped"] += 1
+                report["skip_reasons"][reason] = report["skip_reasons"].get(reason, 0) + 1
+            else:
+                report["compressed"] += 1
+            if audited:
+                report["audited_skips"] += 1
+                if actual is not None and actual >= min_savings:
+                    report["wrongly_skipped"] += 1
+            if predicted is not None and actual is not None:
+                errors.append(abs(predicted - actual))
+        if errors:
+            report["measured"] = len(errors)
+            report["mean_abs_error"] = round(sum(errors) / len(errors), 4)
+        return report
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ----------------- Compression Run Log -----------------
+RUN_COLUMNS = ("mode", "preset", "passes", "input_size", "output_size", "outcome", "wall_time")
+# Added after the first release of the table; older databases get them through ALTER TABLE
+RUN_FEATURE_COLUMNS = {"pages": "INTEGER", "images": "INTEGER", "predicted_time": "REAL", "predicted_model": "TEXT"}
+
+class RunLogStore:
+    # One row per Ghostscript-backed compression: mode, preset, passes, sizes and timing,
+    # plus the cost-model features and prediction the scheduler used for it
+    def __init__(self, path=CACHE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = _connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS compression_runs ("
+                          "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, mode TEXT NOT NULL, "
+                          "preset TEXT, passes INTEGER NOT NULL, input_size INTEGER NOT NULL, output_size INTEGER, "
+                          "outcome TEXT NOT NULL, wall_time REAL, finished REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS compression_runs_path ON compression_runs (path)")
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(compression_runs)")}
+        for column, kind in RUN_FEATURE_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE compression_runs ADD COLUMN {column} {kind}")
+
+    def record(self, file_path, mode, preset, passes, input_size, output_size, outcome, wall_time,
+               pages=None, images=None, predicted_time=None, predicted_model=None):
+        with self.lock:
+            self.conn.execute("INSERT INTO compression_runs (path, mode, preset, passes, input_size, output_size, "
+                              "outcome, wall_time, finished, pages, images, predicted_time, predicted_model) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (file_path, mode, preset, passes, input_size, output_size, outcome, wall_time,
+                               time.time(), pages, images, predicted_time, predicted_model))
+
+    def last_run(self, file_path):
+        with self.lock:
+            row = self.conn.execute("SELECT " + ", ".join(RUN_COLUMNS) + " FROM compression_runs "
+                                    "WHERE path = ? ORDER BY id DESC LIMIT 1", (file_path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(RUN_COLUMNS, row))
+
+    def training_rows(self, mode="preset", limit=5000):
+        # (preset, input_size, pages, images, wall_time) of the most recent complete single-pass runs;
+        # pages and images are None where the file was never scanned
+        with self.lock:
+            return self.conn.execute("SELECT preset, input_size, pages, images, wall_time FROM compression_runs "
+                                     "WHERE mode = ? AND wall_time IS NOT NULL "
+                                     "AND outcome != 'stopped_early' ORDER BY id DESC LIMIT ?",
+                                     (mode, limit)).fetchall()
+
+    def runs_since(self, since):
+        # (predicted_time or None, wall_time, predicted_model or None) of runs finished after `since`
+        with self.lock:
+            return self.conn.execute("SELECT predicted_time, wall_time, predicted_model FROM compression_runs "
+                                     "WHERE finished >= ? AND wall_time IS NOT NULL", (since,)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ----------------- Failure Cache -----------------
+FAILURE_COLUMNS = ("path", "digest", "error_class", "message", "attempts", "last_attempt", "next_retry",
+                   "quarantined")
+
+class FailureStore:
+    # Files Ghostscript could not process, with exponential backoff between attempts and a
+    # quarantine after too many. Keyed by path; the content digest tells a fixed file (new
+    # bytes at the same path) from the same broken one.
+    def __init__(self, path=CACHE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = _connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS failures ("
+                          "path TEXT PRIMARY KEY, digest TEXT, error_class TEXT NOT NULL, message TEXT, "
+                          "attempts INTEGER NOT NULL, last_attempt REAL NOT NULL, next_retry REAL NOT NULL, "
+                          "quarantined INTEGER NOT NULL DEFAULT 0)")
+
+    def get(self, file_path):
+        with self.lock:
+            row = self.conn.execute("SELECT " + ", ".join(FAILURE_COLUMNS) + " FROM failures WHERE path = ?",
+                                    (file_path,)).fetchone()
+        return dict(zip(FAILURE_COLUMNS, row)) if row else None
+
+    def record(self, file_path, digest, error_class, message, base_delay, max_delay, max_attempts):
+        # Returns the updated entry; a different digest than last time starts the count over
+        with self.lock:
+            previous = self.get(file_path)
+            attempts = 1
+            if previous is not None and previous["digest"] == digest:
+                attempts = previous["attempts"] + 1
+            now = time.time()
+            quarantined = attempts >= max_attempts
+            next_retry = now + min(max_delay, base_delay * 2 ** (attempts - 1))
+            self.conn.execute("INSERT OR REPLACE INTO failures (path, digest, error_class, message, attempts, "
+                              "last_attempt, next_retry, quarantined) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (file_path, digest, error_class, message, attempts, now, next_retry,
+                               int(quarantined)))
+        return self.get(file_path)
+
+    def clear(self, file_path):
+        with self.lock:
+            return self.conn.execute("DELETE FROM failures WHERE path = ?", (file_path,)).rowcount > 0
+
+    def listing(self, quarantined_only=True):
+        query = "SELECT " + ", ".join(FAILURE_COLUMNS) + " FROM failures"
+        if quarantined_only:
+            query += " WHERE quarantined = 1"
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY last_attempt DESC").fetchall()
+        return [dict(zip(FAILURE_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ----------------- Deferred Queue -----------------
+DEFERRED_COLUMNS = ("path", "quality", "size", "predicted_time", "deferred_at")
+
+class DeferredStore:
+    # Large files held back until a batch window opens or the machine is idle. Persisted, so
+    # a restart (or a reboot overnight) does not lose the backlog.
+    def __init__(self, path=CACHE_DB_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = _connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS deferred_files ("
+                          "path TEXT PRIMARY KEY, quality TEXT, size INTEGER NOT NULL, predicted_time REAL, "
+                          "deferred_at REAL NOT NULL)")
+
+    def add(self, file_path, quality, size, predicted_time):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO deferred_files (path, quality, size, predicted_time, "
+                              "deferred_at) VALUES (?, ?, ?, ?, COALESCE((SELECT deferred_at FROM deferred_files "
+                              "WHERE path = ?), ?))",
+                              (file_path, quality, size, predicted_time, file_path, time.time()))
+
+    def remove(self, file_path):
+        with self.lock:
+            return self.conn.execute("DELETE FROM deferred_files WHERE path = ?", (file_path,)).rowcount > 0
+
+    def __contains__(self, file_path):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM deferred_files WHERE path = ?",
+                                     (file_path,)).fetchone() is not None
+
+    def listing(self):
+        # Oldest first: the order they are drained in
+        with self.lock:
+            rows = self.conn.execute("SELECT " + ", ".join(DEFERRED_COLUMNS) +
+                                     " FROM deferred_files ORDER BY deferred_at").fetchall()
+        return [dict(zip(DEFERRED_COLUMNS, row)) for row in rows]
+
+    def summary(self):
+        # (files, bytes, predicted seconds of work)
+        with self.lock:
+            count, size, seconds = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), "
+                                                     "COALESCE(SUM(predicted_time), 0) FROM deferred_files").fetchone()
+        return count, size, seconds
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def open_cache_store(path=CACHE_DB_FILE, legacy_path=LEGACY_CACHE_FILE):
+    store = ProcessedFilesStore(path)
+    store.migrate_json(legacy_path)
+    return store
@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+import json
+import argparse
+from concurrent.futures import wait
+
+import compressor_core as core
+from cost_model import accuracy_by_model
+from watch_backends import is_candidate_pdf
+
+# Headless front end:
+#   python compress.py DIR [DIR|FILE ...] --jobs 8 --quality ebook
+#   python compress.py DIR --watch
+
+QUALITY_CHOICES = list(core.QUALITY_PRESETS.values())
+
+def collect_pdfs(paths):
+    # Folders are walked with the configured scan filters; files named explicitly are always taken
+    skipped = {"dir": 0, "file": 0}
+    def on_skip(kind, reason, size):
+        skipped[kind] += 1
+    for path in paths:
+        if os.path.isdir(path):
+            scan_filter = core.configured_roots([path])[0].make_filter(on_skip)
+            for root_dir, dirs, files in os.walk(path):
+                dirs[:] = [d for d in dirs if not scan_filter.prune(os.path.join(root_dir, d))]
+                for file in files:
+                    if is_candidate_pdf(file) and scan_filter.accepts(os.path.join(root_dir, file)):
+                        yield os.path.join(root_dir, file)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            core.log_message(f"❌ Not found: {path}")
+    if skipped["dir"] or skipped["file"]:
+        core.log_message(f"🧹 Skipped {skipped['dir']} folder(s) and {skipped['file']} PDF(s) by the scan filters")
+
+def report_batch(started_wall, started, jobs):
+    makespan = time.monotonic() - started
+    pairs = core.run_log.runs_since(started_wall)
+    if not pairs:
+        return
+    actual = [a for _, a, _ in pairs]
+    # No schedule can beat the longest single job or a perfect split of the total work
+    lower_bound = max(max(actual), sum(actual) / jobs)
+    message = f"📊 Makespan {makespan:.1f}s (lower bound {lower_bound:.1f}s)"
+    for model, error in sorted(accuracy_by_model(pairs).items()):
+        message += (f", {model} cost model error: median {error['median_error']:.0%}, "
+                    f"mean {error['mean_error']:.0%} over {error['runs']} runs")
+    core.log_message(message)
+
+def run_batch(paths, quality):
+    policy = core.create_scheduler_policy(core.config.get("batch_priority_policy", "longest"), quality)
+    scheduler = core.CompressionScheduler(policy=policy)
+    folders = [os.path.abspath(p if os.path.isdir(p) else os.path.dirname(p) or ".") for p in paths]
+    core.session_pool = core.create_session_pool(folders, scheduler.jobs)
+    started_wall, started = time.time(), time.monotonic()
+    try:
+        futures = [f for f in scheduler.submit_batch(list(collect_pdfs(paths)), quality) if f is not None]
+        core.log_message(f"🔄 Compressing {len(futures)} file(s) with {scheduler.jobs} parallel jobs")
+        wait(futures)
+    except KeyboardInterrupt:
+        # gs runs in its own process group, so Ctrl+C does not reach it: kill it explicitly
+        core.log_message("⏹️ Interrupted, cancelling queued files.")
+        if core.session_pool:
+            core.session_pool.close()  # Kills sessions that are mid-file
+        scheduler.shutdown(wait=True, cancel_running=True)
+        return 130
+    finally:
+        scheduler.shutdown(wait=True)
+        if core.session_pool:
+            core.session_pool.close()
+            core.session_pool = None
+    compressed = sum(1 for f in futures if not f.cancelled() and f.result())
+    core.log_message(f"✅ Done: {compressed} of {len(futures)} file(s) compressed.")
+    report_batch(started_wall, started, scheduler.jobs)
+    return 0
+
+def run_watch(folders, quality):
+    core.start_monitoring(folders or None, quality)
+    try:
+        while core.is_monitoring():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        core.log_message("⏹️ Stopping monitoring.")
+    finally:
+        core.stop_monitoring()
+    return 0
+
+def print_failures(show_all):
+    entries = core.failures.listing(quarantined_only=not show_all)
+    if not entries:
+        print("No quarantined files." if not show_all else "No failing files.")
+        return 0
+    for entry in entries:
+        state = "quarantined" if entry["quarantined"] else \
+            "retry at " + time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["next_retry"]))
+        last = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_attempt"]))
+        print(f"{entry['path']}\n    {entry['error_class']}, {entry['attempts']} attempts, last {last}, {state}")
+    return 0
+
+def print_deferred():
+    for entry in core.deferred.listing():
+        since = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["deferred_at"]))
+        predicted = f", ~{core.describe_duration(entry['predicted_time'])}" if entry["predicted_time"] else ""
+        print(f"{entry['path']}\n    {entry['size'] / (1024 * 1024):.1f}MB, {entry['quality']}{predicted}, "
+              f"deferred {since}")
+    print(core.describe_deferred())
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="compress", description="Compress PDF files with Ghostscript.")
+    parser.add_argument("paths", nargs="*", help="PDF files or folders (searched recursively)")
+    parser.add_argument("--jobs", "-j", type=int, help="Parallel Ghostscript jobs (default: CPU count)")
+    parser.add_argument("--quality", "-q", choices=QUALITY_CHOICES,
+                        help="Ghostscript PDFSETTINGS preset (default: the configured quality)")
+    parser.add_argument("--watch", "-w", action="store_true",
+                        help="Keep watching the given folders for new PDFs (default: the configured watch roots)")
+    parser.add_argument("--engine", choices=["process", "session"], help="Ghostscript engine")
+    parser.add_argument("--backend", choices=["auto", "events", "polling"], help="Folder watch backend")
+    parser.add_argument("--target-size", type=float, metavar="MB",
+                        help="Search for the best quality that fits under this size instead of a fixed preset")
+    parser.add_argument("--best-of", action="store_true",
+                        help="Try every preset at or above --min-quality and keep the smallest output")
+    parser.add_argument("--min-quality", choices=QUALITY_CHOICES, help="Quality floor for --best-of")
+    parser.add_argument("--shard-threshold", type=float, metavar="MB",
+                        help="Split files above this size into page ranges compressed in parallel (0 = never)")
+    parser.add_argument("--priority", choices=["newest", "smallest", "fifo", "folder", "longest"],
+                        help="Order in which queued files are compressed (default: longest predicted job "
+                             "first for batches, newest first when watching)")
+    parser.add_argument("--metrics-file", help="Write Prometheus text-format metrics to this file")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on 127.0.0.1 at this port")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="Skip folders and PDFs matching this glob (repeatable, added to the configured ones)")
+    parser.add_argument("--min-size", type=float, metavar="KB", help="Leave PDFs smaller than this alone")
+    parser.add_argument("--max-size", type=float, metavar="MB", help="Leave PDFs larger than this alone")
+    parser.add_argument("--max-depth", type=int, help="Folder levels to descend (0 = top level only)")
+    parser.add_argument("--nice", type=int, metavar="N", help="CPU priority of Ghostscript, 0 (normal) to 19 (lowest)")
+    parser.add_argument("--memory-limit", type=float, metavar="MB", help="Address space limit per Ghostscript process")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="Estimated memory all running jobs may use together")
+    parser.add_argument("--defer-threshold", type=float, metavar="MB",
+                        help="When watching, hold PDFs above this size for a batch window or idle time (0 = never)")
+    parser.add_argument("--batch-window", action="append", metavar="WINDOW",
+                        help="When deferred files are compressed, e.g. \"22:00-06:00\" or \"Sat,Sun\" (repeatable)")
+    parser.add_argument("--no-preflight", action="store_true", help="Run Ghostscript on every file")
+    parser.add_argument("--quarantine", action="store_true", help="List quarantined files and exit")
+    parser.add_argument("--failures", action="store_true",
+                        help="List every file with recorded failures (quarantined or backing off) and exit")
+    parser.add_argument("--release", nargs="*", metavar="PATH",
+                        help="Clear the failure record of these files (default: all quarantined) and exit")
+    parser.add_argument("--preflight-report", action="store_true",
+                        help="Print predicted vs actual savings of the preflight scan and exit")
+    parser.add_argument("--deferred", action="store_true",
+                        help="List files waiting for a batch window or idle time, with an estimate, and exit")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.preflight_report:
+        report = core.preflight_results.summary(core.config.get("preflight_min_savings", 0.05))
+        print(json.dumps(report, indent=2))
+        return 0
+    if args.batch_window:
+        core.config["batch_windows"] = args.batch_window
+    if args.deferred:
+        return print_deferred()
+    if args.quarantine or args.failures:
+        return print_failures(args.failures)
+    if args.release is not None:
+        released = core.release_quarantine(args.release or None)
+        print(f"Released {len(released)} file(s).")
+        return 0
+    if not args.paths and not args.watch:
+        parser.error("at least one file or folder is required")
+    # Command-line overrides apply to this run only and are not saved to the config file
+    if args.jobs:
+        core.config["jobs"] = args.jobs
+    if args.engine:
+        core.config["engine"] = args.engine
+    if args.backend:
+        core.config["watch_backend"] = args.backend
+    if args.exclude:
+        core.config["scan_exclude"] = core.config.get("scan_exclude", core.DEFAULT_EXCLUDE) + args.exclude
+    if args.min_size is not None:
+        core.config["min_file_size_kb"] = args.min_size
+    if args.max_size is not None:
+        core.config["max_file_size_mb"] = args.max_size
+    if args.max_depth is not None:
+        core.config["max_depth"] = args.max_depth
+    if args.nice is not None:
+        core.config["gs_nice"] = args.nice
+    if args.memory_limit is not None:
+        core.config["gs_memory_limit_mb"] = args.memory_limit
+    if args.memory_budget is not None:
+        core.config["memory_budget_mb"] = args.memory_budget
+    if args.defer_threshold is not None:
+        core.config["defer_threshold_mb"] = args.defer_threshold
+    if args.no_preflight:
+        core.config["preflight"] = False
+    if args.target_size:
+        core.config["target_size_mb"] = args.target_size
+    if args.shard_threshold is not None:
+        core.config["shard_threshold_mb"] = args.shard_threshold
+    if args.best_of:
+        core.config["best_of"] = True
+    if args.min_quality:
+        core.config["best_of_min_quality"] = args.min_quality
+    if args.priority:
+        core.config["priority_policy"] = args.priority
+        core.config["batch_priority_policy"] = args.priority
+    if args.metrics_file:
+        core.config["metrics_file"] = args.metrics_file
+    if args.metrics_port:
+        core.config["metrics_port"] = args.metrics_port
+    quality = args.quality or core.config.get("quality", "Low Quality")
+    if args.watch and not all(os.path.isdir(path) for path in args.paths):
+        core.log_message("❌ --watch only takes folders.")
+        return 2
+    core.start_metrics()
+    try:
+        if args.watch:
+            return run_watch(args.paths, args.quality)
+        return run_batch(args.paths, quality)
+    finally:
+        core.stop_metrics()
+
+if __name__ == "__main__":
+    sys.exit(main())
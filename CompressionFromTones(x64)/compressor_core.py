@@ -0,0 +1,1109 @@
+import os
+import sys
+import subprocess
+import threading
+import json
+import shutil
+import random
+import time
+import heapq
+import itertools
+import datetime
+from concurrent.futures import Future
+from watch_backends import create_backend
+from scan_index import ScanIndex
+from gs_session import SessionPool, SessionError
+from gs_runtime import get_ghostscript_runtime
+from cache_store import open_cache_store, ContentResultStore, PreflightStore, RunLogStore, FailureStore, \
+    DeferredStore
+from fingerprint import file_digest, is_sampled
+from preflight import AnalysisCache, classify
+from target_size import compress_to_target
+from best_of import run_best_of, candidate_presets
+from sharding import count_pages, structure_blocker, plan_shards, compress_sharded
+from metrics import Metrics, MetricsExporter
+from priority import create_policy, priority_key, RootPriority
+from cost_model import CostModel, LongestFirst
+from settle import SettlingGate
+import gs_process
+from gs_process import ProcessTracker, GhostscriptCancelled, OutputTooLarge, run_process
+from governor import ProcessLimits, ResourceGovernor
+from watch_roots import parse_roots, owning_root
+from scan_filter import DEFAULT_EXCLUDE
+from deferral import parse_windows, window_open, next_opening, IdleMonitor
+
+# GUI-free compression core: used by the Tk front end (pdf_compressor.py), the CLI (compress.py)
+# and anyone importing it as a library. Nothing here may import tkinter, customtkinter, pystray or PIL.
+
+# ----------------- Configuration -----------------
+CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_config.json")
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_cache.sqlite3")
+
+QUALITY_PRESETS = {
+    "Low Quality": "screen",
+    "Balanced Quality": "ebook",
+    "High Quality": "printer",
+    "Very High Quality": "prepress"
+}
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    return {
+        "default_folder": "",
+        "watch_roots": [],  # [{"folder", "quality", "include", "exclude", "priority"}]; empty = default_folder
+        "scan_include": [],  # Globs (relative to the watched folder) a PDF must match; empty = all
+        "scan_exclude": list(DEFAULT_EXCLUDE),  # Globs for folders and files to skip
+        "min_file_size_kb": 0,  # Smaller PDFs are left alone
+        "max_file_size_mb": 0,  # Larger PDFs are left alone (0 = no limit)
+        "max_depth": None,  # Folder levels below a watched folder to scan (None = all, 0 = top level only)
+        "auto_monitoring": False,
+        "minimize_on_startup": False,
+        "quality": "Low Quality",
+        "jobs": 0,  # 0 = one Ghostscript job per CPU core
+        "watch_backend": "auto",  # "auto", "events" or "polling"
+        "poll_interval": 10,
+        "full_rescan_interval": 3600,  # Seconds between full listings when polling with the scan index
+        "engine": "process",  # "process" (one gs per file) or "session" (long-lived gs interpreters)
+        "dedupe": True,  # Reuse results for identical content across paths
+        "fingerprint_sample_mb": 256,  # Files above this are fingerprinted from sampled chunks
+        "log_history_lines": 1000,  # Lines kept in the GUI log window
+        "log_file": "",  # Optional rotating log file with the full history
+        "log_file_max_mb": 5,
+        "log_file_backups": 3,
+        "log_queue_size": 10000,  # Messages waiting for the GUI log window; more are dropped and counted
+        "preflight": True,  # Structural pre-scan that skips files unlikely to shrink
+        "preflight_min_savings": 0.05,  # Skip when the predicted reduction is below this fraction
+        "preflight_audit_rate": 0.02,  # Fraction of skips compressed anyway to measure the prediction
+        "target_size_mb": 0,  # > 0: search image resolution/JPEG quality until the output fits this size
+        "target_max_passes": 5,
+        "best_of": False,  # Run several presets at once and keep the smallest output
+        "best_of_min_quality": "Low Quality",  # Quality floor: presets below this are never tried
+        "best_of_presets": [],  # Optional subset of presets to try (default: all at or above the floor)
+        "shard_threshold_mb": 200,  # Files above this are split into page ranges compressed in parallel (0 = never)
+        "shard_min_pages": 50,  # Smallest page range worth its own Ghostscript process
+        "shard_jobs": 0,  # Page ranges per file (0 = CPU count); they run in parallel only on idle worker slots
+        "metrics_file": "",  # Prometheus text file, e.g. for node_exporter's textfile collector
+        "metrics_port": 0,  # > 0: serve /metrics on 127.0.0.1 at this port
+        "metrics_interval": 15,  # Seconds between metrics file writes
+        "priority_policy": "newest",  # Queue order: "newest", "smallest", "fifo", "folder" or "longest"
+        "priority_folders": [],  # Folders compressed before everything else, highest priority first
+        "batch_priority_policy": "longest",  # Queue order for one-off batches (CLI): longest predicted job first
+        "settle_seconds": 5,  # Watched files must be unchanged (and closed by their writer) this long (0 = off)
+        "failure_backoff_seconds": 60,  # Wait after the first failure; doubles with every further one
+        "failure_backoff_max_seconds": 86400,
+        "failure_max_attempts": 5,  # Failed attempts before a file is quarantined until released
+        "gs_timeout_seconds": 300,  # Per-run wall-clock limit: this much plus the per-MB allowance (0 = none)
+        "gs_timeout_per_mb_seconds": 6,
+        "gs_timeout_max_seconds": 7200,
+        "early_abort": True,  # Kill gs as soon as its output grows past the original size
+        "gs_nice": 10,  # CPU priority of gs processes, 0 (normal) to 19 (lowest)
+        "gs_io_priority": "low",  # "normal", "low" or "idle" (Linux)
+        "gs_memory_limit_mb": 0,  # Address space limit per gs process (0 = none)
+        "memory_budget_mb": 0,  # Estimated memory all running jobs may use together (0 = no cap)
+        "throttle_load_per_cpu": 1.5,  # Hold queued files while the load average per core is above this (0 = never)
+        "throttle_min_free_mb": 256,  # Hold queued files while less memory than this is available (0 = never)
+        "defer_threshold_mb": 0,  # Watched PDFs above this wait for a batch window or idle time (0 = never)
+        "batch_windows": [],  # When deferred files are compressed, e.g. ["22:00-06:00", "Sat,Sun"]
+        "idle_drain": True,  # Also compress deferred files while nobody is using the machine
+        "idle_seconds": 300,  # No keyboard/mouse input for this long counts as idle
+        "idle_cpu_percent": 25  # ...provided overall CPU use is below this
+    }
+
+def save_config(config):
+    with open(CONFIG_FILE, "w") as f:
+        json.dump(config, f)
+
+def load_cache():
+    # SQLite-backed, dict-like and safe to use from any thread; imports the old JSON cache once
+    return open_cache_store(CACHE_FILE)
+
+def resolve_quality(quality):
+    # Accepts either a GUI label ("Balanced Quality") or a PDFSETTINGS name ("ebook")
+    if quality in QUALITY_PRESETS:
+        return QUALITY_PRESETS[quality]
+    if quality in QUALITY_PRESETS.values():
+        return quality
+    return "screen"
+
+config = load_config()
+processed_files = load_cache()
+content_results = ContentResultStore(CACHE_FILE) if config.get("dedupe", True) else None
+preflight_results = PreflightStore(CACHE_FILE)
+run_log = RunLogStore(CACHE_FILE)
+failures = FailureStore(CACHE_FILE)
+deferred = DeferredStore(CACHE_FILE)
+
+monitoring_threads = []  # One watcher thread per root
+watchers = []
+monitor_stop_event = None  # For folder-monitoring threads
+scheduler = None
+session_pool = None
+deferred_drain = None
+metrics = Metrics()
+metrics_exporter = None
+analyses = AnalysisCache()  # Structural scans shared by preflight, sharding and cost estimates
+cost_model = CostModel(analyses)
+gs_processes = ProcessTracker()  # Every running gs child, so stop requests can kill them
+
+# ----------------- Front-End Hooks -----------------
+def _print_message(message):
+    print(message, flush=True)
+
+def _log_error(title, message):
+    pass  # Already written to the log by the caller
+
+log_handler = _print_message
+error_handler = _log_error
+
+def set_log_handler(handler):
+    global log_handler
+    log_handler = handler or _print_message
+
+def set_error_handler(handler):
+    # The GUI installs a message box here; headless runs only log
+    global error_handler
+    error_handler = handler or _log_error
+
+def log_message(message):
+    log_handler(message)
+
+def report_error(title, message):
+    error_handler(title, message)
+
+# ----------------- PDF Compression Functions -----------------
+def get_file_size(file_path):
+    return os.path.getsize(file_path) / (1024 * 1024)
+
+def get_ghostscript_executable():
+    # Resolved and probed once per process; see gs_runtime for the on-disk capability cache
+    runtime = get_ghostscript_runtime(log=log_message)
+    return runtime.executable if runtime else None
+
+def get_fingerprint(file_path):
+    sample_mb = config.get("fingerprint_sample_mb", 256)
+    return file_digest(file_path, sample_threshold=sample_mb * 1024 * 1024 if sample_mb else None)
+
+def reuse_content_result(file_path, file_size, digest, gs_quality, output_file):
+    # Returns None when Ghostscript still has to run, otherwise compress_pdf's result
+    if content_results.lookup_output(digest) is not None:
+        processed_files[file_path] = file_size
+        log_message(f"♻️ Already compressed (moved or copied output): {file_path}")
+        return False
+    known = content_results.lookup(digest, gs_quality)
+    if known is None:
+        return None
+    if known["outcome"] == "no_reduction":
+        processed_files[file_path] = file_size
+        log_message(f"⚠️ No size reduction for: {file_path} (identical content seen before)")
+        return False
+    source = known["output_path"]
+    # Bytes are only copied on a full-content match, never on a sampled fingerprint
+    if is_sampled(digest) or not source or source == file_path:
+        return None
+    try:
+        if os.path.getsize(source) != known["output_size"] or get_fingerprint(source) != known["output_digest"]:
+            return None
+        shutil.copyfile(source, output_file)
+        os.replace(output_file, file_path)
+    except OSError:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return None
+    processed_files[file_path] = os.path.getsize(file_path)
+    log_message(f"♻️ Reused compressed copy of {source} for: {file_path}")
+    return True
+
+def run_preflight(file_path, file_size, gs_quality):
+    # Returns the preflight verdict dict, or None when the file could not be scanned
+    try:
+        info = analyses.analyze(file_path)
+    except (OSError, ValueError) as e:
+        log_message(f"⚠️ Preflight could not read {file_path}: {e}")
+        return None
+    verdict, reason, ratio = classify(info, gs_quality, config.get("preflight_min_savings", 0.05))
+    audited = verdict == "skip" and random.random() < config.get("preflight_audit_rate", 0.02)
+    return {"verdict": verdict, "reason": reason, "predicted_ratio": ratio, "audited": audited,
+            "pages": info["pages"], "images": info["images"]}
+
+def record_preflight(file_path, gs_quality, preflight, actual_ratio=None):
+    if preflight is not None:
+        preflight_results.record(file_path, gs_quality, preflight["verdict"], preflight["reason"],
+                                 preflight["predicted_ratio"], actual_ratio, preflight["audited"])
+
+def build_gs_command(gs_executable, gs_quality, file_path, output_file, extra_args=()):
+    return [
+        gs_executable,
+        "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.4",
+        f"-dPDFSETTINGS=/{gs_quality}",
+        "-dNOPAUSE",
+        "-dQUIET",
+        "-dBATCH",
+        f"-sOutputFile={output_file}",
+        *extra_args,
+        file_path
+    ]
+
+def gs_popen_kwargs():
+    if sys.platform.startswith("win"):
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        return {"creationflags": subprocess.CREATE_NO_WINDOW, "startupinfo": startupinfo}
+    return {}
+
+# ----------------- Resource Limits -----------------
+GS_BASE_MEMORY = 64 * 1024 * 1024  # Interpreter, fonts and caches before any page is read
+
+def ensure_process_limits():
+    # Configured once, on the first compression, so command-line overrides are already applied
+    if gs_process.process_limits is not None:
+        return
+    limits = ProcessLimits(config.get("gs_nice", 10), config.get("gs_io_priority", "low"),
+                           int(config.get("gs_memory_limit_mb", 0) * 1024 * 1024), log=log_message)
+    gs_process.set_process_limits(limits)
+    if limits.describe():
+        log_message(f"🛡️ Ghostscript limits: {limits.describe()}")
+
+def estimate_job_memory(file_path):
+    # Rough peak memory of all gs processes one file starts; pdfwrite holds about twice the input
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return 0
+    processes = 1
+    shard_threshold = config.get("shard_threshold_mb", 200) * 1024 * 1024
+    if config.get("best_of", False):
+        processes = len(candidate_presets(resolve_quality(config.get("best_of_min_quality", "Low Quality")),
+                                          [resolve_quality(p) for p in config.get("best_of_presets", [])]))
+        per_process = GS_BASE_MEMORY + 2 * size
+    elif shard_threshold and size >= shard_threshold:
+        processes = config.get("shard_jobs", 0) or os.cpu_count() or 1
+        per_process = GS_BASE_MEMORY + 2 * size // processes
+    else:
+        per_process = GS_BASE_MEMORY + 2 * size
+    limit = config.get("gs_memory_limit_mb", 0) * 1024 * 1024
+    if limit:
+        per_process = min(per_process, limit)
+    return int(per_process * processes)
+
+def create_governor(slots=0):
+    return ResourceGovernor(int(config.get("memory_budget_mb", 0) * 1024 * 1024),
+                            config.get("throttle_load_per_cpu", 1.5),
+                            int(config.get("throttle_min_free_mb", 256) * 1024 * 1024),
+                            estimate=estimate_job_memory, log=log_message,
+                            on_throttle=lambda reason: metrics.inc("throttle_events_total", reason=reason),
+                            own_processes=count_gs_processes, slots=slots)
+
+def count_gs_processes():
+    pool = session_pool
+    return gs_processes.count() + (pool.busy_count() if pool is not None else 0)
+
+def gs_timeout(input_size):
+    # Wall-clock limit for one gs run, scaled by the input; None when disabled
+    base = config.get("gs_timeout_seconds", 300)
+    if not base:
+        return None
+    per_mb = config.get("gs_timeout_per_mb_seconds", 6)
+    return min(config.get("gs_timeout_max_seconds", 7200), base + per_mb * input_size / (1024 * 1024))
+
+def early_abort_limit(file_size):
+    # Output size at which a run is killed (its result could no longer be kept), or None
+    return file_size if config.get("early_abort", True) else None
+
+def run_gs_process(gs_command, input_size=0, output_limit=None):
+    result, cpu_time = run_process(gs_command, gs_processes, gs_timeout(input_size), gs_popen_kwargs(),
+                                   output_limit)
+    metrics.observe("gs_cpu_seconds", cpu_time)
+    return result
+
+def run_ghostscript(gs_executable, gs_quality, file_path, output_file, extra_args=(), output_limit=None):
+    gs_command = build_gs_command(gs_executable, gs_quality, file_path, output_file, extra_args)
+    # Merge passes list the shard files as extra inputs, so every existing file counts towards the timeout
+    input_size = sum(os.path.getsize(arg) for arg in (*extra_args, file_path) if os.path.isfile(arg))
+    result = run_gs_process(gs_command, input_size,
+                            (output_file, output_limit) if output_limit is not None else None)
+    if result.stdout:
+        log_message("Ghostscript stdout: " + result.stdout)
+    if result.stderr:
+        log_message("Ghostscript stderr: " + result.stderr)
+    return result
+
+def record_bytes(bytes_in, bytes_out):
+    metrics.inc("bytes_in_total", bytes_in)
+    metrics.inc("bytes_out_total", bytes_out)
+    metrics.inc("bytes_saved_total", bytes_in - bytes_out)
+
+# ----------------- Failure Backoff -----------------
+def failure_backoff(file_path):
+    # True while a previously failing file is quarantined or waiting out its backoff
+    failure = failures.get(file_path)
+    if failure is None:
+        return False
+    if failure["digest"] != get_fingerprint(file_path):
+        failures.clear(file_path)  # New content at the same path gets a fresh start
+        return False
+    return bool(failure["quarantined"]) or time.time() < failure["next_retry"]
+
+def is_settled(file_path):
+    # True once compress_pdf is finished with file_path: processed (compressed, skipped or reused)
+    # or quarantined. Anything else deserves another attempt later.
+    failure = failures.get(file_path)
+    if failure is not None:
+        return bool(failure["quarantined"])
+    try:
+        return processed_files.get(file_path) == os.path.getsize(file_path)
+    except OSError:
+        return False
+
+def classify_failure(error):
+    if isinstance(error, subprocess.TimeoutExpired):
+        return "timeout"
+    if isinstance(error, subprocess.CalledProcessError):
+        text = (error.stderr or "").lower()
+        if "password" in text or "encrypt" in text:
+            return "encrypted"
+        if "vmerror" in text or "out of memory" in text:
+            return "memory"  # Often the gs_memory_limit_mb limit rather than a broken file
+        if any(marker in text for marker in ("syntaxerror", "undefined", "unrecoverable", "rangecheck",
+                                             "ioerror", "no pages")):
+            return "corrupt"
+        return "ghostscript"
+    return type(error).__name__
+
+def record_failure(file_path, error, message):
+    try:
+        digest = get_fingerprint(file_path)
+    except OSError:
+        return None  # Gone (moved or deleted mid-run): nothing to back off from
+    max_attempts = config.get("failure_max_attempts", 5)
+    entry = failures.record(file_path, digest, classify_failure(error), message[-2000:],
+                            config.get("failure_backoff_seconds", 60),
+                            config.get("failure_backoff_max_seconds", 86400), max_attempts)
+    if entry["quarantined"]:
+        log_message(f"🚫 Quarantined after {entry['attempts']} failed attempts ({entry['error_class']}): {file_path}")
+    else:
+        delay = entry["next_retry"] - entry["last_attempt"]
+        delay_text = f"{delay:.0f}s" if delay < 120 else f"{delay / 60:.0f} min" if delay < 7200 else f"{delay / 3600:.0f} h"
+        log_message(f"⏳ Retrying {file_path} in {delay_text} "
+                    f"(attempt {entry['attempts']} of {max_attempts}, {entry['error_class']})")
+    return entry
+
+def release_quarantine(paths=None):
+    # Clears failure entries (all quarantined ones by default) and requeues the files when monitoring.
+    # The scan index forgets them too, so the next scan (in this or a later run) offers them again.
+    if paths is None:
+        paths = [entry["path"] for entry in failures.listing()]
+    released = [path for path in paths if failures.clear(path)]
+    index = watchers[0].index if watchers else ScanIndex()  # Watchers share one index
+    for path in released:
+        index.forget(path)
+    try:
+        index.save()
+    except OSError as e:
+        log_message(f"⚠️ Could not save scan index: {e}")
+    if scheduler is not None:
+        by_root = {watcher.root: watcher for watcher in watchers}
+        for path in released:
+            if not os.path.exists(path):
+                continue
+            watcher = by_root.get(owning_root(list(by_root), path))
+            if watcher is not None:
+                watcher.submit(path)  # With its root's quality
+            else:
+                scheduler.submit(path)
+    return released
+
+def remove_partial_output(file_path):
+    base, ext = os.path.splitext(file_path)
+    try:
+        os.remove(base + "_compressed" + ext)
+    except OSError:
+        pass
+
+def plan_sharding(gs_executable, file_path, file_size):
+    # Page ranges to compress in parallel, or None to run the file as one job
+    threshold_mb = config.get("shard_threshold_mb", 200)
+    if not threshold_mb or file_size < threshold_mb * 1024 * 1024:
+        return None
+    try:
+        blocker = structure_blocker(analyses.analyze(file_path))
+    except (OSError, ValueError):
+        return None
+    if blocker:
+        log_message(f"⏭️ Not splitting {file_path} into page ranges: {blocker}")
+        return None
+    runtime = get_ghostscript_runtime(log=log_message)
+    pages = count_pages(gs_executable, file_path, gs_processes, gs_timeout(file_size), runtime.supports_permit_paths,
+                        gs_popen_kwargs())
+    if not pages:
+        return None
+    shard_jobs = config.get("shard_jobs", 0) or os.cpu_count() or 1
+    ranges = plan_shards(pages, shard_jobs, config.get("shard_min_pages", 50))
+    return ranges if len(ranges) > 1 else None
+
+def run_preset(gs_executable, gs_quality, file_path, output_file, file_size, output_limit):
+    pool = session_pool
+    if pool is not None and pool.allows(file_path, output_file):
+        try:
+            output = pool.compress(gs_quality, file_path, output_file, gs_timeout(file_size), output_limit)
+            if output:
+                log_message("Ghostscript output: " + output)
+            return
+        except SessionError as e:
+            log_message(f"⚠️ Ghostscript session failed for {file_path}, retrying in a new process: {e}")
+            if os.path.exists(output_file):
+                os.remove(output_file)
+    run_ghostscript(gs_executable, gs_quality, file_path, output_file, output_limit=output_limit)
+
+def stopped_early(file_path, error, started):
+    # The run was killed once its output passed the original size: handled as "no reduction"
+    remove_partial_output(file_path)
+    metrics.inc("early_aborts_total")
+    log_message(f"✂️ Stopped Ghostscript after {time.monotonic() - started:.1f}s, output already larger than "
+                f"the original ({error.size / (1024 * 1024):.2f}MB): {file_path}")
+
+def compress_pdf(file_path, quality=None, governor=None):
+    # governor: the dispatching scheduler's, which page-range shards borrow idle worker slots from
+    runtime = get_ghostscript_runtime(log=log_message)
+    if runtime is None:
+        report_error("Error", "Ghostscript is not installed.")
+        log_message("❌ Ghostscript is not installed.")
+        metrics.inc("files_total", outcome="error")
+        return False
+    if not runtime.supports_device("pdfwrite"):
+        log_message(f"❌ Ghostscript {runtime.version} was built without the pdfwrite device.")
+        metrics.inc("files_total", outcome="error")
+        return False
+    gs_executable = runtime.executable
+    ensure_process_limits()
+    pages, images, predicted_time, predicted_model = cost_model.take_estimate(file_path)
+    if quality is None:
+        quality = config.get("quality", "Low Quality")
+    try:
+        file_size = os.path.getsize(file_path)
+        if processed_files.get(file_path) == file_size:
+            metrics.inc("files_total", outcome="unchanged")
+            return False
+        if failure_backoff(file_path):
+            metrics.inc("files_total", outcome="backing_off")
+            return False
+        base, ext = os.path.splitext(file_path)
+        output_file = base + "_compressed" + ext
+        gs_quality = resolve_quality(quality)
+        target_bytes = int(config.get("target_size_mb", 0) * 1024 * 1024)
+        if target_bytes and file_size <= target_bytes:
+            processed_files[file_path] = file_size
+            metrics.inc("files_total", outcome="under_target")
+            return False
+        best_of = config.get("best_of", False) and not target_bytes
+        # Results depend on the target (or best-of floor) as much as the preset, so those runs get their own key
+        if target_bytes:
+            result_key = f"{gs_quality}@{target_bytes}"
+        elif best_of:
+            result_key = "best@" + resolve_quality(config.get("best_of_min_quality", "Low Quality"))
+        else:
+            result_key = gs_quality
+        digest = None
+        if content_results is not None:
+            digest = get_fingerprint(file_path)
+            reused = reuse_content_result(file_path, file_size, digest, result_key, output_file)
+            if reused is not None:
+                metrics.inc("files_total", outcome="reused")
+                return reused
+        preflight = None
+        if config.get("preflight", True) and not target_bytes and not best_of:
+            preflight_started = time.monotonic()
+            preflight = run_preflight(file_path, file_size, gs_quality)
+            metrics.observe("preflight_seconds", time.monotonic() - preflight_started)
+            if preflight and preflight["verdict"] == "skip" and not preflight["audited"]:
+                record_preflight(file_path, gs_quality, preflight)
+                processed_files[file_path] = file_size
+                log_message(f"⏭️ Skipped ({preflight['reason']}, predicted savings "
+                            f"{preflight['predicted_ratio']:.0%}): {file_path}")
+                metrics.inc("files_total", outcome="skipped_preflight")
+                return False
+        started = time.monotonic()
+        ranges = None if target_bytes or best_of else plan_sharding(gs_executable, file_path, file_size)
+        # No single shard, merge or preset output may outgrow the whole input
+        output_limit = early_abort_limit(file_size)
+        no_reduction = "no_reduction"  # Run log outcome when nothing is saved
+        if target_bytes:
+            target = compress_to_target(
+                lambda extra_args, target_output: run_ghostscript(gs_executable, gs_quality, file_path,
+                                                                  target_output, extra_args),
+                file_path, target_bytes, config.get("target_max_passes", 5))
+            output_file, passes, mode = target["output"], target["passes"], "target"
+            if target["output"] and not target["fits"]:
+                log_message(f"⚠️ Could not reach {target_bytes / (1024 * 1024):.2f}MB in {passes} passes: {file_path}")
+        elif best_of:
+            presets = candidate_presets(resolve_quality(config.get("best_of_min_quality", "Low Quality")),
+                                        [resolve_quality(p) for p in config.get("best_of_presets", [])])
+            trial = run_best_of(lambda preset, trial_output: build_gs_command(gs_executable, preset, file_path,
+                                                                              trial_output),
+                                file_path, presets, gs_popen_kwargs(), gs_processes, gs_timeout(file_size))
+            if trial["preset"] is None and trial["failed"]:
+                raise subprocess.CalledProcessError(1, gs_executable, stderr="\n".join(trial["errors"].values()))
+            output_file, passes, mode = trial["output"], len(presets), "best_of"
+            gs_quality = trial["preset"] or gs_quality
+            log_message(f"🏆 Best of {', '.join(presets)}: {trial['preset'] or 'none smaller than the original'}"
+                        + (f" (stopped early: {', '.join(trial['cancelled'])})" if trial["cancelled"] else ""))
+        elif ranges:
+            # This job already holds one worker slot; the other ranges run in parallel only on idle ones
+            borrowed = governor.borrow_slots(len(ranges) - 1) if governor is not None else len(ranges) - 1
+            log_message(f"🧩 Splitting {file_path} into {len(ranges)} page ranges, {borrowed + 1} at a time")
+            passes, mode = len(ranges) + 1, "sharded"
+            try:
+                # The merge pass lists every shard as an input; extra_args go before the last one
+                compress_sharded(lambda extra_args, shard_output: run_ghostscript(gs_executable, gs_quality,
+                                                                                  file_path, shard_output,
+                                                                                  extra_args, output_limit),
+                                 lambda shard_files, merged: run_ghostscript(gs_executable, gs_quality,
+                                                                             shard_files[-1], merged,
+                                                                             shard_files[:-1], output_limit),
+                                 file_path, output_file, ranges, borrowed + 1)
+            except OutputTooLarge as e:
+                stopped_early(file_path, e, started)
+                output_file, no_reduction = None, "stopped_early"
+            finally:
+                if governor is not None:
+                    governor.return_slots(borrowed)
+        else:
+            passes, mode = 1, "preset"
+            try:
+                run_preset(gs_executable, gs_quality, file_path, output_file, file_size, output_limit)
+            except OutputTooLarge as e:
+                stopped_early(file_path, e, started)
+                output_file, no_reduction = None, "stopped_early"
+        wall_time = time.monotonic() - started
+        if pages is None and preflight is not None:
+            pages, images = preflight["pages"], preflight["images"]
+        features = {"pages": pages, "images": images, "predicted_time": predicted_time,
+                    "predicted_model": predicted_model}
+        metrics.observe("gs_wall_seconds", wall_time, mode=mode)
+        original_size = os.path.getsize(file_path) / (1024 * 1024)
+        new_size = os.path.getsize(output_file) / (1024 * 1024) if output_file else original_size
+        record_preflight(file_path, gs_quality, preflight,
+                         max(0.0, 1 - new_size / original_size) if original_size else 0.0)
+        if new_size < original_size:
+            if digest is not None:
+                content_results.record(digest, result_key, "compressed", file_size,
+                                       get_fingerprint(output_file), os.path.getsize(output_file), file_path)
+            os.replace(output_file, file_path)
+            log_message(f"✅ Compressed: {file_path} (New Size: {new_size:.2f}MB"
+                        + (f", {passes} passes)" if mode == "target" else ")"))
+            processed_files[file_path] = os.path.getsize(file_path)
+            run_log.record(file_path, mode, gs_quality, passes, file_size, processed_files[file_path],
+                           "compressed", wall_time, **features)
+            record_bytes(file_size, processed_files[file_path])
+            failures.clear(file_path)
+            metrics.inc("files_total", outcome="compressed")
+            return True
+        else:
+            if output_file and os.path.exists(output_file):
+                os.remove(output_file)
+            log_message(f"⚠️ No size reduction for: {file_path}")
+            if digest is not None:
+                content_results.record(digest, result_key, "no_reduction", file_size)
+            processed_files[file_path] = file_size
+            run_log.record(file_path, mode, gs_quality, passes, file_size, None, no_reduction, wall_time,
+                           **features)
+            record_bytes(file_size, file_size)
+            failures.clear(file_path)
+            metrics.inc("files_total", outcome="no_reduction")
+            return False
+    except GhostscriptCancelled:
+        remove_partial_output(file_path)
+        log_message(f"⏹️ Cancelled: {file_path}")
+        metrics.inc("files_total", outcome="cancelled")
+        return False
+    except subprocess.TimeoutExpired as e:
+        remove_partial_output(file_path)
+        limit = f"{e.timeout:.0f}s" if e.timeout is not None else "its time limit"
+        log_message(f"⏱️ Ghostscript timed out after {limit}: {file_path}")
+        record_failure(file_path, e, f"Timed out after {limit}")
+        metrics.inc("files_total", outcome="error")
+        return False
+    except subprocess.CalledProcessError as e:
+        remove_partial_output(file_path)
+        log_message(f"❌ Ghostscript error processing: {file_path} (Exit Code: {e.returncode})")
+        log_message("Ghostscript stderr: " + e.stderr)
+        entry = record_failure(file_path, e, e.stderr)
+        # One dialog when a file first fails and one when it is given up on, not one per retry
+        if entry is None or entry["attempts"] == 1 or entry["quarantined"]:
+            report_error("Error", "Ghostscript failed to compress the file.\n" + e.stderr)
+        metrics.inc("files_total", outcome="error")
+        return False
+    except Exception as e:
+        remove_partial_output(file_path)
+        log_message(f"❌ Error compressing {file_path}: {e}")
+        if not isinstance(e, FileNotFoundError):
+            record_failure(file_path, e, str(e))
+        metrics.inc("files_total", outcome="error")
+        return False
+
+# ----------------- Compression Scheduler -----------------
+def get_job_count():
+    jobs = config.get("jobs", 0)
+    if not jobs or jobs < 1:
+        jobs = os.cpu_count() or 1
+    return jobs
+
+def create_scheduler_policy(name=None, quality=None):
+    name = name or config.get("priority_policy", "newest")
+    if name == "longest":
+        cost_model.refit(run_log.training_rows())
+        return LongestFirst(cost_model, resolve_quality(quality or config.get("quality", "Low Quality")))
+    return create_policy(name, config.get("priority_folders", []))
+
+THROTTLE_RECHECK_SECONDS = 2
+
+class CompressionScheduler:
+    # Worker threads fed from a priority heap instead of a FIFO executor, so a file that was
+    # just dropped into the folder does not wait behind the whole backlog of a first scan
+    def __init__(self, jobs=None, policy=None, governor=None):
+        self.jobs = jobs or get_job_count()
+        self.policy = policy or create_scheduler_policy()
+        self.governor = governor or create_governor(self.jobs)
+        self.queue = []  # Heap of (priority key, sequence, path, quality, queued time, future)
+        self.sequence = itertools.count()
+        self.pending = set()  # Paths queued or running, so a rescan doesn't submit them twice
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.closed = False
+        self.workers = [threading.Thread(target=self._worker, name=f"gs-worker-{i}", daemon=True)
+                        for i in range(self.jobs)]
+        for worker in self.workers:
+            worker.start()
+        metrics.set_gauge("queue_pending", self.pending_count)
+        metrics.set_gauge("dispatch_paused", lambda: int(self.governor.is_paused()))
+        metrics.set_gauge("memory_reserved_bytes", lambda: self.governor.reserved)
+        if self.governor.describe():
+            log_message(f"🛡️ Dispatch limits: {self.governor.describe()}")
+    def submit(self, file_path, quality=None):
+        return self.submit_batch([file_path], quality)[0]
+    def submit_batch(self, file_paths, quality=None):
+        # Keys for the whole batch are computed before any of it is queued, so workers start on
+        # the best job of the batch rather than on whichever file happened to come first. Keys
+        # only stat the file; files already queued are not keyed again.
+        with self.lock:
+            pending = set(self.pending)
+        keyed = [(priority_key(self.policy, file_path) if file_path not in pending else None, file_path)
+                 for file_path in file_paths]
+        futures = []
+        with self.lock:
+            for key, file_path in keyed:
+                if self.closed or file_path in self.pending:
+                    if key is not None:
+                        cost_model.take_estimate(file_path)  # No compress_pdf call will collect it
+                    futures.append(None)
+                    continue
+                self.pending.add(file_path)
+                future = Future()
+                heapq.heappush(self.queue, (key, next(self.sequence), file_path, quality, time.monotonic(), future))
+                futures.append(future)
+            self.wakeup.notify_all()
+        return futures
+    def _worker(self):
+        while True:
+            with self.lock:
+                while True:
+                    while not self.queue and not self.closed:
+                        self.wakeup.wait()
+                    if not self.queue:
+                        return
+                    # The governor holds the next file back while the machine is busy or short of memory
+                    reserved = self.governor.try_reserve(self.queue[0][2])
+                    if reserved is not None:
+                        break
+                    self.wakeup.wait(THROTTLE_RECHECK_SECONDS)
+                _, _, file_path, quality, queued, future = heapq.heappop(self.queue)
+            try:
+                if future.set_running_or_notify_cancel():
+                    self._run(file_path, quality, queued, future)
+                else:
+                    cost_model.take_estimate(file_path)
+                    with self.lock:
+                        self.pending.discard(file_path)
+            finally:
+                self.governor.release(reserved)
+                with self.lock:
+                    self.wakeup.notify_all()  # Freed budget may let a held-back file start
+    def _run(self, file_path, quality, queued, future):
+        metrics.observe("queue_wait_seconds", time.monotonic() - queued)
+        try:
+            future.set_result(compress_pdf(file_path, quality, self.governor))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                self.pending.discard(file_path)
+    def pending_count(self):
+        with self.lock:
+            return len(self.pending)
+    def shutdown(self, wait=False, cancel_running=False):
+        # Queued files are cancelled; running ones finish, or have their gs killed with cancel_running
+        with self.lock:
+            self.closed = True
+            queued, self.queue = self.queue, []
+            self.wakeup.notify_all()
+        for _, _, file_path, _, _, future in queued:
+            future.cancel()
+            cost_model.take_estimate(file_path)
+        if cancel_running:
+            gs_processes.cancel_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+        with self.lock:
+            self.pending.clear()
+
+def create_session_pool(folders, size):
+    if config.get("engine", "process") != "session":
+        return None
+    runtime = get_ghostscript_runtime(log=log_message)
+    if runtime and runtime.supports_permit_paths:
+        return SessionPool(runtime.executable, folders, size, log=log_message)
+    if runtime:
+        log_message(f"⚠️ Ghostscript {runtime.version} is too old for session mode, using one process per file.")
+    return None
+
+# ----------------- Metrics Export -----------------
+def start_metrics():
+    global metrics_exporter
+    if metrics_exporter is not None:
+        return
+    if not config.get("metrics_file") and not config.get("metrics_port"):
+        return
+    metrics_exporter = MetricsExporter(metrics, config.get("metrics_file", ""), config.get("metrics_port", 0),
+                                       config.get("metrics_interval", 15), log=log_message)
+    metrics_exporter.start()
+
+def stop_metrics():
+    global metrics_exporter
+    if metrics_exporter is not None:
+        metrics_exporter.stop()
+        metrics_exporter = None
+
+# ----------------- Deferred Work -----------------
+DEFER_CHECK_SECONDS = 30
+
+def describe_duration(seconds):
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+def predict_seconds(file_path, size, quality):
+    try:
+        info = analyses.analyze(file_path)
+        pages, images = info["pages"], info["images"]
+    except (OSError, ValueError):
+        pages, images = None, None
+    return cost_model.predict(size, pages, images, resolve_quality(quality))
+
+class DeferredDrain:
+    # Puts large watched files aside (in the persistent `deferred` store) and feeds them to the
+    # scheduler while a batch window is open or the machine is idle, at most one per worker so
+    # small files keep flowing alongside them
+    def __init__(self, scheduler, stop_event):
+        self.scheduler = scheduler
+        self.stop_event = stop_event
+        self.threshold = int(config.get("defer_threshold_mb", 0) * 1024 * 1024)
+        self.windows = parse_windows(config.get("batch_windows", []), log=log_message)
+        self.idle = IdleMonitor(config.get("idle_seconds", 300), config.get("idle_cpu_percent", 25)) \
+            if config.get("idle_drain", True) else None
+        self.running = {}  # path -> future of deferred files handed to the scheduler
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.reason = None  # Why deferred files are being compressed right now, or None
+        metrics.set_gauge("deferred_files", lambda: deferred.summary()[0])
+        metrics.set_gauge("deferred_work_seconds", lambda: deferred.summary()[2])
+        if self.threshold and not self.windows and self.idle is None:
+            log_message("⚠️ Large files are deferred, but there are no batch windows and idle_drain is off.")
+
+    def describe(self):
+        parts = [f"files over {self.threshold / (1024 * 1024):g}MB"]
+        if self.windows:
+            parts.append("batch windows " + ", ".join(config.get("batch_windows", [])))
+        if self.idle is not None:
+            parts.append(f"when idle for {describe_duration(self.idle.idle_seconds)}")
+        return "; ".join(parts)
+
+    def defer(self, file_path, quality):
+        # True when file_path was put aside to be compressed later
+        if not self.threshold or self.reason is not None:
+            return False
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return False
+        if size < self.threshold or processed_files.get(file_path) == size:
+            return False
+        with self.lock:
+            if file_path in self.running:
+                return True
+        known = file_path in deferred
+        deferred.add(file_path, quality, size, predict_seconds(file_path, size, quality))
+        if not known:
+            metrics.inc("deferred_total")
+            log_message(f"🌙 Deferred ({size / (1024 * 1024):.1f}MB) until {self.next_start()}: {file_path}")
+        return True
+
+    def next_start(self):
+        opening = next_opening(self.windows)
+        if opening is not None:
+            return opening.strftime("%a %H:%M") + (" or idle time" if self.idle is not None else "")
+        return "the machine is idle" if self.idle is not None else "a batch window is configured"
+
+    def _current_reason(self):
+        if not self.threshold:
+            return "disabled"  # Deferral was switched off: drain what is left from before
+        if window_open(self.windows):
+            return "window"
+        # Once draining for idleness, the CPU is busy with our own jobs; only input ends it
+        if self.idle is not None and self.idle.is_idle(own_work_running=self.reason == "idle"):
+            return "idle"
+        return None
+
+    def check(self):
+        reason, previous = self._current_reason(), self.reason
+        self.reason = reason
+        count = deferred.summary()[0]
+        if reason != previous and count:
+            if reason is not None:
+                label = {"window": "Batch window open", "idle": "Machine idle"}.get(reason, "Deferral off")
+                log_message(f"🌙 {label}: compressing {describe_deferred()}")
+            else:
+                log_message(f"⏸️ Pausing deferred files until {self.next_start()}, {count} left.")
+        if reason is not None:
+            self._top_up()
+
+    def _top_up(self):
+        with self.lock:
+            slots = self.scheduler.jobs - len(self.running)
+        for entry in deferred.listing():
+            if slots <= 0 or self.stop_event.is_set():
+                return
+            file_path = entry["path"]
+            with self.lock:
+                if file_path in self.running:
+                    continue
+            if not os.path.exists(file_path):
+                deferred.remove(file_path)
+                continue
+            failure = failures.get(file_path)
+            if failure is not None and time.time() < failure["next_retry"]:
+                continue  # Backing off; quarantined files have already left the store
+            future = self.scheduler.submit(file_path, entry["quality"])
+            if future is None:
+                continue  # Already queued through its watcher
+            with self.lock:
+                self.running[file_path] = future
+            future.add_done_callback(lambda f, file_path=file_path: self._on_done(file_path, f))
+            slots -= 1
+
+    def _on_done(self, file_path, future):
+        # Cancelled jobs (monitoring stopped) and failed ones stay deferred for another attempt
+        with self.lock:
+            self.running.pop(file_path, None)
+        if not future.cancelled() and (is_settled(file_path) or not os.path.exists(file_path)):
+            deferred.remove(file_path)
+        self.wakeup.set()
+
+    def stop(self):
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.check()
+            self.wakeup.wait(DEFER_CHECK_SECONDS)
+            self.wakeup.clear()
+
+def deferred_status():
+    # Deferred work for front ends; also answers when monitoring is off
+    count, size, seconds = deferred.summary()
+    jobs = scheduler.jobs if scheduler else get_job_count()
+    drain = deferred_drain
+    status = {"files": count, "bytes": size, "work_seconds": seconds / max(1, min(jobs, count)),
+              "draining": drain.reason if drain else None, "next_window": None}
+    if not status["draining"]:
+        status["next_window"] = next_opening(parse_windows(config.get("batch_windows", [])))
+    return status
+
+def describe_deferred():
+    status = deferred_status()
+    if not status["files"]:
+        return "No deferred files"
+    text = (f"{status['files']} deferred file(s), {status['bytes'] / (1024 * 1024):.0f}MB, "
+            f"~{describe_duration(status['work_seconds'])} of work")
+    if status["draining"]:
+        return text + ", running now"
+    if status["next_window"] is not None:
+        wait_seconds = (status["next_window"] - datetime.datetime.now()).total_seconds()
+        return text + (f", done in ~{describe_duration(wait_seconds + status['work_seconds'])} "
+                       f"(window opens {status['next_window'].strftime('%a %H:%M')})")
+    if config.get("idle_drain", True):
+        return text + ", waiting for idle time"
+    return text
+
+# ----------------- Folder Monitoring -----------------
+def configured_roots(folders=None):
+    entries = folders or config.get("watch_roots") or \
+        ([config["default_folder"]] if config.get("default_folder") else [])
+    defaults = {"include": config.get("scan_include", []), "exclude": config.get("scan_exclude", DEFAULT_EXCLUDE),
+                "min_size_kb": config.get("min_file_size_kb", 0), "max_size_mb": config.get("max_file_size_mb", 0),
+                "max_depth": config.get("max_depth")}
+    return parse_roots(entries, list(QUALITY_PRESETS) + list(QUALITY_PRESETS.values()), defaults, log=log_message)
+
+def start_monitoring(folders=None, quality=None):
+    # folders: explicit folders sharing `quality`; None watches the configured roots with their own profiles
+    global monitoring_threads, watchers, monitor_stop_event, scheduler, session_pool, deferred_drain
+    if is_monitoring():
+        return
+    if isinstance(folders, str):
+        folders = [folders]
+    roots = configured_roots(folders)
+    if not roots:
+        log_message("⚠️ No folder to monitor.")
+        return
+    monitor_stop_event = threading.Event()
+    policy = create_scheduler_policy()
+    if any(root.priority for root in roots):
+        policy = RootPriority([(root.folder, root.priority) for root in roots], policy)
+    scheduler = CompressionScheduler(policy=policy)
+    session_pool = create_session_pool([root.folder for root in roots], scheduler.jobs)
+    index = ScanIndex()  # Shared: every root is listed in the same index file
+    deferred_drain = None
+    if config.get("defer_threshold_mb", 0) or deferred.summary()[0]:
+        cost_model.refit(run_log.training_rows())  # For the predicted work of deferred files
+        deferred_drain = DeferredDrain(scheduler, monitor_stop_event)
+    watchers = [Watcher(root, monitor_stop_event, scheduler, index, quality, deferred_drain) for root in roots]
+    monitoring_threads = []
+    for watcher in watchers:
+        thread = threading.Thread(target=watcher.run, daemon=True)
+        thread.start()
+        monitoring_threads.append(thread)
+        log_message(f"🔄 Monitoring started for: {watcher.root.describe()}")
+    log_message(f"⚙️ {scheduler.jobs} parallel jobs shared by {len(roots)} folder(s)")
+    if deferred_drain is not None:
+        if deferred_drain.threshold:
+            log_message(f"🌙 Deferring {deferred_drain.describe()}")
+        threading.Thread(target=deferred_drain.run, name="deferred-drain", daemon=True).start()
+
+def stop_monitoring(wait=False):
+    global monitoring_threads, watchers, monitor_stop_event, scheduler, session_pool, deferred_drain
+    if monitor_stop_event:
+        monitor_stop_event.set()
+    if deferred_drain:
+        deferred_drain.stop()
+    if session_pool:
+        session_pool.close()  # Kills sessions that are mid-file
+    if scheduler:
+        scheduler.shutdown(wait=wait, cancel_running=True)
+    for watcher in watchers:
+        watcher.cancel_retries()
+    for thread in monitoring_threads:
+        thread.join(timeout=2)
+    monitoring_threads = []
+    watchers = []
+    monitor_stop_event = None
+    scheduler = None
+    session_pool = None
+    deferred_drain = None
+
+def is_monitoring():
+    return any(thread.is_alive() for thread in monitoring_threads)
+
+RETRY_MARGIN_SECONDS = 0.5  # Resubmit slightly after next_retry, so the backoff has surely run out
+
+class Watcher:
+    def __init__(self, root, stop_event, scheduler, index, quality=None, drain=None):
+        self.root = root
+        self.stop_event = stop_event
+        self.scheduler = scheduler
+        self.drain = drain  # DeferredDrain for large files, or None
+        self.quality = quality  # Used when the root has no quality of its own; None follows config["quality"]
+        self.index = index
+        self.lock = threading.Lock()
+        self.retries = {}  # path -> Timer resubmitting a failed file when its backoff runs out
+        self.skipped = {}  # (kind, reason) -> count, for the summary after the first scan
+        self.scans = 0
+        self.filter = root.make_filter(on_skip=self.on_skip)
+        self.gate = SettlingGate(self.submit, stop_event, window=config.get("settle_seconds", 5), log=log_message)
+        self.backend = create_backend(root.folder, stop_event, self.offer,
+                                      mode=config.get("watch_backend", "auto"),
+                                      poll_interval=config.get("poll_interval", 10),
+                                      index=self.index,
+                                      full_rescan_interval=config.get("full_rescan_interval", 3600),
+                                      log=log_message,
+                                      on_scan=self.on_scan,
+                                      scan_filter=self.filter)
+    def offer(self, file_path):
+        # Scans only report files the filter accepts; file events are checked here
+        if self.filter.accepts(file_path):
+            self.gate.offer(file_path)
+    def on_skip(self, kind, reason, size):
+        if kind == "dir":
+            metrics.inc("scan_dirs_total", result="pruned")
+        else:
+            metrics.inc("files_filtered_total", reason=reason)
+            if size is not None:
+                metrics.inc("bytes_filtered_total", size)
+        self.skipped[kind, reason] = self.skipped.get((kind, reason), 0) + 1
+    def on_scan(self, seconds, stats):
+        metrics.observe("scan_seconds", seconds)
+        if stats:
+            metrics.inc("scan_dirs_total", stats["dirs_listed"], result="listed")
+            metrics.inc("scan_dirs_total", stats["dirs_skipped"], result="unchanged")
+        self.scans += 1
+        if self.scans == 1 and self.skipped:
+            dirs = sum(count for (kind, _), count in self.skipped.items() if kind == "dir")
+            files = ", ".join(f"{count} {reason.replace('_', ' ')}" for (kind, reason), count
+                              in sorted(self.skipped.items()) if kind == "file")
+            log_message(f"🧹 {self.root.folder}: skipped {dirs} folder(s)" + (f" and PDFs: {files}" if files else ""))
+    def submit(self, file_path):
+        quality = self.root.quality or self.quality or config.get("quality", "Low Quality")
+        if self.drain is not None and self.drain.defer(file_path, quality):
+            self.index.mark_done(file_path)  # The deferred store remembers it from here on
+            return
+        future = self.scheduler.submit(file_path, quality)
+        if future is not None:
+            future.add_done_callback(lambda f: self._on_done(file_path, f))
+    def _on_done(self, file_path, future):
+        # Cancelled jobs (monitoring stopped) stay out of the index so they are picked up next time;
+        # failed ones stay out too, and are resubmitted once their backoff runs out
+        if future.cancelled():
+            return
+        if is_settled(file_path):
+            self.index.mark_done(file_path)
+            return
+        self.index.forget(file_path)
+        failure = failures.get(file_path)
+        if failure is not None:
+            self.schedule_retry(file_path, failure["next_retry"])
+    def schedule_retry(self, file_path, when):
+        timer = threading.Timer(max(0.0, when - time.time()) + RETRY_MARGIN_SECONDS, self._retry, (file_path,))
+        timer.daemon = True
+        with self.lock:
+            previous = self.retries.pop(file_path, None)
+            self.retries[file_path] = timer
+        if previous is not None:
+            previous.cancel()
+        timer.start()
+    def _retry(self, file_path):
+        with self.lock:
+            self.retries.pop(file_path, None)
+        if not self.stop_event.is_set() and os.path.exists(file_path):
+            self.submit(file_path)
+    def cancel_retries(self):
+        with self.lock:
+            timers, self.retries = list(self.retries.values()), {}
+        for timer in timers:
+            timer.cancel()
+    def run(self):
+        log_message(f"👀 Watching {self.root.folder} with {self.backend.name} backend.")
+        threading.Thread(target=self.gate.run, daemon=True).start()
+        self.backend.run()
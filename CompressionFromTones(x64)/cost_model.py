@@ -0,0 +1,127 @@
+import threading
+
+# Runtime estimate for one Ghostscript rewrite from features the preflight scan already
+# extracts cheaply: seconds ~ w0 + w1 * MB + w2 * pages + w3 * images.
+# Files that have not been scanned yet get a separate size-only model (seconds ~ w0 + w1 * MB)
+# rather than the full one with zero pages and images, which would underestimate them.
+# The weights start from a rough prior and are refit (ridge regression towards the prior)
+# from the run log, per preset when there is enough history for it.
+
+PRIOR_WEIGHTS = {"full": (0.3, 0.08, 0.03, 0.05), "size": (0.3, 0.15)}
+RIDGE = 5.0  # How strongly a small history is pulled towards the prior
+MIN_ROWS = 20  # Fewer runs than this for a preset: use the pooled fit
+MIN_SECONDS = 0.05
+
+def model_for(pages):
+    # Which model predicts a file: "full" once its page and image counts are known
+    return "full" if pages is not None else "size"
+
+def feature_vector(input_size, pages, images, model="full"):
+    if model == "size":
+        return (1.0, input_size / (1024 * 1024))
+    return (1.0, input_size / (1024 * 1024), float(pages or 0), float(images or 0))
+
+def _solve(matrix, vector):
+    # Gaussian elimination with partial pivoting; the systems here are at most 4x4
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(n):
+            if r != col:
+                factor = rows[r][col] / rows[col][col]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+    return tuple(rows[i][n] / rows[i][i] for i in range(n))
+
+def fit_weights(samples, prior=PRIOR_WEIGHTS["full"], ridge=RIDGE):
+    # samples: [(feature vector, seconds)]; minimises |Xw - y|^2 + ridge * |w - prior|^2
+    n = len(prior)
+    xtx = [[ridge if i == j else 0.0 for j in range(n)] for i in range(n)]
+    xty = [ridge * p for p in prior]
+    for x, y in samples:
+        for i in range(n):
+            xty[i] += x[i] * y
+            for j in range(n):
+                xtx[i][j] += x[i] * x[j]
+    return _solve(xtx, xty) or prior
+
+class CostModel:
+    def __init__(self, analyses=None):
+        self.analyses = analyses  # preflight.AnalysisCache with page/image counts of scanned files
+        self.lock = threading.Lock()
+        self.weights = {(model, None): prior for model, prior in PRIOR_WEIGHTS.items()}  # (model, preset or None)
+        self.trained_on = 0
+        self.estimates = {}  # path -> (pages, images, predicted seconds, model) for the run log
+
+    def refit(self, rows):
+        # rows: (preset, input_size, pages, images, wall_time) from RunLogStore.training_rows.
+        # The size-only model learns from every row, the full one from rows with page/image counts.
+        weights = {}
+        for model, prior in PRIOR_WEIGHTS.items():
+            by_preset = {}
+            pooled = []
+            for preset, input_size, pages, images, wall_time in rows:
+                if model == "full" and pages is None:
+                    continue
+                sample = (feature_vector(input_size, pages, images, model), wall_time)
+                pooled.append(sample)
+                by_preset.setdefault(preset, []).append(sample)
+            weights[model, None] = fit_weights(pooled, prior)
+            for preset, samples in by_preset.items():
+                if len(samples) >= MIN_ROWS:
+                    weights[model, preset] = fit_weights(samples, prior=weights[model, None])
+        with self.lock:
+            self.weights = weights
+            self.trained_on = len(rows)
+
+    def predict(self, input_size, pages, images, preset=None):
+        model = model_for(pages)
+        with self.lock:
+            weights = self.weights.get((model, preset)) or self.weights[model, None]
+        x = feature_vector(input_size, pages, images, model)
+        return max(MIN_SECONDS, sum(w * v for w, v in zip(weights, x)))
+
+    def estimate(self, path, st, preset=None):
+        # Seconds expected for `path`; remembered so the run log can store it next to the actual time.
+        # Only cheap features: the size, plus page/image counts if the file was already scanned.
+        # Reading every file here would stall a large batch before its first job starts.
+        if st is None:
+            return MIN_SECONDS
+        info = self.analyses.lookup(path, st) if self.analyses is not None else None
+        pages, images = (info["pages"], info["images"]) if info else (None, None)
+        seconds = self.predict(st.st_size, pages, images, preset)
+        with self.lock:
+            self.estimates[path] = (pages, images, seconds, model_for(pages))
+        return seconds
+
+    def take_estimate(self, path):
+        with self.lock:
+            return self.estimates.pop(path, (None, None, None, None))
+
+def accuracy(pairs):
+    # pairs: [(predicted or None, actual)] -> median and mean absolute percentage error
+    errors = sorted(abs(p - a) / a for p, a in pairs if p is not None and a and a > 0)
+    if not errors:
+        return None
+    return {"runs": len(errors), "median_error": errors[len(errors) // 2],
+            "mean_error": sum(errors) / len(errors)}
+
+def accuracy_by_model(rows):
+    # rows: [(predicted or None, actual, model or None)] -> {model: accuracy()}, models without predictions left out
+    by_model = {}
+    for predicted, actual, model in rows:
+        by_model.setdefault(model or "full", []).append((predicted, actual))  # Older rows predate the size model
+    return {model: error for model, error in ((m, accuracy(pairs)) for m, pairs in by_model.items()) if error}
+
+class LongestFirst:
+    # Priority policy: biggest predicted job first, so a monster file starts early instead of
+    # running alone at the end of a batch while the other workers sit idle
+    def __init__(self, model, preset=None):
+        self.model = model
+        self.preset = preset
+
+    def __call__(self, path, st):
+        return (-self.model.estimate(path, st, self.preset),)
@@ -0,0 +1,205 @@
+import os
+import sys
+import ctypes
+import ctypes.util
+import datetime
+import subprocess
+
+# When deferred (large) files may be compressed: inside configured batch windows, or while the
+# machine is idle (no keyboard/mouse input for a while and little CPU use).
+#
+# Window syntax: "22:00-06:00" (every day), "Sat,Sun" (whole days), "Mon-Fri 18:30-07:00".
+# A window that ends before it starts runs past midnight and belongs to the day it starts on.
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# ----------------- Batch Windows -----------------
+def _parse_days(spec):
+    days = set()
+    for item in spec.lower().split(","):
+        item = item.strip()[:3] if "-" not in item else item.strip()
+        if "-" in item:
+            first, last = (DAYS.index(part.strip()[:3]) for part in item.split("-", 1))
+            day = first
+            days.add(day)
+            while day != last:
+                day = (day + 1) % 7
+                days.add(day)
+        else:
+            days.add(DAYS.index(item))
+    return days
+
+def _parse_time(text):
+    hours, minutes = text.strip().split(":")
+    value = int(hours) * 60 + int(minutes)
+    if not 0 <= value <= 24 * 60:
+        raise ValueError(text)
+    return value
+
+def parse_window(text):
+    # -> (days, start minute, end minute); raises ValueError on anything it does not understand
+    parts = text.split()
+    if not parts or len(parts) > 2:
+        raise ValueError(text)
+    days = set(range(7))
+    if len(parts) == 2 or ":" not in parts[0]:
+        try:
+            days = _parse_days(parts[0])
+        except (ValueError, IndexError):
+            raise ValueError(text)
+        parts = parts[1:]
+    if not parts:
+        return days, 0, 24 * 60
+    start, end = (_parse_time(value) for value in parts[0].split("-", 1))
+    return days, start, end
+
+def parse_windows(texts, log=None):
+    windows = []
+    for text in texts:
+        try:
+            windows.append(parse_window(text))
+        except ValueError:
+            if log:
+                log(f"⚠️ Ignoring batch window {text!r}: expected e.g. \"22:00-06:00\" or \"Sat,Sun\"")
+    return windows
+
+def in_window(window, now):
+    days, start, end = window
+    minute = now.hour * 60 + now.minute
+    if start < end:
+        return now.weekday() in days and start <= minute < end
+    # Past midnight: the late part belongs to today, the early part to yesterday's window
+    if minute >= start:
+        return now.weekday() in days
+    return minute < end and (now.weekday() - 1) % 7 in days
+
+def window_open(windows, now=None):
+    now = now or datetime.datetime.now()
+    return any(in_window(window, now) for window in windows)
+
+def next_opening(windows, now=None):
+    # Start of the next window after now, or None without windows
+    now = now or datetime.datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    openings = []
+    for days, start, _ in windows:
+        for offset in range(8):
+            candidate = midnight + datetime.timedelta(days=offset, minutes=start)
+            if candidate > now and candidate.weekday() in days:
+                openings.append(candidate)
+                break
+    return min(openings, default=None)
+
+# ----------------- Idle Detection -----------------
+class _LastInputInfo(ctypes.Structure):
+    _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+class _XScreenSaverInfo(ctypes.Structure):
+    _fields_ = [("window", ctypes.c_ulong), ("state", ctypes.c_int), ("kind", ctypes.c_int),
+                ("til_or_since", ctypes.c_ulong), ("idle", ctypes.c_ulong), ("eventMask", ctypes.c_ulong)]
+
+class _X11Idle:
+    # XScreenSaver extension; only works inside an X session (not Wayland, not headless)
+    def __init__(self):
+        self.display = None
+        if not os.environ.get("DISPLAY"):
+            return
+        xlib_path, xss_path = ctypes.util.find_library("X11"), ctypes.util.find_library("Xss")
+        if not xlib_path or not xss_path:
+            return
+        try:
+            self.xlib, self.xss = ctypes.CDLL(xlib_path), ctypes.CDLL(xss_path)
+        except OSError:
+            return
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self.xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        self.xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(_XScreenSaverInfo)
+        self.xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                                   ctypes.POINTER(_XScreenSaverInfo)]
+        self.display = self.xlib.XOpenDisplay(None)
+        if self.display:
+            self.info = self.xss.XScreenSaverAllocInfo()
+
+    def idle_seconds(self):
+        if not self.display:
+            return None
+        if not self.xss.XScreenSaverQueryInfo(self.display, self.xlib.XDefaultRootWindow(self.display), self.info):
+            return None
+        return self.info.contents.idle / 1000
+
+def _windows_idle_seconds():
+    info = _LastInputInfo()
+    info.cbSize = ctypes.sizeof(_LastInputInfo)
+    if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+        return None
+    return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+def _mac_idle_seconds():
+    try:
+        output = subprocess.run(["ioreg", "-c", "IOHIDSystem", "-d", "4"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    for line in output.splitlines():
+        if "HIDIdleTime" in line:
+            try:
+                return int(line.split("=")[-1]) / 1e9
+            except ValueError:
+                return None
+    return None
+
+class _FileTime(ctypes.Structure):
+    _fields_ = [("low", ctypes.c_uint32), ("high", ctypes.c_uint32)]
+
+def _cpu_times():
+    # (busy, total) CPU time counters since boot, in arbitrary units, or None
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/stat") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+        return sum(values) - idle, sum(values)
+    if sys.platform.startswith("win"):
+        idle, kernel, user = _FileTime(), _FileTime(), _FileTime()
+        if not ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        idle, kernel, user = ((t.high << 32) | t.low for t in (idle, kernel, user))
+        return kernel + user - idle, kernel + user  # Kernel time includes idle time
+    return None
+
+class IdleMonitor:
+    def __init__(self, idle_seconds=300, cpu_percent=25):
+        self.idle_seconds = idle_seconds
+        self.cpu_percent = cpu_percent
+        self.last_cpu = _cpu_times()
+        self.x11 = _X11Idle() if sys.platform.startswith("linux") else None
+
+    def input_idle_seconds(self):
+        if sys.platform.startswith("win"):
+            return _windows_idle_seconds()
+        if sys.platform == "darwin":
+            return _mac_idle_seconds()
+        return self.x11.idle_seconds() if self.x11 else None
+
+    def cpu_busy_percent(self):
+        # Average over the time since the previous call
+        current = _cpu_times()
+        previous, self.last_cpu = self.last_cpu, current
+        if current is None or previous is None or current[1] <= previous[1]:
+            return None
+        return 100 * (current[0] - previous[0]) / (current[1] - previous[1])
+
+    def is_idle(self, own_work_running=False):
+        # Idle when nobody has touched the machine for idle_seconds and the CPU is quiet. Once our
+        # own jobs run, the CPU reading is theirs, so only input activity ends an idle period.
+        # Without any usable signal the machine never counts as idle.
+        input_idle = self.input_idle_seconds()
+        cpu = self.cpu_busy_percent()
+        if input_idle is not None and input_idle < self.idle_seconds:
+            return False
+        if not own_work_running and cpu is not None and cpu > self.cpu_percent:
+            return False
+        return input_idle is not None or cpu is not None
@@ -0,0 +1,26 @@
+import os
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+SAMPLE_CHUNKS = 16
+SAMPLED_PREFIX = "s:"
+
+def file_digest(file_path, sample_threshold=None):
+    # blake2b over the whole file, or over size + evenly spaced 1 MB chunks for files larger
+    # than sample_threshold bytes. Sampled digests carry a prefix so callers can tell them apart.
+    size = os.path.getsize(file_path)
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        if sample_threshold and size > sample_threshold:
+            h.update(str(size).encode())
+            step = (size - CHUNK_SIZE) // (SAMPLE_CHUNKS - 1)
+            for i in range(SAMPLE_CHUNKS):
+                f.seek(i * step)
+                h.update(f.read(CHUNK_SIZE))
+            return SAMPLED_PREFIX + h.hexdigest()
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def is_sampled(digest):
+    return digest.startswith(SAMPLED_PREFIX)
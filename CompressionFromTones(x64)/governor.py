@@ -0,0 +1,272 @@
+import os
+import sys
+import math
+import time
+import ctypes
+import platform
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+# Resource controls for Ghostscript. ProcessLimits lowers the CPU/IO priority and caps the address
+# space of every gs process right after it is spawned; ResourceGovernor holds queued files back
+# while the machine is overloaded or short of memory, while the memory budget for concurrent
+# jobs is used up, or while a running job has borrowed idle worker slots for extra gs processes.
+
+IO_PRIORITIES = {"normal": None, "low": (2, 7), "idle": (3, 0)}  # ioprio (class, level) on Linux
+_IOPRIO_SET = {"x86_64": 251, "amd64": 251, "aarch64": 30, "arm64": 30, "i386": 289, "i686": 289,
+               "armv7l": 314}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+STATS_MAX_AGE = 1.0  # Seconds a load/memory reading is reused
+LOAD_AVERAGE_SECONDS = 60.0  # Time constant of the 1-minute load average
+
+def _ignore(*args):
+    pass
+
+# ----------------- System Readings -----------------
+def load_per_cpu():
+    # 1-minute load average per core, or None where there is none (Windows)
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+class _MemoryStatus(ctypes.Structure):
+    _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+def available_memory():
+    # Bytes of memory available without swapping, or None when it cannot be read
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+    if sys.platform.startswith("win"):
+        status = _MemoryStatus()
+        status.dwLength = ctypes.sizeof(_MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+    return None
+
+# ----------------- Per-Process Limits -----------------
+class _BasicLimits(ctypes.Structure):
+    _fields_ = [("PerProcessUserTimeLimit", ctypes.c_int64), ("PerJobUserTimeLimit", ctypes.c_int64),
+                ("LimitFlags", ctypes.c_uint32), ("MinimumWorkingSetSize", ctypes.c_size_t),
+                ("MaximumWorkingSetSize", ctypes.c_size_t), ("ActiveProcessLimit", ctypes.c_uint32),
+                ("Affinity", ctypes.c_size_t), ("PriorityClass", ctypes.c_uint32),
+                ("SchedulingClass", ctypes.c_uint32)]
+
+class _ExtendedLimits(ctypes.Structure):
+    _fields_ = [("BasicLimitInformation", _BasicLimits), ("IoInfo", ctypes.c_uint64 * 6),
+                ("ProcessMemoryLimit", ctypes.c_size_t), ("JobMemoryLimit", ctypes.c_size_t),
+                ("PeakProcessMemoryUsed", ctypes.c_size_t), ("PeakJobMemoryUsed", ctypes.c_size_t)]
+
+_JOB_OBJECT_EXTENDED_LIMIT_INFORMATION = 9
+_JOB_OBJECT_LIMIT_PROCESS_MEMORY = 0x100
+_BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+_IDLE_PRIORITY_CLASS = 0x40
+
+class ProcessLimits:
+    def __init__(self, nice=0, io_priority="normal", memory_limit=0, log=None):
+        self.nice = nice  # 0-19, as for nice(1); Windows maps it to a priority class
+        self.io_priority = io_priority if io_priority in IO_PRIORITIES else "normal"
+        self.memory_limit = memory_limit  # Bytes of address space per gs process (0 = none)
+        self.log = log or _ignore
+        self.warned = set()
+        self.libc = None
+
+    def _warn_once(self, key, message):
+        if key not in self.warned:
+            self.warned.add(key)
+            self.log(message)
+
+    def popen_kwargs(self, popen_kwargs):
+        # Windows takes the priority class at creation; POSIX limits are applied in apply()
+        if sys.platform.startswith("win") and self.nice > 0:
+            popen_kwargs = dict(popen_kwargs)
+            priority = _IDLE_PRIORITY_CLASS if self.nice >= 15 else _BELOW_NORMAL_PRIORITY_CLASS
+            popen_kwargs["creationflags"] = popen_kwargs.get("creationflags", 0) | priority
+        return popen_kwargs
+
+    def apply(self, process):
+        # Called right after spawning: gs has barely started, and nothing here may stop it running
+        if sys.platform.startswith("win"):
+            if self.memory_limit:
+                self._windows_memory_limit(process)
+            return
+        if self.nice > 0:
+            try:
+                os.setpriority(os.PRIO_PROCESS, process.pid, self.nice)
+            except OSError as e:
+                self._warn_once("nice", f"⚠️ Could not lower Ghostscript CPU priority: {e}")
+        if IO_PRIORITIES[self.io_priority] is not None:
+            self._linux_io_priority(process.pid)
+        if self.memory_limit:
+            if resource is not None and hasattr(resource, "prlimit"):
+                try:
+                    resource.prlimit(process.pid, resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+                except (OSError, ValueError) as e:
+                    self._warn_once("memory", f"⚠️ Could not limit Ghostscript memory: {e}")
+            else:
+                self._warn_once("memory", "⚠️ Per-process memory limits are not supported on this platform.")
+
+    def _linux_io_priority(self, pid):
+        number = _IOPRIO_SET.get(platform.machine().lower())
+        if not sys.platform.startswith("linux") or number is None:
+            self._warn_once("io", "⚠️ I/O priority is only supported on Linux.")
+            return
+        io_class, level = IO_PRIORITIES[self.io_priority]
+        if self.libc is None:
+            self.libc = ctypes.CDLL(None, use_errno=True)
+        if self.libc.syscall(number, _IOPRIO_WHO_PROCESS, pid, (io_class << _IOPRIO_CLASS_SHIFT) | level) != 0:
+            self._warn_once("io", f"⚠️ Could not lower Ghostscript I/O priority: {os.strerror(ctypes.get_errno())}")
+
+    def _windows_memory_limit(self, process):
+        # A job object per process; it lives on after its handle is closed, for as long as gs runs
+        kernel32 = ctypes.windll.kernel32
+        kernel32.CreateJobObjectW.restype = ctypes.c_void_p  # A HANDLE, which the default int would truncate
+        job = kernel32.CreateJobObjectW(None, None)
+        if not job:
+            self._warn_once("memory", "⚠️ Could not create a job object to limit Ghostscript memory.")
+            return
+        job = ctypes.c_void_p(job)
+        try:
+            limits = _ExtendedLimits()
+            limits.BasicLimitInformation.LimitFlags = _JOB_OBJECT_LIMIT_PROCESS_MEMORY
+            limits.ProcessMemoryLimit = self.memory_limit
+            if not (kernel32.SetInformationJobObject(job, _JOB_OBJECT_EXTENDED_LIMIT_INFORMATION,
+                                                     ctypes.byref(limits), ctypes.sizeof(limits))
+                    and kernel32.AssignProcessToJobObject(job, ctypes.c_void_p(int(process._handle)))):
+                self._warn_once("memory", "⚠️ Could not limit Ghostscript memory.")
+        finally:
+            kernel32.CloseHandle(job)
+
+    def describe(self):
+        parts = []
+        if self.nice > 0:
+            parts.append(f"nice {self.nice}")
+        if self.io_priority != "normal":
+            parts.append(f"{self.io_priority} I/O priority")
+        if self.memory_limit:
+            parts.append(f"{self.memory_limit // (1024 * 1024)}MB address space per process")
+        return ", ".join(parts)
+
+# ----------------- Dispatch Governor -----------------
+class ResourceGovernor:
+    def __init__(self, memory_budget=0, max_load_per_cpu=0, min_free_memory=0, estimate=None, log=None,
+                 on_throttle=None, own_processes=None, slots=0):
+        self.memory_budget = memory_budget  # Bytes all running jobs may reserve together (0 = no cap)
+        self.max_load_per_cpu = max_load_per_cpu  # Pause dispatch above this load per core (0 = never)
+        self.min_free_memory = min_free_memory  # Pause dispatch below this much available memory (0 = never)
+        self.estimate = estimate or (lambda path: 0)  # path -> bytes a job on it is expected to use
+        self.log = log or _ignore
+        self.on_throttle = on_throttle or _ignore  # Called with the reason whenever dispatch pauses
+        # Number of our own gs processes running right now; they are not counted as load
+        self.own_processes = own_processes or (lambda: 0)
+        self.own_load = 0.0  # Their share of the load average
+        self.own_sampled = None
+        self.slots = slots  # Worker slots shared by running jobs and the extra processes they borrow (0 = no cap)
+        self.lock = threading.Lock()
+        self.reserved = 0
+        self.running = 0
+        self.borrowed = 0
+        self.paused = None  # Why dispatch is paused, or None
+        self.readings = (0.0, None, None)  # (time, load per core, available memory)
+
+    def _own_load_per_cpu(self, now):
+        # The load average decays exponentially, so our processes' share of it is tracked the same way
+        count = self.own_processes()
+        if self.own_sampled is not None:
+            decay = math.exp(-(now - self.own_sampled) / LOAD_AVERAGE_SECONDS)
+            self.own_load = self.own_load * decay + count * (1 - decay)
+        self.own_sampled = now
+        return self.own_load / (os.cpu_count() or 1)
+
+    def _read(self):
+        # Load per core excluding our own gs processes, and available memory
+        now = time.monotonic()
+        if now - self.readings[0] >= STATS_MAX_AGE:
+            load = load_per_cpu() if self.max_load_per_cpu else None
+            if load is not None:
+                load = max(0.0, load - self._own_load_per_cpu(now))
+            self.readings = (now, load, available_memory() if self.min_free_memory else None)
+        return self.readings[1], self.readings[2]
+
+    def _pause_reason(self, need):
+        load, free = self._read()
+        # One job always runs, as with the budget: a busy machine slows the queue down but never stalls it
+        if self.max_load_per_cpu and self.running and load is not None and load > self.max_load_per_cpu:
+            return "load", f"other load {load:.1f} per core over {self.max_load_per_cpu:g}"
+        if self.min_free_memory and free is not None and free < self.min_free_memory:
+            return "memory", f"{free // (1024 * 1024)}MB available, under {self.min_free_memory // (1024 * 1024)}MB"
+        # One job always runs, however large, so an oversized file cannot stall the queue forever
+        if self.memory_budget and self.running and self.reserved + need > self.memory_budget:
+            return "budget", (f"{self.reserved // (1024 * 1024)}MB of the {self.memory_budget // (1024 * 1024)}MB "
+                              f"memory budget in use")
+        if self.slots and self.borrowed and self.running + self.borrowed >= self.slots:
+            return "slots", f"{self.borrowed} worker slot(s) lent to page ranges"
+        return None, None
+
+    def try_reserve(self, path):
+        # Bytes reserved for a job on path, or None while dispatch is paused
+        need = self.estimate(path) if self.memory_budget else 0
+        with self.lock:
+            reason, detail = self._pause_reason(need)
+            if reason is not None:
+                if self.paused != reason:
+                    self.paused = reason
+                    self.on_throttle(reason)
+                    if reason not in ("budget", "slots"):  # Both are routine and would flood the log
+                        self.log(f"⏸️ Holding back queued files: {detail}")
+                return None
+            if self.paused is not None:
+                if self.paused not in ("budget", "slots"):
+                    self.log("▶️ Resuming compression.")
+                self.paused = None
+            self.reserved += need
+            self.running += 1
+            return need
+
+    def release(self, reserved):
+        with self.lock:
+            self.reserved -= reserved
+            self.running -= 1
+
+    def borrow_slots(self, wanted):
+        # Up to `wanted` idle worker slots for a running job's extra gs processes; no new job is
+        # dispatched into them until return_slots(). Returns how many were granted.
+        with self.lock:
+            granted = max(0, min(wanted, self.slots - self.running - self.borrowed)) if self.slots else wanted
+            self.borrowed += granted
+            return granted
+
+    def return_slots(self, count):
+        with self.lock:
+            self.borrowed -= count
+
+    def is_paused(self):
+        with self.lock:
+            return self.paused is not None
+
+    def describe(self):
+        parts = []
+        if self.memory_budget:
+            parts.append(f"{self.memory_budget // (1024 * 1024)}MB memory budget")
+        if self.max_load_per_cpu:
+            parts.append(f"pause above load {self.max_load_per_cpu:g} per core")
+        if self.min_free_memory:
+            parts.append(f"pause under {self.min_free_memory // (1024 * 1024)}MB available")
+        return ", ".join(parts)
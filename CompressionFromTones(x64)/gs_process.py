@@ -0,0 +1,177 @@
+import os
+import sys
+import signal
+import tempfile
+import threading
+import subprocess
+
+# Ghostscript child processes that can be killed from another thread: on stop requests
+# (ProcessTracker.cancel_all), when a run exceeds its wall-clock timeout and when its output
+# outgrows a size limit. Each gs runs in its own process group / session so the whole tree goes
+# down, not just the direct child.
+
+OUTPUT_POLL_INTERVAL = 0.25
+
+process_limits = None  # governor.ProcessLimits applied to every gs started through spawn()
+
+class GhostscriptCancelled(Exception):
+    pass
+
+class OutputTooLarge(Exception):
+    # pdfwrite output only grows while gs runs, so once it passes the limit the finished file would too
+    def __init__(self, size, limit):
+        super().__init__(f"Output reached {size} bytes, over the {limit} byte limit")
+        self.size = size
+        self.limit = limit
+
+def output_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+class OutputWatch:
+    # Polls a growing output file from a daemon thread and calls kill() once it passes limit
+    def __init__(self, path, limit, kill):
+        self.path = path
+        self.limit = limit
+        self.kill = kill
+        self.size = None  # Size that triggered the kill
+        self.done = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while not self.done.wait(OUTPUT_POLL_INTERVAL):
+            size = output_size(self.path)
+            if size > self.limit:
+                self.size = size
+                self.kill()
+                return
+
+    def stop(self):
+        self.done.set()
+
+    def error(self):
+        return OutputTooLarge(self.size, self.limit)
+
+def tree_popen_kwargs(popen_kwargs=None):
+    popen_kwargs = dict(popen_kwargs or {})
+    if sys.platform.startswith("win"):
+        popen_kwargs["creationflags"] = popen_kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs["start_new_session"] = True
+    return popen_kwargs
+
+def set_process_limits(limits):
+    global process_limits
+    process_limits = limits
+
+def spawn(command, popen_kwargs=None, **kwargs):
+    # Popen for gs: its own process group, plus the configured priority and memory limits
+    popen_kwargs = tree_popen_kwargs(popen_kwargs)
+    limits = process_limits
+    if limits is not None:
+        popen_kwargs = limits.popen_kwargs(popen_kwargs)
+    process = subprocess.Popen(command, **kwargs, **popen_kwargs)
+    if limits is not None:
+        limits.apply(process)
+    return process
+
+def kill_tree(process):
+    if process.returncode is not None:
+        return  # Already reaped; its pid may belong to someone else by now
+    try:
+        if sys.platform.startswith("win"):
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, creationflags=subprocess.CREATE_NO_WINDOW)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        pass
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+class ProcessTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}  # Popen -> kill reason (None while it runs normally)
+
+    def add(self, process):
+        with self.lock:
+            self.running[process] = None
+
+    def discard(self, process):
+        # Returns why the process was killed, or None. Callers discard before reaping the child,
+        # so a kill can never hit a recycled pid.
+        with self.lock:
+            return self.running.pop(process, None)
+
+    def kill(self, process, reason):
+        with self.lock:
+            if process not in self.running or self.running[process] is not None:
+                return
+            self.running[process] = reason
+            kill_tree(process)
+
+    def cancel_all(self):
+        with self.lock:
+            processes = [p for p, reason in self.running.items() if reason is None]
+        for process in processes:
+            self.kill(process, "cancelled")
+
+    def count(self):
+        with self.lock:
+            return len(self.running)
+
+def _wait(process, tracker):
+    # Returns (kill reason, CPU seconds or None)
+    if hasattr(os, "waitid") and hasattr(os, "wait4"):
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)  # Exited, but not reaped yet
+        reason = tracker.discard(process)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return reason, usage.ru_utime + usage.ru_stime
+    process.wait()  # Windows: the process handle stays valid until Popen is collected
+    return tracker.discard(process), None
+
+def run_process(command, tracker, timeout=None, popen_kwargs=None, output_limit=None):
+    # subprocess.run(check=True) that stop requests and the timeout can interrupt.
+    # output_limit: (path, bytes) kills the run with OutputTooLarge once the file at path grows past bytes.
+    # Returns (CompletedProcess, CPU seconds or None). Output goes through temp files so nothing
+    # blocks on a full pipe while we wait for the child.
+    with tempfile.TemporaryFile(mode="w+") as out, tempfile.TemporaryFile(mode="w+") as err:
+        process = spawn(command, popen_kwargs, stdout=out, stderr=err, text=True)
+        tracker.add(process)
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, tracker.kill, (process, "timeout"))
+            timer.daemon = True
+            timer.start()
+        watch = None
+        if output_limit is not None:
+            watch = OutputWatch(*output_limit, lambda: tracker.kill(process, "too_large"))
+        try:
+            reason, cpu_time = _wait(process, tracker)
+        except BaseException:
+            tracker.kill(process, "cancelled")
+            tracker.discard(process)
+            process.wait()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if watch is not None:
+                watch.stop()
+        out.seek(0)
+        err.seek(0)
+        result = subprocess.CompletedProcess(command, process.returncode, out.read(), err.read())
+    if reason == "timeout":
+        raise subprocess.TimeoutExpired(command, timeout, result.stdout, result.stderr)
+    if reason == "cancelled":
+        raise GhostscriptCancelled("Ghostscript run cancelled")
+    if reason == "too_large":
+        raise watch.error()
+    result.check_returncode()
+    return result, cpu_time
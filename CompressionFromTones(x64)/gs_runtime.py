@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import shutil
+import threading
+import subprocess
+
+GS_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_gs_cache.json")
+
+def _ignore(message):
+    pass
+
+# ----------------- Executable Resolution -----------------
+def find_ghostscript_executable(log=None):
+    log = log or _ignore
+    if getattr(sys, 'frozen', False):
+        gs = os.path.join(sys._MEIPASS, "gswin64c.exe")
+        if not os.path.exists(gs):
+            log("Bundled Ghostscript not found!")
+            return None
+        return gs
+    if sys.platform.startswith("win"):
+        local_gs = os.path.join(os.path.dirname(__file__), "ghostscript", "gswin64c.exe")
+        if os.path.exists(local_gs):
+            return local_gs
+        gs_path = shutil.which("gswin64c.exe") or shutil.which("gs")
+    else:
+        gs_path = shutil.which("gs")
+    if gs_path is None:
+        log("Ghostscript not found in PATH!")
+    return gs_path
+
+# ----------------- Capability Probe -----------------
+def _run_gs(executable, *args):
+    creationflags = subprocess.CREATE_NO_WINDOW if sys.platform.startswith("win") else 0
+    return subprocess.run([executable, *args], check=True, creationflags=creationflags,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30).stdout
+
+def parse_devices(help_text):
+    devices = []
+    in_devices = False
+    for line in help_text.splitlines():
+        if line.startswith("Available devices:"):
+            in_devices = True
+            continue
+        if in_devices:
+            if not line[:1].isspace():
+                break
+            devices.extend(line.split())
+    return devices
+
+def probe_ghostscript(executable):
+    version = _run_gs(executable, "--version").strip()
+    devices = parse_devices(_run_gs(executable, "-h"))
+    return {"version": version, "devices": devices}
+
+class GhostscriptRuntime:
+    def __init__(self, executable, version, devices):
+        self.executable = executable
+        self.version = version
+        self.devices = set(devices)
+
+    @property
+    def version_tuple(self):
+        parts = []
+        for part in self.version.split("."):
+            if not part.isdigit():
+                break
+            parts.append(int(part))
+        return tuple(parts)
+
+    def supports_device(self, device):
+        # Some builds print a truncated device list; trust it only when it is non-empty
+        return not self.devices or device in self.devices
+
+    @property
+    def supports_permit_paths(self):
+        # --permit-file-read/write arrived with the SAFER rework in 9.50
+        return self.version_tuple >= (9, 50)
+
+# ----------------- Process-Wide Runtime -----------------
+_runtime = None
+_runtime_lock = threading.Lock()
+
+def _load_probe_cache():
+    try:
+        with open(GS_CACHE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_probe_cache(cache):
+    try:
+        tmp_path = GS_CACHE_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, GS_CACHE_FILE)
+    except OSError:
+        pass
+
+def get_ghostscript_runtime(log=None):
+    global _runtime
+    log = log or _ignore
+    with _runtime_lock:
+        if _runtime is not None:
+            return _runtime
+        executable = find_ghostscript_executable(log)
+        if executable is None:
+            return None
+        try:
+            st = os.stat(executable)
+        except OSError as e:
+            log(f"❌ Ghostscript error: {e}")
+            return None
+        cache = _load_probe_cache()
+        entry = cache.get(executable)
+        if not entry or entry.get("mtime_ns") != st.st_mtime_ns or entry.get("size") != st.st_size:
+            try:
+                entry = probe_ghostscript(executable)
+            except (OSError, subprocess.SubprocessError) as e:
+                log("❌ Ghostscript error processing (version check): " + str(e))
+                return None
+            entry.update({"mtime_ns": st.st_mtime_ns, "size": st.st_size})
+            cache[executable] = entry
+            _save_probe_cache(cache)
+            log(f"🔎 Ghostscript {entry['version']} found at {executable}")
+        _runtime = GhostscriptRuntime(executable, entry["version"], entry["devices"])
+        return _runtime
+
+def reset_ghostscript_runtime():
+    global _runtime
+    with _runtime_lock:
+        _runtime = None
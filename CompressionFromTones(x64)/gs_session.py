@@ -0,0 +1,215 @@
+import os
+import sys
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from gs_process import GhostscriptCancelled, OutputWatch, spawn, kill_tree
+
+# Restart an interpreter after this many files so font caches and leaks don't pile up
+MAX_JOBS_PER_SESSION = 200
+STATUS_PREFIX = "%%PDFC-STATUS "
+
+class SessionError(Exception):
+    pass
+
+def ps_string(path):
+    # PostScript string literal for a file name; bytes outside printable ASCII are octal-escaped
+    out = []
+    for byte in os.fsencode(path):
+        char = chr(byte)
+        if char in "()\\":
+            out.append("\\" + char)
+        elif 32 <= byte < 127:
+            out.append(char)
+        else:
+            out.append("\\%03o" % byte)
+    return "(" + "".join(out) + ")"
+
+def _permit_path(folder):
+    return os.path.join(os.path.abspath(folder), "")
+
+# ----------------- Persistent Ghostscript Session -----------------
+class GhostscriptSession:
+    def __init__(self, gs_executable, gs_quality, allowed_dirs=(), log=None):
+        self.gs_executable = gs_executable
+        self.gs_quality = gs_quality
+        self.allowed_dirs = [_permit_path(d) for d in allowed_dirs]
+        self.log = log
+        self.process = None
+        self.jobs_done = 0
+        self.scratch_dir = None
+        self.scratch_file = None
+        self.kill_reason = None
+
+    def start(self):
+        self.scratch_dir = tempfile.mkdtemp(prefix="pdfc_gs_")
+        self.scratch_file = os.path.join(self.scratch_dir, "idle.pdf")
+        permits = []
+        # SAFER stays on: the interpreter may only touch the watched folders and its scratch dir
+        for folder in self.allowed_dirs + [_permit_path(self.scratch_dir)]:
+            permits.append(f"--permit-file-read={folder}")
+            permits.append(f"--permit-file-write={folder}")
+        gs_command = [
+            self.gs_executable,
+            "-q",
+            "-dNOPAUSE",
+            "-sDEVICE=pdfwrite",
+            "-dCompatibilityLevel=1.4",
+            f"-dPDFSETTINGS=/{self.gs_quality}",
+            f"-sOutputFile={self.scratch_file}",
+            *permits,
+            "-"
+        ]
+        if sys.platform.startswith("win"):
+            creationflags = subprocess.CREATE_NO_WINDOW
+        else:
+            creationflags = 0
+        self.process = spawn(gs_command, {"creationflags": creationflags}, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self.jobs_done = 0
+        self.kill_reason = None
+
+    def kill(self, reason):
+        # From another thread: the blocked readline in compress() then sees EOF
+        process = self.process
+        if process is not None and process.poll() is None:
+            self.kill_reason = reason
+            kill_tree(process)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+        if self.scratch_dir:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.scratch_dir = None
+
+    def compress(self, input_file, output_file, timeout=None):
+        # timeout: the limit the caller enforces with kill("timeout"), reported in TimeoutExpired
+        if not self.alive():
+            self.start()
+        # Point the device at the new output, run the PDF inside `stopped` so a broken file
+        # doesn't take the interpreter down, then switch back to the scratch file, which
+        # closes and finalises the real output before the status line is printed.
+        program = (
+            f"<< /OutputFile {ps_string(output_file)} >> setpagedevice\n"
+            f"mark {{ {ps_string(input_file)} run }} stopped\n"
+            "{ cleartomark $error /newerror false put (FAIL) } { cleartomark (OK) } ifelse\n"
+            "/pdfc_status exch def\n"
+            f"<< /OutputFile {ps_string(self.scratch_file)} >> setpagedevice\n"
+            f"(\\n{STATUS_PREFIX}) print pdfc_status print (\\n) print flush\n"
+        )
+        try:
+            self.process.stdin.write(program)
+            self.process.stdin.flush()
+        except OSError as e:
+            self.close()
+            raise SessionError(f"Ghostscript session died: {e}")
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                reason = self.kill_reason
+                self.close()
+                if reason == "timeout":
+                    raise subprocess.TimeoutExpired(input_file, timeout, "".join(output))
+                if reason == "cancelled":
+                    raise GhostscriptCancelled("Ghostscript run cancelled")
+                raise SessionError("Ghostscript session exited unexpectedly:\n" + "".join(output))
+            if line.startswith(STATUS_PREFIX):
+                break
+            if line.strip():
+                output.append(line)
+        self.jobs_done += 1
+        if self.jobs_done >= MAX_JOBS_PER_SESSION:
+            self.close()
+        if line[len(STATUS_PREFIX):].strip() != "OK":
+            raise SessionError("Ghostscript could not process the file:\n" + "".join(output))
+        return "".join(output)
+
+# ----------------- Session Pool -----------------
+class SessionPool:
+    def __init__(self, gs_executable, allowed_dirs, size, log=None):
+        self.gs_executable = gs_executable
+        self.allowed_dirs = list(allowed_dirs)
+        self.size = size
+        self.log = log
+        self.idle = {}     # gs quality -> queue of idle sessions
+        self.created = {}  # gs quality -> number of sessions started
+        self.lock = threading.Lock()
+        self.closed = False
+        self.busy = set()
+
+    def allows(self, *paths):
+        return all(any(os.path.abspath(p).startswith(_permit_path(d)) for d in self.allowed_dirs)
+                   for p in paths)
+
+    def _acquire(self, gs_quality):
+        with self.lock:
+            idle = self.idle.setdefault(gs_quality, queue.Queue())
+            if idle.empty() and self.created.get(gs_quality, 0) < self.size:
+                self.created[gs_quality] = self.created.get(gs_quality, 0) + 1
+                return GhostscriptSession(self.gs_executable, gs_quality, self.allowed_dirs, self.log)
+        return idle.get()
+
+    def _release(self, gs_quality, session):
+        with self.lock:
+            if self.closed:
+                session.close()
+                return
+            self.idle[gs_quality].put(session)
+
+    def compress(self, gs_quality, input_file, output_file, timeout=None, output_limit=None):
+        # output_limit: bytes; the session is killed (and OutputTooLarge raised) once the output passes it
+        session = self._acquire(gs_quality)
+        with self.lock:
+            self.busy.add(session)
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, session.kill, ("timeout",))
+            timer.daemon = True
+            timer.start()
+        watch = None
+        if output_limit is not None:
+            watch = OutputWatch(output_file, output_limit, lambda: session.kill("too_large"))
+        try:
+            return session.compress(input_file, output_file, timeout)
+        except SessionError:
+            if watch is not None and watch.size is not None:
+                raise watch.error()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if watch is not None:
+                watch.stop()
+            with self.lock:
+                self.busy.discard(session)
+            self._release(gs_quality, session)
+
+    def busy_count(self):
+        with self.lock:
+            return len(self.busy)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            sessions = []
+            for idle in self.idle.values():
+                while not idle.empty():
+                    sessions.append(idle.get())
+            busy = list(self.busy)
+        for session in busy:
+            session.kill("cancelled")
+        for session in sessions:
+            session.close()
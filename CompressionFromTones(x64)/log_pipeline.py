@@ -0,0 +1,56 @@
+import queue
+import logging
+import threading
+import logging.handlers
+from collections import deque
+
+# ----------------- Log Pipeline -----------------
+class LogPipeline:
+    # emit() may be called from any thread; the front end drains batches on its own thread.
+    # Only the last history_lines messages are kept in memory; the optional rotating log file
+    # has the full history. The queue is bounded too: when the front end falls behind, new
+    # messages are dropped (never blocking a worker) and one line reports how many.
+    def __init__(self, history_lines=1000, log_file=None, max_bytes=5 * 1024 * 1024, backups=3,
+                 queue_size=10000):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.history = deque(maxlen=history_lines)
+        self.file_logger = None
+        if log_file:
+            handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_logger = logging.getLogger("pdf_compressor.log_file")
+            self.file_logger.propagate = False
+            self.file_logger.setLevel(logging.INFO)
+            self.file_logger.addHandler(handler)
+
+    def emit(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+        if self.file_logger is not None:
+            self.file_logger.info(message)
+
+    def drain(self, max_items=500):
+        batch = []
+        while len(batch) < max_items:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch.append(f"⚠️ {dropped} log message(s) dropped, the log window could not keep up")
+        self.history.extend(batch)
+        return batch
+
+    def close(self):
+        if self.file_logger is not None:
+            for handler in list(self.file_logger.handlers):
+                handler.close()
+                self.file_logger.removeHandler(handler)
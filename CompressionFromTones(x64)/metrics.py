@@ -0,0 +1,204 @@
+import os
+import threading
+import tempfile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# In-process counters and histograms, exposed in the Prometheus text format either as a file
+# (for node_exporter's textfile collector) or on a local HTTP endpoint.
+
+PREFIX = "pdf_compressor_"
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# name -> (type, help); samples for names not declared here are rejected
+METRICS = {
+    "files_total": ("counter", "Files handled, by outcome"),
+    "bytes_in_total": ("counter", "Bytes of input read by Ghostscript runs"),
+    "bytes_out_total": ("counter", "Bytes left on disk after those runs"),
+    "bytes_saved_total": ("counter", "Bytes removed by compression"),
+    "early_aborts_total": ("counter", "Ghostscript runs killed because their output outgrew the original"),
+    "queue_wait_seconds": ("histogram", "Time between a file being queued and a worker picking it up"),
+    "scan_seconds": ("histogram", "Duration of folder scans"),
+    "scan_dirs_total": ("counter", "Folders reached by scans: listed, unchanged (skipped via the scan index) or pruned"),
+    "files_filtered_total": ("counter", "PDFs left alone by the scan filters, by reason"),
+    "bytes_filtered_total": ("counter", "Size of the PDFs left alone by the scan filters"),
+    "preflight_seconds": ("histogram", "Duration of the structural pre-scan"),
+    "gs_wall_seconds": ("histogram", "Wall time of all Ghostscript work for one file, by mode"),
+    "gs_cpu_seconds": ("histogram", "CPU time (user + system) of one Ghostscript process"),
+    "queue_pending": ("gauge", "Files queued or being compressed"),
+    "dispatch_paused": ("gauge", "1 while queued files are held back by the resource governor"),
+    "memory_reserved_bytes": ("gauge", "Estimated memory reserved by running jobs"),
+    "throttle_events_total": ("counter", "Times dispatch paused, by reason (load, memory, budget, slots)"),
+    "deferred_total": ("counter", "Large files put aside for a batch window or idle time"),
+    "deferred_files": ("gauge", "Files waiting for a batch window or idle time"),
+    "deferred_work_seconds": ("gauge", "Predicted Ghostscript time of the deferred files"),
+}
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ----------------- Registry -----------------
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, label key) -> value
+        self.histograms = {}  # (name, label key) -> [bucket counts..., count, sum]
+        self.gauges = {}  # name -> callable returning the current value
+
+    def _check(self, name, kind):
+        if METRICS.get(name, (None,))[0] != kind:
+            raise KeyError(f"{name} is not a declared {kind}")
+
+    def inc(self, name, value=1, **labels):
+        self._check(name, "counter")
+        with self.lock:
+            key = (name, _label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if value is None:
+            return
+        self._check(name, "histogram")
+        with self.lock:
+            key = (name, _label_key(labels))
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def set_gauge(self, name, read):
+        self._check(name, "gauge")
+        with self.lock:
+            self.gauges[name] = read
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters), {key: list(state) for key, state in self.histograms.items()}, \
+                dict(self.gauges)
+
+    def render(self):
+        counters, histograms, gauges = self.snapshot()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            full_name = PREFIX + name
+            if kind == "counter":
+                samples = [(key, value) for (n, key), value in sorted(counters.items()) if n == name]
+                body = [f"{full_name}{_format_labels(key)} {_format_value(value)}" for key, value in samples]
+            elif kind == "histogram":
+                body = []
+                for (n, key), state in sorted(histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(self.buckets, state):
+                        body.append(f"{full_name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                    body.append(f"{full_name}_bucket{_format_labels(key, [('le', '+Inf')])} {state[-2]}")
+                    body.append(f"{full_name}_count{_format_labels(key)} {state[-2]}")
+                    body.append(f"{full_name}_sum{_format_labels(key)} {_format_value(float(state[-1]))}")
+            else:
+                read = gauges.get(name)
+                try:
+                    body = [f"{full_name} {_format_value(read())}"] if read else []
+                except Exception:
+                    body = []
+            if body:
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+# ----------------- Exporters -----------------
+def write_metrics_file(metrics, path):
+    # Written to a temp file and renamed, so a scraper never reads half a file
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(metrics.render())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _make_handler(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the GUI log
+    return MetricsHandler
+
+class MetricsExporter:
+    def __init__(self, metrics, file_path="", port=0, interval=15, host="127.0.0.1", log=None):
+        self.metrics = metrics
+        self.file_path = file_path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.log = log or (lambda message: None)
+        self.stop_event = threading.Event()
+        self.server = None
+        self.threads = []
+
+    def start(self):
+        if self.port:
+            try:
+                self.server = ThreadingHTTPServer((self.host, self.port), _make_handler(self.metrics))
+            except OSError as e:
+                self.log(f"⚠️ Could not serve metrics on {self.host}:{self.port}: {e}")
+            else:
+                self.server.daemon_threads = True
+                self.threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+                self.log(f"📈 Metrics at http://{self.host}:{self.server.server_address[1]}/metrics")
+        if self.file_path:
+            self.threads.append(threading.Thread(target=self._write_loop, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _write_loop(self):
+        while True:
+            self.write_file()
+            if self.stop_event.wait(self.interval):
+                break
+
+    def write_file(self):
+        if not self.file_path:
+            return
+        try:
+            write_metrics_file(self.metrics, self.file_path)
+        except OSError as e:
+            self.log(f"⚠️ Could not write metrics file: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+        self.write_file()  # Final totals for batch runs
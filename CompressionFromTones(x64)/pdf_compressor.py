@@ -1,11 +1,13 @@
 import os
 import sys
+import queue
 import subprocess
 import threading
-import json
 import customtkinter as ctk
 from tkinter import filedialog, messagebox, scrolledtext
-import shutil  # For checking ghostscript existence
+import compressor_core as core
+from compressor_core import config, save_config, compress_pdf, start_monitoring, stop_monitoring
+from log_pipeline import LogPipeline
 
 # ----------------- Prompt for Admin Privileges (Windows Only) -----------------
 if sys.platform.startswith("win"):
@@ -35,50 +37,28 @@ import pystray
 from PIL import Image
 
 # ----------------- Configuration -----------------
-CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_config.json")
-CACHE_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_cache.json")
-
 # REMOVE COMMAND APPEARING on macOS
 if sys.platform == "darwin":
     sys.stdout = open(os.devnull, "w")
     sys.stderr = open(os.devnull, "w")
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {
-        "default_folder": "",
-        "auto_monitoring": False,
-        "minimize_on_startup": False,
-        "quality": "Low Quality"
-    }
-
-def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f)
-
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_cache(cache):
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f)
-
-config = load_config()
 default_folder = config.get("default_folder", "")
 auto_monitoring = config.get("auto_monitoring", False)
 minimize_on_startup = config.get("minimize_on_startup", False)
 default_quality = config.get("quality", "Low Quality")
-processed_files = load_cache()
 
-monitoring_thread = None
-monitor_stop_event = None  # For folder-monitoring thread
 tray_icon = None
 
+# Worker threads only enqueue; the Tk thread drains the queue in batches every LOG_FLUSH_MS
+LOG_FLUSH_MS = 200
+DEFERRED_REFRESH_MS = 5000  # How often the deferred-work line is updated
+log_pipeline = LogPipeline(history_lines=config.get("log_history_lines", 1000),
+                           log_file=config.get("log_file") or None,
+                           max_bytes=config.get("log_file_max_mb", 5) * 1024 * 1024,
+                           backups=config.get("log_file_backups", 3),
+                           queue_size=config.get("log_queue_size", 10000))
+pending_errors = queue.SimpleQueue()
+
 # ----------------- Autostart Functionality -----------------
 APP_LABEL = "MyPDFCompressor"
 
@@ -135,31 +115,6 @@ def add_to_startup():
     else:
         log_message("Autostart is not implemented for this platform.")
 
-# ----------------- Ghostscript Executable Helper -----------------
-def get_ghostscript_executable():
-    if getattr(sys, 'frozen', False):
-        gs = os.path.join(sys._MEIPASS, "gswin64c.exe")
-        if not os.path.exists(gs):
-            log_message("Bundled Ghostscript not found!")
-        return gs
-    else:
-        if sys.platform.startswith("win"):
-            local_gs = os.path.join(os.path.dirname(__file__), "ghostscript", "gswin64c.exe")
-            if os.path.exists(local_gs):
-                return local_gs
-            else:
-                gs_path = shutil.which("gswin64c.exe") or shutil.which("gs")
-                if gs_path is None:
-                    log_message("Ghostscript not found in PATH!")
-                    return None
-                return gs_path
-        else:
-            gs_path = shutil.which("gs")
-            if gs_path is None:
-                log_message("Ghostscript not found in PATH!")
-                return None
-            return gs_path
-
 # ----------------- Tray Icon Functions -----------------
 def get_icon_image():
     try:
@@ -198,95 +153,42 @@ def on_closing():
     root.withdraw()
     start_tray_icon()
 
-# ----------------- PDF Compression Functions -----------------
-def get_file_size(file_path):
-    return os.path.getsize(file_path) / (1024 * 1024)
-
+# ----------------- Log & Actions -----------------
 def log_message(message):
-    log_text.configure(state="normal")
-    log_text.insert("end", message + "\n")
-    log_text.configure(state="disabled")
-    log_text.yview("end")
-
-def compress_pdf(file_path, quality=None):
-    gs_executable = get_ghostscript_executable()
-    if gs_executable is None:
-        messagebox.showerror("Error", "Ghostscript is not installed.")
-        log_message("❌ Ghostscript is not installed.")
-        return False
-    if quality is None:
-        quality = quality_var.get()
-    try:
-        file_size = os.path.getsize(file_path)
-        if file_path in processed_files and processed_files[file_path] == file_size:
-            return False
+    log_pipeline.emit(message)
+
+def show_error(title, message):
+    pending_errors.put((title, message))
+
+def flush_log():
+    batch = log_pipeline.drain()
+    if batch:
+        log_text.configure(state="normal")
+        log_text.insert("end", "\n".join(batch) + "\n")
+        # Keep the widget as bounded as the history buffer
+        excess = int(log_text.index("end-1c").split(".")[0]) - 1 - log_pipeline.history.maxlen
+        if excess > 0:
+            log_text.delete("1.0", f"{excess + 1}.0")
+        log_text.configure(state="disabled")
+        log_text.yview("end")
+    errors = []
+    while True:
         try:
-            subprocess.run([gs_executable, "--version"], check=True,
-                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        except Exception as e:
-            messagebox.showerror("Error", "Ghostscript error: " + str(e))
-            log_message("❌ Ghostscript error processing (version check): " + str(e))
-            return False
-        base, ext = os.path.splitext(file_path)
-        output_file = base + "_compressed" + ext
-        quality_map = {
-            "Low Quality": "screen",
-            "Balanced Quality": "ebook",
-            "High Quality": "printer",
-            "Very High Quality": "prepress"
-        }
-        gs_quality = quality_map.get(quality, "screen")
-        gs_command = [
-            gs_executable,
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            f"-dPDFSETTINGS=/{gs_quality}",
-            "-dNOPAUSE",
-            "-dQUIET",
-            "-dBATCH",
-            f"-sOutputFile={output_file}",
-            file_path
-        ]
-        if sys.platform.startswith("win"):
-            creationflags = subprocess.CREATE_NO_WINDOW
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        else:
-            creationflags = 0
-            startupinfo = None
-        result = subprocess.run(gs_command, check=True, creationflags=creationflags, startupinfo=startupinfo,
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.stdout:
-            log_message("Ghostscript stdout: " + result.stdout)
-        if result.stderr:
-            log_message("Ghostscript stderr: " + result.stderr)
-        original_size = os.path.getsize(file_path) / (1024 * 1024)
-        new_size = os.path.getsize(output_file) / (1024 * 1024)
-        if new_size < original_size:
-            os.replace(output_file, file_path)
-            log_message(f"✅ Compressed: {file_path} (New Size: {new_size:.2f}MB)")
-            processed_files[file_path] = os.path.getsize(file_path)
-            save_cache(processed_files)
-            return True
-        else:
-            os.remove(output_file)
-            log_message(f"⚠️ No size reduction for: {file_path}")
-            processed_files[file_path] = file_size
-            save_cache(processed_files)
-            return False
-    except subprocess.CalledProcessError as e:
-        log_message(f"❌ Ghostscript error processing: {file_path} (Exit Code: {e.returncode})")
-        log_message("Ghostscript stderr: " + e.stderr)
-        messagebox.showerror("Error", "Ghostscript failed to compress the file.\n" + e.stderr)
-        return False
-    except Exception as e:
-        log_message(f"❌ Error compressing {file_path}: {e}")
-        return False
+            errors.append(pending_errors.get_nowait())
+        except queue.Empty:
+            break
+    if errors:
+        # One dialog per batch so a burst of failures doesn't stack up modal boxes
+        title, message = errors[0]
+        if len(errors) > 1:
+            message += f"\n\n(+{len(errors) - 1} more errors, see the log)"
+        messagebox.showerror(title, message)
+    root.after(LOG_FLUSH_MS, flush_log)
 
 def select_and_compress():
     file_path = filedialog.askopenfilename(filetypes=[("PDF Files", "*.pdf")])
     if file_path:
-        compress_pdf(file_path)
+        compress_pdf(file_path, quality_var.get())
 
 def select_folder():
     global default_folder
@@ -297,46 +199,8 @@ def select_folder():
         default_folder = folder_path
         messagebox.showinfo("Folder Selected", f"Monitoring folder:\n{folder_path}")
         log_message(f"📂 Monitoring folder: {folder_path}")
-        if auto_monitoring:
-            start_monitoring(default_folder)
-
-# ----------------- Folder Monitoring -----------------
-def start_monitoring(folder):
-    global monitoring_thread, monitor_stop_event
-    if monitoring_thread and monitoring_thread.is_alive():
-        return
-    monitor_stop_event = threading.Event()
-    watcher = Watcher(folder, monitor_stop_event)
-    monitoring_thread = threading.Thread(target=watcher.run, daemon=True)
-    monitoring_thread.start()
-    log_message(f"🔄 Monitoring started for: {folder}")
-
-def stop_monitoring():
-    global monitoring_thread, monitor_stop_event
-    if monitor_stop_event:
-        monitor_stop_event.set()
-    if monitoring_thread:
-        monitoring_thread.join(timeout=2)
-    monitoring_thread = None
-    monitor_stop_event = None
-
-class Watcher:
-    def __init__(self, folder, stop_event):
-        self.folder = folder
-        self.stop_event = stop_event
-    def run(self):
-        while not self.stop_event.is_set():
-            for root_dir, _, files in os.walk(self.folder):
-                for file in files:
-                    if file.lower().endswith(".pdf") and not file.lower().endswith("_compressed.pdf"):
-                        file_path = os.path.join(root_dir, file)
-                        compress_pdf(file_path)
-                        if self.stop_event.is_set():
-                            break
-                if self.stop_event.is_set():
-                    break
-            if self.stop_event.wait(10):
-                break
+        if auto_monitoring and not config.get("watch_roots"):
+            start_monitoring()
 
 def toggle_auto_monitoring():
     global auto_monitoring
@@ -345,8 +209,8 @@ def toggle_auto_monitoring():
     save_config(config)
     if auto_monitoring:
         log_message("✅ Auto-monitoring enabled.")
-        if default_folder:
-            start_monitoring(default_folder)
+        if default_folder or config.get("watch_roots"):
+            start_monitoring()  # Every configured watch root, or the selected folder
     else:
         log_message("❌ Auto-monitoring disabled.")
         stop_monitoring()
@@ -363,6 +227,37 @@ def toggle_minimize_on_startup():
         log_message("❌ Will not start on startup and minimize automatically.")
         root.deiconify()
 
+def show_quarantine():
+    window = ctk.CTkToplevel(root)
+    window.title("Quarantined Files")
+    window.geometry("560x320")
+    listing = ctk.CTkTextbox(window, wrap="none")
+    listing.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+    def refresh():
+        entries = core.failures.listing()
+        listing.configure(state="normal")
+        listing.delete("1.0", "end")
+        if not entries:
+            listing.insert("end", "No quarantined files.")
+        for entry in entries:
+            message = (entry["message"] or "").strip().splitlines()
+            listing.insert("end", f"{entry['path']}\n    {entry['error_class']}, {entry['attempts']} attempts"
+                                  + (f": {message[-1]}" if message else "") + "\n")
+        listing.configure(state="disabled")
+
+    def retry_all():
+        released = core.release_quarantine()
+        log_message(f"🔁 Released {len(released)} quarantined file(s) for another attempt.")
+        refresh()
+
+    ctk.CTkButton(window, text="Retry All", command=retry_all).pack(pady=10)
+    refresh()
+
+def refresh_deferred():
+    deferred_label.configure(text="🌙 " + core.describe_deferred())
+    root.after(DEFERRED_REFRESH_MS, refresh_deferred)
+
 def update_quality(new_quality):
     config["quality"] = new_quality
     save_config(config)
@@ -389,6 +284,10 @@ choose_pdf = ctk.CTkButton(root, text="Choose PDF", command=select_and_compress)
 choose_pdf.pack(pady=10)
 autocompress_folder = ctk.CTkButton(root, text="Set Auto-Compress Folder", command=select_folder)
 autocompress_folder.pack(pady=10)
+quarantine_button = ctk.CTkButton(root, text="Quarantined Files", command=show_quarantine)
+quarantine_button.pack(pady=(0, 10))
+deferred_label = ctk.CTkLabel(root, text="", text_color="gray", font=("Arial", 12))
+deferred_label.pack(pady=(0, 5))
 quality_var = ctk.StringVar(value=default_quality)
 quality_label = ctk.CTkLabel(root, text="Select PDF Quality:")
 quality_label.pack(pady=(10, 0))
@@ -418,8 +317,16 @@ log_text = scrolledtext.ScrolledText(root, height=10, wrap="word", state="disabl
                                        bg="#1E1E1E", fg="white", font=("Arial", 10))
 log_text.pack(fill="both", padx=10, pady=10, expand=True)
 
+core.set_log_handler(log_message)
+core.set_error_handler(show_error)
+root.after(LOG_FLUSH_MS, flush_log)
+refresh_deferred()
+core.start_metrics()
+
 root.deiconify()
-if default_folder and auto_monitoring:
-    start_monitoring(default_folder)
+if auto_monitoring and (default_folder or config.get("watch_roots")):
+    start_monitoring()
 
 root.mainloop()
+core.stop_monitoring(wait=True)  # Kills running Ghostscript jobs and waits for their partial files to be removed
+core.stop_metrics()
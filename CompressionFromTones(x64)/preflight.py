@@ -0,0 +1,396 @@
+import os
+import re
+import mmap
+import zlib
+import threading
+from collections import OrderedDict
+
+# Structural pre-scan: reads stream dictionaries (and the insides of object streams) with
+# regexes, never renders or fully parses the document. Cheap enough to run before every gs job.
+# Encryption and the page count come from the trailer and cross-reference data at the end of
+# the file; only files whose xref cannot be followed get the slower whole-file scan.
+
+# Colour image resolution each PDFSETTINGS preset downsamples to, and gs's default
+# threshold (an image is only downsampled when it exceeds target * threshold)
+TARGET_DPI = {"screen": 72, "ebook": 150, "printer": 300, "prepress": 300}
+DOWNSAMPLE_THRESHOLD = 1.5
+LOSSY_OR_BILEVEL_FILTERS = {b"DCTDecode", b"JPXDecode", b"JBIG2Decode", b"CCITTFaxDecode"}
+MAX_OBJSTM_BYTES = 64 * 1024 * 1024
+DICT_LOOKBEHIND = 8192
+TAIL_BYTES = 2048  # Where "startxref" is looked for
+MAX_DICT_BYTES = 1024 * 1024
+MAX_XREF_SECTIONS = 64  # Incremental updates followed through /Prev (also stops /Prev loops)
+XREF_ENTRY_BYTES = 20
+
+STREAM_RE = re.compile(rb">>\s*stream\r?\n")
+ENDSTREAM_RE = re.compile(rb"endstream")
+PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+MEDIABOX_RE = re.compile(rb"/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]")
+INT_KEY_RE = {key: re.compile(rb"/" + key + rb"\s+(\d+)(?!\d|\s+\d+\s+R)")
+              for key in (b"Width", b"Height", b"Length", b"BitsPerComponent", b"Count", b"Prev", b"XRefStm",
+                          b"Size", b"First", b"Predictor", b"Columns")}
+REF_RE = {key: re.compile(rb"/" + key + rb"\s+(\d+)\s+\d+\s+R") for key in (b"Root", b"Pages")}
+FILTER_RE = re.compile(rb"/Filter\s*(\[[^\]]*\]|/[A-Za-z0-9]+)")
+NAME_RE = re.compile(rb"/([A-Za-z0-9]+)")
+OUTLINES_RE = re.compile(rb"/Outlines\s*\d+\s+\d+\s+R")
+# Bookmark/link targets inside the document: explicit /Dest entries and GoTo actions
+INTERNAL_DEST_RE = re.compile(rb"/Dest\s*[\[(/<]|/S\s*/GoTo(?![A-Za-z])")
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+XREF_SUBSECTION_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s*")
+XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+TRAILER_RE = re.compile(rb"\s*trailer")
+OBJ_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+DICT_OPEN_RE = re.compile(rb"\s*<<")
+DICT_TOKEN_RE = re.compile(rb"<<|>>")
+STREAM_KEYWORD_RE = re.compile(rb"\s*stream\r?\n")
+XREF_TYPE_RE = re.compile(rb"/Type\s*/XRef(?![A-Za-z])")
+W_RE = re.compile(rb"/W\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s*\]")
+INDEX_RE = re.compile(rb"/Index\s*\[([\d\s]*)\]")
+
+def _dict_start(data, end):
+    # Walk back from the ">>" before "stream" to its matching "<<"
+    floor = max(0, end - DICT_LOOKBEHIND)
+    depth = 0
+    i = end
+    while i > floor:
+        pair = data[i - 2:i]
+        if pair == b">>":
+            depth += 1
+            i -= 2
+        elif pair == b"<<":
+            depth -= 1
+            i -= 2
+            if depth == 0:
+                return i
+        else:
+            i -= 1
+    return None
+
+def _int(key, text):
+    match = INT_KEY_RE[key].search(text)
+    return int(match.group(1)) if match else None
+
+def _filters(text):
+    match = FILTER_RE.search(text)
+    return NAME_RE.findall(match.group(1)) if match else []
+
+def _dict_at(data, pos):
+    # The dictionary starting at pos (after whitespace), nested ones included, and where it ends
+    match = DICT_OPEN_RE.match(data, pos)
+    if not match:
+        raise ValueError("no dictionary")
+    start = match.end() - 2
+    depth = 0
+    for token in DICT_TOKEN_RE.finditer(data, start, min(len(data), start + MAX_DICT_BYTES)):
+        depth += 1 if token.group() == b"<<" else -1
+        if depth == 0:
+            return bytes(data[start:token.end()]), token.end()
+    raise ValueError("unterminated dictionary")
+
+def _png_unpredict(body, columns):
+    # PNG row filters with one byte per sample, as xref streams use them
+    out = bytearray()
+    previous = bytearray(columns)
+    for start in range(0, len(body) // (columns + 1) * (columns + 1), columns + 1):
+        kind = body[start]
+        row = bytearray(body[start + 1:start + 1 + columns])
+        for i in range(columns):
+            left, up, up_left = (row[i - 1], previous[i], previous[i - 1]) if i else (0, previous[i], 0)
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else up if pb <= pc else up_left)) & 0xFF
+            elif kind != 0:
+                raise ValueError("unknown PNG filter")
+        out += row
+        previous = row
+    return bytes(out)
+
+def _stream_body(data, header, end):
+    # Decoded body of the stream whose dictionary ends at `end`; xref and object streams are Flate
+    match = STREAM_KEYWORD_RE.match(data, end)
+    length = _int(b"Length", header)
+    if not match or length is None or length > MAX_OBJSTM_BYTES or _filters(header) != [b"FlateDecode"]:
+        raise ValueError("unsupported stream")
+    body = zlib.decompress(data[match.end():match.end() + length])
+    predictor = _int(b"Predictor", header) or 1
+    if predictor >= 10:
+        return _png_unpredict(body, _int(b"Columns", header) or 1)
+    if predictor != 1:
+        raise ValueError("unsupported predictor")
+    return body
+
+class _XrefSection:
+    # One cross-reference section: a classic "xref" table and its trailer, or an xref stream
+    def __init__(self, data, offset):
+        self.data = data
+        self.subsections = []  # (first object number, count, where its entries start)
+        self.widths = None
+        if data[offset:offset + 4] == b"xref":
+            pos = offset + 4
+            while True:
+                match = XREF_SUBSECTION_RE.match(data, pos)
+                if not match:
+                    break
+                first, count = int(match.group(1)), int(match.group(2))
+                self.subsections.append((first, count, match.end()))
+                pos = match.end() + count * XREF_ENTRY_BYTES
+            match = TRAILER_RE.match(data, pos)
+            if not match:
+                raise ValueError("no trailer")
+            self.trailer = _dict_at(data, match.end())[0]
+            return
+        match = OBJ_RE.match(data, offset)
+        if not match:
+            raise ValueError("startxref does not point at an xref section")
+        self.trailer, end = _dict_at(data, match.end())
+        widths = W_RE.search(self.trailer)
+        if not XREF_TYPE_RE.search(self.trailer) or not widths:
+            raise ValueError("not an xref stream")
+        self.widths = tuple(int(w) for w in widths.groups())
+        self.rows = _stream_body(data, self.trailer, end)
+        index = INDEX_RE.search(self.trailer)
+        numbers = [int(v) for v in index.group(1).split()] if index else [0, _int(b"Size", self.trailer) or 0]
+        row = 0
+        for first, count in zip(numbers[::2], numbers[1::2]):
+            self.subsections.append((first, count, row))
+            row += count
+
+    def entry(self, number):
+        # ("offset", byte offset), ("objstm", stream number, index), ("free",) or None if not listed here
+        for first, count, start in self.subsections:
+            if first <= number < first + count:
+                break
+        else:
+            return None
+        if self.widths is None:
+            match = XREF_ENTRY_RE.match(self.data, start + (number - first) * XREF_ENTRY_BYTES)
+            if not match:
+                raise ValueError("malformed xref entry")
+            return ("offset", int(match.group(1))) if match.group(3) == b"n" else ("free",)
+        pos = (start + number - first) * sum(self.widths)
+        if pos + sum(self.widths) > len(self.rows):
+            raise ValueError("xref stream too short")
+        fields = []
+        for width in self.widths:
+            fields.append(int.from_bytes(self.rows[pos:pos + width], "big"))
+            pos += width
+        kind = fields[0] if self.widths[0] else 1
+        if kind == 1:
+            return "offset", fields[1]
+        if kind == 2:
+            return "objstm", fields[1], fields[2]
+        return ("free",)
+
+def _xref_sections(data, offset):
+    # The newest section first, then hybrid /XRefStm and older /Prev ones; a damaged older
+    # section ends the chain rather than the whole read
+    sections = [_XrefSection(data, offset)]
+    seen = {offset}
+    while len(sections) < MAX_XREF_SECTIONS:
+        trailer = sections[-1].trailer
+        following = [o for o in (_int(b"XRefStm", trailer), _int(b"Prev", trailer)) if o is not None and o not in seen]
+        if not following:
+            break
+        try:
+            for offset in following:
+                seen.add(offset)
+                sections.append(_XrefSection(data, offset))
+        except (ValueError, zlib.error):
+            break
+    return sections
+
+def _find_object(data, sections, number, nested=False):
+    # -> (dictionary of object `number`, where it ends, the bytes it lives in)
+    for section in sections:
+        entry = section.entry(number)
+        if entry is not None:
+            break
+    else:
+        raise ValueError(f"object {number} is not in the xref")
+    if entry[0] == "offset":
+        match = OBJ_RE.match(data, entry[1])
+        if not match or int(match.group(1)) != number:
+            raise ValueError(f"xref offset of object {number} is wrong")
+        return (*_dict_at(data, match.end()), data)
+    if entry[0] == "objstm" and not nested:  # Object streams cannot live in object streams
+        header, end, container = _find_object(data, sections, entry[1], nested=True)
+        body = _stream_body(container, header, end)
+        first = _int(b"First", header) or 0
+        pairs = body[:first].split()
+        if int(pairs[2 * entry[2]]) != number:
+            raise ValueError(f"object stream {entry[1]} does not hold object {number}")
+        return (*_dict_at(body, first + int(pairs[2 * entry[2] + 1])), body)
+    raise ValueError(f"object {number} is free or inside a nested object stream")
+
+def read_trailer(data):
+    # {"encrypted": bool, "pages": /Count of the page tree or None} from the xref at the end of
+    # the file, without touching page content; raises ValueError or zlib.error if it cannot be followed
+    match = None
+    for match in STARTXREF_RE.finditer(data, max(0, len(data) - TAIL_BYTES)):
+        pass
+    if match is None:
+        raise ValueError("no startxref")
+    sections = _xref_sections(data, int(match.group(1)))
+    trailer = sections[0].trailer
+    root = REF_RE[b"Root"].search(trailer)
+    if not root:
+        raise ValueError("trailer without /Root")
+    result = {"encrypted": b"/Encrypt" in trailer, "pages": None}
+    try:
+        catalog = _find_object(data, sections, int(root.group(1)))[0]
+        pages = REF_RE[b"Pages"].search(catalog)
+        if pages:
+            result["pages"] = _int(b"Count", _find_object(data, sections, int(pages.group(1)))[0]) or None
+    except (ValueError, IndexError, zlib.error):
+        pass  # The page count falls back to counting page objects
+    return result
+
+def analyze_pdf(file_path):
+    info = {"pages": 0, "images": 0, "image_bytes": 0, "uncompressed_bytes": 0, "object_streams": False, "encrypted": False, "max_dpi": 0.0,
+            "outlines": False, "internal_links": 0, "page_size": None, "file_size": 0, "image_list": []}
+    with open(file_path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        info["file_size"] = len(data)
+        try:
+            trailer = read_trailer(data)
+        except (ValueError, IndexError, zlib.error):
+            trailer = None  # Damaged or unusual xref: fall back to scanning the whole file
+        info["encrypted"] = trailer["encrypted"] if trailer else data.rfind(b"/Encrypt") != -1
+        images = []
+        pos = 0
+        while True:
+            match = STREAM_RE.search(data, pos)
+            if not match:
+                break
+            if trailer:
+                _scan_objects(data, info, pos, match.start() + 2)  # Objects between streams, not stream bodies
+            body_start = match.end()
+            start = _dict_start(data, match.start() + 2)
+            header = bytes(data[start:match.start() + 2]) if start is not None else b""
+            length = _int(b"Length", header)
+            if length is None or body_start + length > len(data):
+                end_match = ENDSTREAM_RE.search(data, body_start)
+                length = (end_match.start() if end_match else len(data)) - body_start
+            pos = body_start + length
+            filters = _filters(header)
+            if re.search(rb"/Subtype\s*/Image", header):
+                images.append((header, filters, length))
+            elif re.search(rb"/Type\s*/ObjStm", header):
+                info["object_streams"] = True
+                if filters == [b"FlateDecode"] and length <= MAX_OBJSTM_BYTES and not info["encrypted"]:
+                    try:
+                        _scan_objects(zlib.decompress(data[body_start:body_start + length]), info)
+                    except zlib.error:
+                        pass
+            elif not filters:
+                info["uncompressed_bytes"] += length
+        if trailer:
+            _scan_objects(data, info, pos)
+            info["pages"] = trailer["pages"] or info["pages"]
+        else:
+            _scan_objects(data, info)
+    finally:
+        data.close()
+    info["pages"] = max(info["pages"], 1)
+    for header, filters, length in images:
+        info["images"] += 1
+        info["image_bytes"] += length
+        width, height = _int(b"Width", header) or 0, _int(b"Height", header) or 0
+        dpi = _effective_dpi(width, height, info["page_size"])
+        info["max_dpi"] = max(info["max_dpi"], dpi)
+        lossless = not LOSSY_OR_BILEVEL_FILTERS.intersection(filters)
+        bits = _int(b"BitsPerComponent", header) or 8
+        info["image_list"].append({"dpi": dpi, "bytes": length, "lossless": lossless, "bits": bits})
+    return info
+
+ANALYSIS_CACHE_SIZE = 1024  # Files whose scan results are kept in memory
+
+class AnalysisCache:
+    # analyze_pdf results by path, valid while size and mtime are unchanged, so the preflight
+    # verdict, the sharding check and later cost estimates share a single read of the file
+    def __init__(self, size=ANALYSIS_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # path -> ((size, mtime_ns), info), least recently used first
+
+    def lookup(self, file_path, st):
+        # Cached info for the file as stat'ed, or None; never reads the file
+        with self.lock:
+            entry = self.entries.get(file_path)
+            if entry is None or entry[0] != (st.st_size, st.st_mtime_ns):
+                return None
+            self.entries.move_to_end(file_path)
+            return entry[1]
+
+    def analyze(self, file_path):
+        st = os.stat(file_path)
+        info = self.lookup(file_path, st)
+        if info is None:
+            info = analyze_pdf(file_path)
+            with self.lock:
+                self.entries[file_path] = ((st.st_size, st.st_mtime_ns), info)
+                self.entries.move_to_end(file_path)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return info
+
+def _scan_objects(data, info, start=0, end=None):
+    end = len(data) if end is None else end
+    info["pages"] += len(PAGE_RE.findall(data, start, end))
+    info["outlines"] = info["outlines"] or OUTLINES_RE.search(data, start, end) is not None
+    info["internal_links"] += len(INTERNAL_DEST_RE.findall(data, start, end))
+    if info["page_size"] is None:
+        match = MEDIABOX_RE.search(data, start, end)
+        if match:
+            x0, y0, x1, y1 = (float(v) for v in match.groups())
+            info["page_size"] = (abs(x1 - x0), abs(y1 - y0))
+
+def _effective_dpi(width, height, page_size):
+    # Assumes the image spans the page, which holds for scans (the case that matters here)
+    if not width or not height:
+        return 0.0
+    page_w, page_h = page_size or (612.0, 792.0)
+    if page_w <= 0 or page_h <= 0:
+        return 0.0
+    if (width > height) != (page_w > page_h):
+        page_w, page_h = page_h, page_w
+    return max(width / (page_w / 72.0), height / (page_h / 72.0))
+
+def predict_savings(info, gs_quality):
+    # Rough model of what a pdfwrite rewrite at gs_quality will remove, in bytes
+    target = TARGET_DPI.get(gs_quality, 72)
+    savings = 0.0
+    for image in info["image_list"]:
+        if image["dpi"] > target * DOWNSAMPLE_THRESHOLD:
+            savings += image["bytes"] * (1 - (target / image["dpi"]) ** 2)
+        elif image["lossless"] and image["bits"] > 1 and gs_quality in ("screen", "ebook"):
+            savings += image["bytes"] * 0.5  # Flate/raw colour images are re-encoded as JPEG
+    savings += info["uncompressed_bytes"] * 0.7
+    if not info["object_streams"]:
+        # Fonts get subset and the xref is rebuilt; small but real on text-only files
+        savings += (info["file_size"] - info["image_bytes"]) * 0.05
+    return savings
+
+def classify(info, gs_quality, min_savings):
+    # Returns (verdict, reason, predicted_ratio); verdict is "skip" or "compress"
+    if info["encrypted"]:
+        return "compress", "encrypted, cannot judge", None
+    predicted = predict_savings(info, gs_quality)
+    ratio = predicted / info["file_size"] if info["file_size"] else 0.0
+    if ratio >= min_savings:
+        return "compress", "expected to shrink", ratio
+    if info["images"] == 0:
+        reason = "text-only"
+    elif info["max_dpi"] <= TARGET_DPI.get(gs_quality, 72) * DOWNSAMPLE_THRESHOLD:
+        reason = f"images already at or below {TARGET_DPI.get(gs_quality, 72)} dpi"
+    else:
+        reason = "already optimized"
+    return "skip", reason, ratio
@@ -0,0 +1,68 @@
+import os
+
+# Ordering policies for the compression queue. A policy is any callable (path, stat_result or None)
+# returning a sort key; the smallest key is compressed first and ties keep submission order.
+
+def newest_first(path, st):
+    # A file the user just saved jumps ahead of the backlog of older ones
+    return (-st.st_mtime_ns,) if st else (0,)
+
+def smallest_first(path, st):
+    return (st.st_size,) if st else (0,)
+
+def submission_order(path, st):
+    return ()
+
+POLICIES = {
+    "newest": newest_first,
+    "smallest": smallest_first,
+    "fifo": submission_order,
+}
+
+class FolderPriority:
+    # Files under earlier folders go first; within a folder (and for everything else) `then` decides
+    def __init__(self, folders, then=newest_first):
+        self.folders = [os.path.normcase(os.path.abspath(folder)) for folder in folders]
+        self.then = then
+
+    def rank(self, path):
+        path = os.path.normcase(os.path.abspath(path))
+        for i, folder in enumerate(self.folders):
+            if path == folder or path.startswith(folder.rstrip(os.sep) + os.sep):
+                return i
+        return len(self.folders)
+
+    def __call__(self, path, st):
+        return (self.rank(path),) + self.then(path, st)
+
+class RootPriority:
+    # Watch roots with a higher configured priority go first; `then` orders files within a level
+    def __init__(self, roots, then=newest_first):
+        # roots: (folder, priority) pairs; a file belongs to the innermost root containing it
+        self.roots = sorted(((os.path.normcase(os.path.abspath(folder)), priority) for folder, priority in roots),
+                            key=lambda root: len(root[0]), reverse=True)
+        self.then = then
+
+    def level(self, path):
+        path = os.path.normcase(os.path.abspath(path))
+        for folder, priority in self.roots:
+            if path == folder or path.startswith(folder.rstrip(os.sep) + os.sep):
+                return priority
+        return 0
+
+    def __call__(self, path, st):
+        return (-self.level(path),) + self.then(path, st)
+
+def create_policy(name="newest", folders=()):
+    # "folder" is newest-first within the configured folder order
+    base = POLICIES.get(name, newest_first)
+    if folders or name == "folder":
+        return FolderPriority(folders, base)
+    return base
+
+def priority_key(policy, path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    return policy(path, st)
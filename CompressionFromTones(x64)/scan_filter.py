@@ -0,0 +1,104 @@
+import os
+import fnmatch
+
+# Which parts of a watch root are looked at. Patterns are globs matched against the path
+# relative to the root ("/"-separated) and against the bare name, so ".git", "*/archive/*" and
+# "*.draft.pdf" all work. Excluded directories (and anything below max_depth) are pruned: they
+# are never listed, watched or walked.
+
+# Version-control metadata and the Windows recycle bin never hold documents worth compressing
+DEFAULT_EXCLUDE = [".git", ".svn", ".hg", "$RECYCLE.BIN"]
+
+def _ignore(kind, reason, size):
+    pass
+
+def _matches(rel_path, patterns):
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def _could_contain(rel_dir, pattern):
+    # False when no path below rel_dir can match pattern. fnmatch's * also matches "/", so the
+    # comparison stops (optimistically) at the first component with a *.
+    if "/" not in pattern:
+        return True  # Matches bare names at any depth
+    parts = rel_dir.split("/")
+    for part, pattern_part in zip(parts, pattern.split("/")):
+        if "*" in pattern_part:
+            return True
+        if not fnmatch.fnmatch(part, pattern_part):
+            return False
+    return True
+
+class ScanFilter:
+    def __init__(self, folder, include=(), exclude=(), min_size=0, max_size=0, max_depth=None,
+                 skip_folders=(), on_skip=None):
+        self.folder = os.path.abspath(folder)
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.min_size = min_size or 0
+        self.max_size = max_size or 0  # 0 = no limit
+        self.max_depth = max_depth  # Folder levels below the root; None = unlimited, 0 = the root only
+        self.skip_folders = {os.path.normcase(os.path.abspath(folder)) for folder in skip_folders}
+        self.on_skip = on_skip or _ignore  # (kind "dir" or "file", reason, size or None)
+
+    def relative(self, path):
+        return os.path.relpath(path, self.folder).replace(os.sep, "/")
+
+    def _dir_reason(self, rel_dir, directory):
+        if os.path.normcase(os.path.abspath(directory)) in self.skip_folders:
+            return "other_root"
+        if self.max_depth is not None and rel_dir.count("/") + 1 > self.max_depth:
+            return "depth"
+        if _matches(rel_dir, self.exclude) or _matches(rel_dir + "/", self.exclude):
+            return "excluded"
+        if self.include and not any(_could_contain(rel_dir, pattern) for pattern in self.include):
+            return "not_included"
+        return None
+
+    def prune(self, directory, report=True):
+        # True when directory (below the root) and everything under it is skipped
+        rel_dir = self.relative(directory)
+        if rel_dir == ".":
+            return False
+        reason = self._dir_reason(rel_dir, directory)
+        if reason is None:
+            return False
+        if report and reason != "other_root":  # Nested roots are scanned by their own watcher
+            self.on_skip("dir", reason, None)
+        return True
+
+    def _file_reason(self, rel_path, size):
+        if self.include and not _matches(rel_path, self.include):
+            return "not_included"
+        if _matches(rel_path, self.exclude):
+            return "excluded"
+        if size is not None and size < self.min_size:
+            return "too_small"
+        if size is not None and self.max_size and size > self.max_size:
+            return "too_large"
+        return None
+
+    def check(self, path, size=None):
+        # None when the file is wanted, otherwise why it is not. Its parent folders are checked too,
+        # for files reported by file events rather than found by a pruned walk.
+        rel_path = self.relative(path)
+        if rel_path.startswith("../"):
+            return "outside"
+        parts = rel_path.split("/")[:-1]
+        reason = None
+        for depth in range(1, len(parts) + 1):
+            reason = self._dir_reason("/".join(parts[:depth]), os.path.join(self.folder, *parts[:depth]))
+            if reason is not None:
+                break
+        if reason is None and size is None and (self.min_size or self.max_size):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return "missing"
+        reason = reason or self._file_reason(rel_path, size)
+        if reason is not None and reason != "other_root":
+            self.on_skip("file", reason, size)
+        return reason
+
+    def accepts(self, path, size=None):
+        return self.check(path, size) is None
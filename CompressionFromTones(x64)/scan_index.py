@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+
+from watch_backends import is_candidate_pdf
+
+SCAN_INDEX_FILE = os.path.join(os.path.expanduser("~"), ".pdf_compressor_scan_index.json")
+
+# Directory mtimes newer than this are not trusted: a file created in the same
+# timestamp tick as our listing would otherwise be missed (coarse mtimes on SMB/FAT).
+RACY_MTIME_WINDOW_NS = 2 * 1_000_000_000
+# A file below the minimum size that was modified this recently may still be growing in place,
+# which does not touch the directory mtime, so its directory is listed again
+GROWING_WINDOW_NS = 300 * 1_000_000_000
+
+def file_signature(st):
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+# ----------------- Scan Index -----------------
+class ScanIndex:
+    def __init__(self, path=SCAN_INDEX_FILE):
+        self.path = path
+        self.dirs = {}   # dir -> {"mtime": ns or None, "subdirs": [...], "files": [...]}
+        self.files = {}  # pdf path -> [size, mtime_ns, inode] recorded once the file was handled
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Watchers of several roots share one index and save it independently
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.dirs = data.get("dirs", {})
+            self.files = data.get("files", {})
+        except (OSError, ValueError):
+            # A damaged index only costs one full crawl
+            self.dirs, self.files = {}, {}
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = json.dumps({"dirs": self.dirs, "files": self.files})
+                self.dirty = False
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+    def mark_done(self, file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+        with self.lock:
+            self.files[file_path] = file_signature(st)
+            self.dirty = True
+
+    def forget(self, file_path):
+        # The file is offered again by the next scan: its folder is listed even if unchanged
+        with self.lock:
+            forgotten = self.files.pop(file_path, None) is not None
+            entry = self.dirs.get(os.path.dirname(file_path))
+            if entry is not None and entry["mtime"] is not None:
+                entry["mtime"] = None
+                forgotten = True
+            if forgotten:
+                self.dirty = True
+
+    def _forget_tree(self, folder):
+        entry = self.dirs.pop(folder, None)
+        if entry is None:
+            return
+        for name in entry["files"]:
+            self.files.pop(os.path.join(folder, name), None)
+        for sub in entry["subdirs"]:
+            self._forget_tree(sub)
+
+    def scan(self, folder, on_file, stop_event, full=False, scan_filter=None):
+        # Every subfolder and PDF is recorded, including pruned or filtered ones, so changing the
+        # filter settings only changes what is walked and reported, never what the index knows
+        stats = {"dirs_listed": 0, "dirs_skipped": 0, "files_changed": 0}
+        keep = (lambda d: not scan_filter.prune(d)) if scan_filter is not None else (lambda d: True)
+        stack = [folder]
+        while stack and not stop_event.is_set():
+            directory = stack.pop()
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                with self.lock:
+                    self._forget_tree(directory)
+                    self.dirty = True
+                continue
+            with self.lock:
+                entry = self.dirs.get(directory)
+            if not full and entry and entry["mtime"] == dir_mtime:
+                stats["dirs_skipped"] += 1
+                stack.extend(filter(keep, entry["subdirs"]))
+                continue
+            stats["dirs_listed"] += 1
+            subdirs, names, pending = [], [], False
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if item.is_dir(follow_symlinks=False):
+                            subdirs.append(item.path)
+                        elif is_candidate_pdf(item.name) and item.is_file():
+                            names.append(item.name)
+                            try:
+                                signature = file_signature(item.stat())
+                            except OSError:
+                                continue
+                            with self.lock:
+                                known = self.files.get(item.path)
+                            if known == signature:
+                                continue
+                            reason = scan_filter.check(item.path, signature[0]) if scan_filter is not None else None
+                            if reason is not None:
+                                if reason == "too_small" and time.time_ns() - signature[1] < GROWING_WINDOW_NS:
+                                    pending = True
+                                continue
+                            # Recorded by mark_done() once handled; until then the
+                            # directory stays unsettled so the file is seen again
+                            pending = True
+                            stats["files_changed"] += 1
+                            on_file(item.path)
+            except OSError:
+                continue
+            settled = not pending and time.time_ns() - dir_mtime > RACY_MTIME_WINDOW_NS
+            with self.lock:
+                if entry:
+                    for sub in set(entry["subdirs"]) - set(subdirs):
+                        self._forget_tree(sub)
+                    for name in set(entry["files"]) - set(names):
+                        self.files.pop(os.path.join(directory, name), None)
+                self.dirs[directory] = {"mtime": dir_mtime if settled else None,
+                                        "subdirs": subdirs, "files": names}
+                self.dirty = True
+            stack.extend(filter(keep, subdirs))
+        return stats
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import threading
+
+# Settling stage between the watch backends and the scheduler: a file is only released once it
+# has finished arriving. Scanners and sync clients often create the file first and fill it over
+# several seconds, and Ghostscript fails (or writes garbage) on a half-written PDF.
+
+EOF_TAIL_BYTES = 2048
+MAX_WAIT_FACTOR = 10  # A file that never gains a %%EOF is released after window * this anyway
+
+def _ignore(message):
+    pass
+
+def signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def has_eof_marker(path):
+    # Complete PDFs end with %%EOF (possibly followed by a little whitespace or junk)
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - EOF_TAIL_BYTES))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+def _proc_writers(paths):
+    # Linux: paths any visible process has open with O_WRONLY or O_RDWR
+    wanted = {os.path.realpath(path): path for path in paths}
+    held = set()
+    try:
+        pids = [pid for pid in os.listdir("/proc") if pid.isdigit()]
+    except OSError:
+        return held
+    for pid in pids:
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue  # Exited, or another user's process
+        for fd in fds:
+            try:
+                target = os.readlink(f"{fd_dir}/{fd}")
+            except OSError:
+                continue
+            if target not in wanted:
+                continue
+            try:
+                with open(f"/proc/{pid}/fdinfo/{fd}") as f:
+                    flags = next((int(line.split()[1], 8) for line in f if line.startswith("flags:")), 0)
+            except (OSError, ValueError):
+                continue
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                held.add(wanted[target])
+    return held
+
+def _locked_writers(paths):
+    # Windows: a writer that did not share write access makes our own open fail
+    held = set()
+    for path in paths:
+        try:
+            os.close(os.open(path, os.O_RDWR))
+        except PermissionError:
+            held.add(path)
+        except OSError:
+            pass
+    return held
+
+def open_for_writing(paths):
+    if not paths:
+        return set()
+    if sys.platform.startswith("linux"):
+        return _proc_writers(paths)
+    if sys.platform.startswith("win"):
+        return _locked_writers(paths)
+    return set()  # No cheap check elsewhere: the stability window alone decides
+
+class SettlingGate:
+    def __init__(self, release, stop_event, window=5.0, poll_interval=1.0, log=None):
+        self.release = release
+        self.stop_event = stop_event
+        self.window = window
+        self.poll_interval = poll_interval
+        self.log = log or _ignore
+        self.lock = threading.Lock()
+        self.files = {}  # path -> [signature, stable since, first seen]
+
+    def offer(self, path):
+        if self.window <= 0:
+            self.release(path)
+            return
+        now = time.monotonic()
+        with self.lock:
+            # Offering a file again (rescan, another event) does not restart its window
+            self.files.setdefault(path, [None, now, now])
+
+    def waiting_count(self):
+        with self.lock:
+            return len(self.files)
+
+    def check(self):
+        now = time.monotonic()
+        with self.lock:
+            entries = dict(self.files)
+        candidates = []
+        for path, (old_signature, stable_since, first_seen) in entries.items():
+            current = signature(path)
+            if current is None:
+                self._drop(path)
+            elif current != old_signature or current[0] == 0:
+                self._update(path, current, now)
+            elif now - stable_since >= self.window:
+                candidates.append(path)
+        # The open-handle check walks /proc, so it only runs for files that already look finished
+        held = open_for_writing(candidates)
+        ready = []
+        for path in candidates:
+            if path in held:
+                self._update(path, entries[path][0], now)
+                continue
+            if not has_eof_marker(path) and now - entries[path][2] < self.window * MAX_WAIT_FACTOR:
+                continue
+            self._drop(path)
+            ready.append(path)
+        for path in ready:
+            self.release(path)
+
+    def _update(self, path, current, now):
+        with self.lock:
+            if path in self.files:
+                self.files[path][0] = current
+                self.files[path][1] = now
+
+    def _drop(self, path):
+        with self.lock:
+            self.files.pop(path, None)
+
+    def run(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.log(f"⚠️ Settling check failed: {e}")
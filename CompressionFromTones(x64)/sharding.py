@@ -0,0 +1,70 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from gs_process import run_process
+from gs_session import ps_string
+
+# Page-range sharding: one huge PDF is rewritten as several -dFirstPage/-dLastPage slices in
+# parallel, then the slices are merged by one more (cheap, images already downsampled) gs pass.
+# Each slice carries the original DocInfo, so the merge keeps title/author/etc. Outlines and
+# internal links can point across slices and would not survive, so those documents are not sharded.
+
+PAGE_COUNT_TIMEOUT = 120
+
+def count_pages(gs_executable, file_path, tracker, timeout=PAGE_COUNT_TIMEOUT, permit_paths=True, popen_kwargs=None):
+    # Exact page count from Ghostscript's own PDF interpreter; None if it cannot be read.
+    # Runs like every other gs process: tracked (so stop requests kill it), prioritised and timed out.
+    command = [gs_executable, "-q", "-dNODISPLAY", "-dNOPAUSE", "-dBATCH"]
+    if permit_paths:
+        command.append(f"--permit-file-read={file_path}")
+    command += ["-c", f"{ps_string(file_path)} (r) file runpdfbegin pdfpagecount = quit"]
+    try:
+        result, _ = run_process(command, tracker, timeout, popen_kwargs)
+        return int(result.stdout.strip().splitlines()[-1])
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+def structure_blocker(info):
+    # Reason a document must be compressed in one piece, or None
+    if info["outlines"]:
+        return "has bookmarks"
+    if info["internal_links"]:
+        return "has internal links"
+    if info["encrypted"]:
+        return "encrypted"
+    return None
+
+def page_ranges(page_count, shards):
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+    ranges = []
+    first = 1
+    for i in range(shards):
+        last = first + size - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+def plan_shards(page_count, jobs, min_pages_per_shard):
+    return page_ranges(page_count, min(jobs, page_count // max(1, min_pages_per_shard)))
+
+def compress_sharded(run_pass, run_merge, file_path, output_file, ranges, jobs):
+    # run_pass(extra_args, shard_output) compresses one page range of file_path;
+    # run_merge(shard_outputs, output_file) joins them in order.
+    base, ext = os.path.splitext(file_path)
+    shard_files = [f"{base}_s{i}_compressed{ext}" for i in range(len(ranges))]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="gs-shard") as executor:
+            futures = [executor.submit(run_pass, [f"-dFirstPage={first}", f"-dLastPage={last}"], shard_file)
+                       for (first, last), shard_file in zip(ranges, shard_files)]
+            for future in futures:
+                future.result()
+        run_merge(shard_files, output_file)
+    except BaseException:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    finally:
+        for shard_file in shard_files:
+            if os.path.exists(shard_file):
+                os.remove(shard_file)
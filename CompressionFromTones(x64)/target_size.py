@@ -0,0 +1,88 @@
+import os
+
+# Target-size search: pick the highest-quality (image resolution, JPEG QFactor) setting whose
+# output fits under the target, with as few Ghostscript passes as possible.
+
+# Ordered from best to worst quality; each step should shrink the output
+LADDER = [
+    (300, 0.15),
+    (300, 0.40),
+    (225, 0.40),
+    (200, 0.76),
+    (150, 0.76),
+    (120, 0.76),
+    (110, 1.30),
+    (96, 1.30),
+    (72, 1.30),
+    (60, 2.00),
+    (50, 2.00),
+]
+# Stop as soon as an output lands within this fraction under the target
+EARLY_STOP_MARGIN = 0.10
+
+def gs_args(dpi, qfactor):
+    acs = f"<< /QFactor {qfactor} /Blend 1 /HSamples [2 1 1 2] /VSamples [2 1 1 2] >>"
+    return [
+        "-dPassThroughJPEGImages=false",  # Re-encode existing JPEGs too, or QFactor has no effect on them
+        "-dDownsampleColorImages=true",
+        "-dDownsampleGrayImages=true",
+        "-dDownsampleMonoImages=true",
+        "-dColorImageDownsampleType=/Bicubic",
+        "-dGrayImageDownsampleType=/Bicubic",
+        "-dColorImageDownsampleThreshold=1.0",
+        "-dGrayImageDownsampleThreshold=1.0",
+        f"-dColorImageResolution={dpi}",
+        f"-dGrayImageResolution={dpi}",
+        f"-dMonoImageResolution={max(dpi * 2, 150)}",
+        "-c", f"<< /ColorACSImageDict {acs} /GrayACSImageDict {acs} >> setdistillerparams",
+        "-f"
+    ]
+
+def first_probe(input_size, target_bytes):
+    # Start where the needed reduction suggests instead of the middle of the ladder
+    needed = 1 - target_bytes / input_size
+    return min(len(LADDER) - 1, max(0, int(needed * len(LADDER))))
+
+def compress_to_target(run_pass, file_path, target_bytes, max_passes=5):
+    # run_pass(extra_args, output_file) runs one Ghostscript rewrite of file_path.
+    # Returns a dict with the chosen output (or None), its size, the pass count and whether it fits.
+    input_size = os.path.getsize(file_path)
+    base, ext = os.path.splitext(file_path)
+    outputs = {}  # ladder index -> (output file, size); reused instead of re-running a setting
+    lo, hi = 0, len(LADDER) - 1
+    probe = first_probe(input_size, target_bytes)
+    best_fit = None
+    passes = 0
+    try:
+        while lo <= hi and passes < max_passes:
+            output_file = f"{base}_t{probe}_compressed{ext}"
+            run_pass(gs_args(*LADDER[probe]), output_file)
+            passes += 1
+            size = os.path.getsize(output_file)
+            outputs[probe] = (output_file, size)
+            if size <= target_bytes:
+                best_fit = probe
+                hi = probe - 1
+                if size >= target_bytes * (1 - EARLY_STOP_MARGIN):
+                    break
+            else:
+                lo = probe + 1
+            probe = (lo + hi) // 2
+    except BaseException:
+        # Includes the partial output of the pass that failed
+        for leftover in {output_file, *(path for path, _ in outputs.values())}:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    if best_fit is not None:
+        chosen = best_fit
+    elif outputs:
+        chosen = min(outputs, key=lambda i: outputs[i][1])  # Closest we got
+    else:
+        return {"output": None, "size": None, "passes": passes, "fits": False, "setting": None}
+    for index, (output_file, _) in outputs.items():
+        if index != chosen:
+            os.remove(output_file)
+    output_file, size = outputs[chosen]
+    return {"output": output_file, "size": size, "passes": passes, "fits": best_fit is not None,
+            "setting": LADDER[chosen]}
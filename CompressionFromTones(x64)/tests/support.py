@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+# Shared pieces for the tests: the app directory on sys.path, a stand-in Ghostscript and a way to
+# run compressor_core in a child process with its own HOME (the core reads config and opens its
+# stores from HOME at import time).
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# Understands the command lines this app builds: version/device probes, page counts, one-shot
+# pdfwrite runs and persistent sessions fed PostScript on stdin. Markers in the input decide
+# the outcome: CORRUPT fails, SLOW hangs for 30s (page counts too); anything else is written
+# out at half size.
+# Every compression is appended to $FAKE_GS_LOG when that is set.
+FAKE_GS = r'''#!{python}
+import os, re, sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("10.02.1")
+    sys.exit(0)
+if args == ["-h"]:
+    print("Available devices:\n   pdfwrite bbox\nSearch path:")
+    sys.exit(0)
+
+def compress(src, out):
+    if os.environ.get("FAKE_GS_LOG"):
+        with open(os.environ["FAKE_GS_LOG"], "a") as f:
+            f.write(src + "\n")
+    data = open(src, "rb").read()
+    if b"SLOW" in data:
+        time.sleep(30)
+    if b"CORRUPT" in data:
+        sys.stderr.write("Error: /syntaxerror in --run--\n")
+        return False
+    with open(out, "wb") as f:
+        f.write(data[:len(data) // 2])
+    return True
+
+if "-dNODISPLAY" in args:
+    src = re.search(r"\((.*)\) \(r\) file", args[-1]).group(1)
+    data = open(src, "rb").read()
+    if b"SLOW" in data:
+        time.sleep(30)
+    print(max(1, data.count(b"/Type /Page\n")))
+    sys.exit(0)
+if args[-1] == "-":
+    output = None
+    status = "OK"
+    for line in sys.stdin:
+        match = re.match(r"<< /OutputFile \((.*)\) >> setpagedevice", line)
+        if match:
+            output = match.group(1)
+        match = re.match(r"mark \{{ \((.*)\) run \}} stopped", line)
+        if match:
+            status = "OK" if compress(match.group(1), output) else "FAIL"
+        if "pdfc_status print" in line:
+            sys.stdout.write("\n%%PDFC-STATUS " + status + "\n")
+            sys.stdout.flush()
+    sys.exit(0)
+output = [a.split("=", 1)[1] for a in args if a.startswith("-sOutputFile=")][0]
+sys.exit(0 if compress(args[-1], output) else 1)
+'''
+
+def make_pdf(path, marker=b"", size=4096):
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n" + marker + b"\n" + b"0" * size + b"\n%%EOF\n")
+    return path
+
+class Sandbox:
+    # A temporary HOME with a config file, a bin directory holding the stand-in gs and a folder of PDFs
+    def __init__(self, config=None):
+        self.home = tempfile.mkdtemp(prefix="pdfc_test_")
+        self.bin = os.path.join(self.home, "bin")
+        self.folder = os.path.join(self.home, "pdfs")
+        self.gs_log = os.path.join(self.home, "gs.log")
+        os.makedirs(self.bin)
+        os.makedirs(self.folder)
+        gs = os.path.join(self.bin, "gs")
+        with open(gs, "w") as f:
+            f.write(FAKE_GS.format(python=sys.executable))
+        os.chmod(gs, 0o755)
+        self.write_config(config or {})
+
+    def write_config(self, config):
+        with open(os.path.join(self.home, ".pdf_compressor_config.json"), "w") as f:
+            json.dump(config, f)
+
+    def env(self):
+        return dict(os.environ, HOME=self.home, FAKE_GS_LOG=self.gs_log,
+                    PATH=self.bin + os.pathsep + os.environ.get("PATH", ""))
+
+    def gs_runs(self, path=None):
+        try:
+            with open(self.gs_log) as f:
+                runs = f.read().splitlines()
+        except OSError:
+            return 0
+        return sum(1 for run in runs if path is None or run == path)
+
+    def run_python(self, code, timeout=60):
+        # Runs code with compressor_core importable; returns its stdout (+ stderr) and fails on a crash
+        result = subprocess.run([sys.executable, "-u", "-c", code], cwd=APP_DIR, env=self.env(),
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+        if result.returncode != 0:
+            raise AssertionError(result.stdout)
+        return result.stdout
+
+    def popen(self, *args):
+        return subprocess.Popen([sys.executable, "-u", *args], cwd=APP_DIR, env=self.env(),
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
@@ -0,0 +1,76 @@
+import unittest
+from types import SimpleNamespace
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+from cost_model import CostModel, accuracy, accuracy_by_model, feature_vector, fit_weights
+
+MB = 1024 * 1024
+
+class FakeAnalyses:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def lookup(self, path, st):
+        return self.entries.get(path)
+
+def stat(size):
+    return SimpleNamespace(st_size=size, st_mtime_ns=0)
+
+def full_seconds(size, pages, images):
+    return 0.5 + 0.2 * size / MB + 0.04 * pages + 0.1 * images
+
+class FitWeightsTest(unittest.TestCase):
+    def test_recovers_known_weights(self):
+        samples = [(feature_vector(size * MB, pages, images), full_seconds(size * MB, pages, images))
+                   for size in (1, 5, 20) for pages in (1, 30, 200) for images in (0, 10, 80)]
+        weights = fit_weights(samples, ridge=1e-6)
+        for got, want in zip(weights, (0.5, 0.2, 0.04, 0.1)):
+            self.assertAlmostEqual(got, want, places=3)
+
+    def test_no_history_keeps_the_prior(self):
+        prior = (1.0, 2.0)
+        self.assertEqual(fit_weights([], prior=prior), prior)
+
+class CostModelTest(unittest.TestCase):
+    def setUp(self):
+        self.model = CostModel(FakeAnalyses({"scanned.pdf": {"pages": 100, "images": 20}}))
+
+    def test_estimate_uses_cached_counts_only(self):
+        scanned = self.model.estimate("scanned.pdf", stat(10 * MB))
+        unscanned = self.model.estimate("unscanned.pdf", stat(10 * MB))
+        self.assertEqual(self.model.take_estimate("scanned.pdf"), (100, 20, scanned, "full"))
+        self.assertEqual(self.model.take_estimate("unscanned.pdf"), (None, None, unscanned, "size"))
+        self.assertEqual(self.model.take_estimate("unscanned.pdf"), (None, None, None, None))
+
+    def test_full_model_skips_rows_without_counts(self):
+        # Unscanned files here are slow (2s per MB); the full model must not read them as 0 pages
+        rows = [("/ebook", size * MB, None, None, 2.0 * size) for size in range(1, 40)]
+        rows += [("/ebook", size * MB, size * 37 % 200, 5, full_seconds(size * MB, size * 37 % 200, 5))
+                 for size in range(1, 40)]
+        self.model.refit(rows)
+        self.assertEqual(self.model.trained_on, len(rows))
+        self.assertAlmostEqual(self.model.predict(30 * MB, 150, 5, "/ebook"),
+                               full_seconds(30 * MB, 150, 5), delta=0.5)
+        # The size-only model learns from both kinds of runs
+        self.assertTrue(full_seconds(30 * MB, 100, 5) < self.model.predict(30 * MB, None, None, "/ebook") < 60)
+
+    def test_unknown_preset_falls_back_to_the_pooled_fit(self):
+        self.model.refit([("/ebook", MB, None, None, 2.0)])
+        self.assertEqual(self.model.predict(MB, None, None, "/printer"), self.model.predict(MB, None, None))
+
+class AccuracyTest(unittest.TestCase):
+    def test_errors_are_reported_per_model(self):
+        rows = [(2.0, 1.0, "size"), (1.0, 1.0, "size"), (1.1, 1.0, "full"), (None, 1.0, None), (1.0, 0, "full")]
+        by_model = accuracy_by_model(rows)
+        self.assertEqual(sorted(by_model), ["full", "size"])
+        self.assertEqual(by_model["size"]["runs"], 2)
+        self.assertAlmostEqual(by_model["size"]["mean_error"], 0.5)
+        self.assertEqual(by_model["full"]["runs"], 1)
+        self.assertAlmostEqual(by_model["full"]["median_error"], 0.1)
+
+    def test_no_predictions_no_accuracy(self):
+        self.assertIsNone(accuracy([(None, 3.0)]))
+        self.assertEqual(accuracy_by_model([(None, 3.0, None)]), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from datetime import datetime
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+from deferral import IdleMonitor, next_opening, parse_window, parse_windows, window_open
+
+# 2024-01-01 is a Monday
+def at(day, hour, minute=0):
+    return datetime(2024, 1, day, hour, minute)
+
+class WindowTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_window("22:00-06:00"), (set(range(7)), 22 * 60, 6 * 60))
+        self.assertEqual(parse_window("Sat,Sun"), ({5, 6}, 0, 24 * 60))
+        self.assertEqual(parse_window("Mon-Fri 18:30-07:00"), ({0, 1, 2, 3, 4}, 18 * 60 + 30, 7 * 60))
+        self.assertEqual(parse_window("Fri-Mon 09:00-17:00")[0], {4, 5, 6, 0})
+
+    def test_invalid_windows_are_ignored_with_a_warning(self):
+        messages = []
+        windows = parse_windows(["25:00-26:00", "Someday", "12:00-13:00", ""], log=messages.append)
+        self.assertEqual(windows, [(set(range(7)), 12 * 60, 13 * 60)])
+        self.assertEqual(len(messages), 3)
+
+    def test_overnight_window_belongs_to_the_day_it_starts(self):
+        weeknights = [parse_window("Mon-Fri 22:00-06:00")]
+        self.assertTrue(window_open(weeknights, at(5, 23)))    # Friday night
+        self.assertTrue(window_open(weeknights, at(6, 5)))     # Saturday early: Friday's window
+        self.assertFalse(window_open(weeknights, at(6, 23)))   # Saturday night
+        self.assertFalse(window_open(weeknights, at(1, 5)))    # Monday early: Sunday had none
+        self.assertFalse(window_open(weeknights, at(2, 6)))    # End is exclusive
+
+    def test_whole_days(self):
+        weekend = [parse_window("Sat,Sun")]
+        self.assertTrue(window_open(weekend, at(7, 0)))
+        self.assertTrue(window_open(weekend, at(7, 23, 59)))
+        self.assertFalse(window_open(weekend, at(8, 0)))
+
+    def test_next_opening(self):
+        windows = [parse_window("Mon-Fri 22:00-06:00"), parse_window("Sun 12:00-13:00")]
+        self.assertEqual(next_opening(windows, at(3, 10)), at(3, 22))
+        self.assertEqual(next_opening(windows, at(5, 23)), at(7, 12))  # Friday's has begun; Sunday noon is next
+        self.assertIsNone(next_opening([], at(3, 10)))
+
+class IdleMonitorTest(unittest.TestCase):
+    def monitor(self, input_idle, cpu):
+        monitor = IdleMonitor(idle_seconds=300, cpu_percent=25)
+        monitor.input_idle_seconds = lambda: input_idle
+        monitor.cpu_busy_percent = lambda: cpu
+        return monitor
+
+    def test_idle_needs_quiet_input_and_cpu(self):
+        self.assertTrue(self.monitor(600, 5).is_idle())
+        self.assertFalse(self.monitor(60, 5).is_idle())
+        self.assertFalse(self.monitor(600, 80).is_idle())
+
+    def test_own_work_does_not_end_an_idle_period(self):
+        self.assertTrue(self.monitor(600, 80).is_idle(own_work_running=True))
+        self.assertFalse(self.monitor(60, 80).is_idle(own_work_running=True))
+
+    def test_no_signal_is_never_idle(self):
+        self.assertFalse(self.monitor(None, None).is_idle())
+        self.assertTrue(self.monitor(None, 5).is_idle())  # Headless: the CPU reading alone decides
+
+if __name__ == "__main__":
+    unittest.main()
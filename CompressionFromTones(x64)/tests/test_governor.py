@@ -0,0 +1,120 @@
+import os
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+import governor
+from governor import ResourceGovernor
+
+MB = 1024 * 1024
+CPUS = os.cpu_count() or 1
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class GovernorTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.load = 0.0
+        self.free = 8 * 1024 * MB
+        self.own = 0
+        self.throttles = []
+        for name, value in (("load_per_cpu", lambda: self.load), ("available_memory", lambda: self.free)):
+            patcher = mock.patch.object(governor, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(governor.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make(self, **kwargs):
+        kwargs.setdefault("max_load_per_cpu", 1.5)
+        kwargs.setdefault("min_free_memory", 256 * MB)
+        return ResourceGovernor(on_throttle=self.throttles.append, own_processes=lambda: self.own, **kwargs)
+
+    def tick(self, seconds=2):
+        self.clock.now += seconds
+
+    def test_idle_machine_dispatches(self):
+        gov = self.make()
+        self.assertEqual(gov.try_reserve("a.pdf"), 0)
+        self.assertEqual(gov.try_reserve("b.pdf"), 0)
+        self.assertFalse(gov.is_paused())
+
+    def test_external_load_pauses_only_with_a_job_running(self):
+        gov = self.make()
+        self.load = 3.0
+        self.assertIsNotNone(gov.try_reserve("a.pdf"))  # One job always runs
+        self.tick()
+        self.assertIsNone(gov.try_reserve("b.pdf"))
+        self.assertEqual(self.throttles, ["load"])
+        self.load = 0.5
+        self.tick()
+        self.assertIsNotNone(gov.try_reserve("b.pdf"))
+        self.assertFalse(gov.is_paused())
+
+    def test_own_processes_do_not_count_as_load(self):
+        gov = self.make()
+        self.assertIsNotNone(gov.try_reserve("a.pdf"))
+        # Our gs processes have kept the load average up for a long time; nothing else runs
+        self.own = 2 * CPUS
+        self.load = 2.0
+        for _ in range(5):
+            self.tick(120)
+            self.assertIsNotNone(gov.try_reserve("b.pdf"))
+            gov.release(0)
+        # Someone else adds two cores' worth of load per core on top
+        self.load = 4.0
+        self.tick()
+        self.assertIsNone(gov.try_reserve("c.pdf"))
+
+    def test_low_memory_pauses(self):
+        gov = self.make()
+        self.free = 100 * MB
+        self.assertIsNone(gov.try_reserve("a.pdf"))
+        self.assertEqual(self.throttles, ["memory"])
+        self.free = 1024 * MB
+        self.tick()
+        self.assertIsNotNone(gov.try_reserve("a.pdf"))
+
+    def test_memory_budget_admits_one_oversized_job(self):
+        gov = self.make(memory_budget=500 * MB, estimate=lambda path: 400 * MB)
+        first = gov.try_reserve("a.pdf")
+        self.assertEqual(first, 400 * MB)
+        self.assertIsNone(gov.try_reserve("b.pdf"))
+        self.assertEqual(self.throttles, ["budget"])
+        gov.release(first)
+        self.assertEqual(gov.try_reserve("b.pdf"), 400 * MB)
+
+        big = self.make(memory_budget=100 * MB, estimate=lambda path: 400 * MB)
+        self.assertEqual(big.try_reserve("huge.pdf"), 400 * MB)
+
+    def test_borrowed_slots_hold_back_dispatch(self):
+        gov = self.make(slots=3)
+        self.assertIsNotNone(gov.try_reserve("big.pdf"))
+        self.assertEqual(gov.borrow_slots(4), 2)  # Only the two idle slots
+        self.assertIsNone(gov.try_reserve("a.pdf"))
+        self.assertEqual(self.throttles, ["slots"])
+        gov.return_slots(2)
+        self.assertIsNotNone(gov.try_reserve("a.pdf"))
+        self.assertEqual(gov.borrow_slots(4), 1)
+        gov.return_slots(1)
+
+    def test_without_slot_cap_borrowing_is_unlimited(self):
+        gov = self.make()
+        self.assertIsNotNone(gov.try_reserve("big.pdf"))
+        self.assertEqual(gov.borrow_slots(4), 4)
+        self.assertIsNotNone(gov.try_reserve("a.pdf"))
+
+    def test_disabled_checks_never_pause(self):
+        gov = self.make(max_load_per_cpu=0, min_free_memory=0)
+        self.load, self.free = 50.0, 0
+        for name in ("a.pdf", "b.pdf", "c.pdf"):
+            self.assertIsNotNone(gov.try_reserve(name))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import shutil
+import unittest
+
+from support import Sandbox, make_pdf
+
+# The session engine (long-lived gs interpreters fed over stdin) against the stand-in Ghostscript.
+
+SESSION_CONFIG = {"engine": "session", "preflight": False, "dedupe": False, "gs_timeout_seconds": 1,
+                  "gs_timeout_per_mb_seconds": 0, "failure_backoff_seconds": 60}
+
+@unittest.skipIf(sys.platform.startswith("win"), "the stand-in Ghostscript is a shebang script")
+class SessionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.sandbox = Sandbox(SESSION_CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.sandbox.home, ignore_errors=True)
+
+    def test_success_failure_and_timeout(self):
+        folder = self.sandbox.folder
+        good, bad, slow = (make_pdf(f"{folder}/{name}.pdf", marker) for name, marker in
+                           (("good", b""), ("bad", b"CORRUPT"), ("slow", b"SLOW")))
+        output = self.sandbox.run_python(f"""
+import os, subprocess
+import compressor_core as core
+from gs_session import SessionError
+pool = core.create_session_pool([{folder!r}], 1)
+print("pool", type(pool).__name__)
+pool.compress("ebook", {good!r}, {folder!r} + "/out1.pdf")
+print("compressed", os.path.getsize({folder!r} + "/out1.pdf") == os.path.getsize({good!r}) // 2)
+pid = pool.idle["ebook"].queue[0].process.pid
+try:
+    pool.compress("ebook", {bad!r}, {folder!r} + "/out2.pdf")
+except SessionError as e:
+    print("failed", str(e).splitlines()[0])
+print("same session", pool.idle["ebook"].queue[0].process.pid == pid)
+try:
+    pool.compress("ebook", {slow!r}, {folder!r} + "/out3.pdf", timeout=1)
+except subprocess.TimeoutExpired as e:
+    print("timeout", e.timeout)
+print("busy", pool.busy_count())
+pool.compress("ebook", {good!r}, {folder!r} + "/out4.pdf")
+print("restarted", pool.idle["ebook"].queue[0].process.pid != pid)
+pool.close()
+""")
+        self.assertIn("pool SessionPool", output)
+        self.assertIn("compressed True", output)
+        self.assertIn("failed Ghostscript could not process the file:", output)
+        self.assertIn("same session True", output)
+        self.assertIn("timeout 1", output)
+        self.assertIn("busy 0", output)
+        self.assertIn("restarted True", output)
+        self.assertEqual(self.sandbox.gs_runs(), 4)
+
+@unittest.skipIf(sys.platform.startswith("win"), "the stand-in Ghostscript is a shebang script")
+class SessionTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.sandbox = Sandbox(SESSION_CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.sandbox.home, ignore_errors=True)
+
+    def test_timed_out_session_run_records_a_failure(self):
+        path = make_pdf(f"{self.sandbox.folder}/slow.pdf", b"SLOW")
+        output = self.sandbox.run_python(f"""
+import compressor_core as core
+core.session_pool = core.create_session_pool([{self.sandbox.folder!r}], 1)
+assert core.session_pool is not None
+print("result", core.compress_pdf({path!r}))
+core.session_pool.close()
+failure = core.failures.get({path!r})
+print("failure", failure["error_class"], failure["attempts"], failure["message"])
+""")
+        self.assertIn("result False", output)
+        self.assertIn("Ghostscript timed out after 1s", output)
+        self.assertIn("failure timeout 1 Timed out after 1s", output)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+from log_pipeline import LogPipeline
+
+class LogPipelineTest(unittest.TestCase):
+    def test_full_queue_drops_and_reports_once(self):
+        pipeline = LogPipeline(queue_size=3)
+        for i in range(10):
+            pipeline.emit(f"message {i}")
+        batch = pipeline.drain()
+        self.assertEqual(batch[:3], ["message 0", "message 1", "message 2"])
+        self.assertEqual(len(batch), 4)
+        self.assertIn("7 log message(s) dropped", batch[3])
+        pipeline.emit("message 10")
+        self.assertEqual(pipeline.drain(), ["message 10"])
+
+    def test_log_file_keeps_dropped_messages(self):
+        folder = tempfile.mkdtemp(prefix="pdfc_test_")
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        log_file = os.path.join(folder, "app.log")
+        pipeline = LogPipeline(log_file=log_file, queue_size=1)
+        for i in range(5):
+            pipeline.emit(f"message {i}")
+        pipeline.close()
+        with open(log_file, encoding="utf-8") as f:
+            self.assertEqual(len(f.read().splitlines()), 5)
+
+    def test_history_is_bounded(self):
+        pipeline = LogPipeline(history_lines=2)
+        for i in range(5):
+            pipeline.emit(f"message {i}")
+        pipeline.drain()
+        self.assertEqual(list(pipeline.history), ["message 3", "message 4"])
+
+if __name__ == "__main__":
+    unittest.main()
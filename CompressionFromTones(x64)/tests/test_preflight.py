@@ -0,0 +1,165 @@
+import os
+import zlib
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+from preflight import analyze_pdf, classify, read_trailer
+
+# Small PDFs written by hand with correct xref offsets. The page tree claims more pages than
+# there are page objects, so a count read from /Count is told apart from one found by scanning.
+
+def catalog_objects(kids=2, count=7):
+    page_refs = " ".join(f"{3 + i} 0 R" for i in range(kids))
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               2: f"<< /Type /Pages /Kids [{page_refs}] /Count {count} >>".encode()}
+    for i in range(kids):
+        objects[3 + i] = b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"
+    return objects
+
+def classic_pdf(objects, trailer_extra=b"", startxref=None):
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number, body in sorted(objects.items()):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for number in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[number] if number in offsets else b"0000000000 00000 f \n"
+    out += b"trailer\n<< /Size %d /Root 1 0 R " % size + trailer_extra + b">>\n"
+    out += b"startxref\n%d\n%%%%EOF\n" % (xref if startxref is None else startxref)
+    return bytes(out)
+
+def up_predicted(rows, columns):
+    # PNG "Up" filter over fixed-width rows, the way pdf writers store xref streams
+    out = bytearray()
+    previous = bytes(columns)
+    for row in rows:
+        out += b"\x02" + bytes((a - b) & 0xFF for a, b in zip(row, previous))
+        previous = row
+    return bytes(out)
+
+def xref_stream_pdf(objects):
+    # Every object but the page tree root goes into one object stream, indexed by an xref stream
+    packed = {n: body for n, body in objects.items() if n != 2}
+    header, payload = b"", b""
+    for number, body in sorted(packed.items()):
+        header += b"%d %d " % (number, len(payload))
+        payload += body + b"\n"
+    objstm_number, xref_number = max(objects) + 1, max(objects) + 2
+    objstm = zlib.compress(header + payload)
+    out = bytearray(b"%PDF-1.5\n")
+    pages_offset = len(out)
+    out += b"2 0 obj\n" + objects[2] + b"\nendobj\n"
+    objstm_offset = len(out)
+    out += (b"%d 0 obj\n<< /Type /ObjStm /N %d /First %d /Length %d /Filter /FlateDecode >>\nstream\n"
+            % (objstm_number, len(packed), len(header), len(objstm)) + objstm + b"\nendstream\nendobj\n")
+    xref_offset = len(out)
+    rows = [bytes([0, 0, 0, 0])]
+    index = {n: i for i, n in enumerate(sorted(packed))}
+    for number in range(1, xref_number + 1):
+        if number in packed:
+            rows.append(bytes([2, 0, objstm_number, index[number]]))
+        else:
+            offset = {2: pages_offset, objstm_number: objstm_offset, xref_number: xref_offset}[number]
+            rows.append(bytes([1]) + offset.to_bytes(2, "big") + b"\x00")
+    stream = zlib.compress(up_predicted(rows, 4))
+    out += (b"%d 0 obj\n<< /Type /XRef /Size %d /Root 1 0 R /W [1 2 1] /Length %d /Filter /FlateDecode "
+            b"/DecodeParms << /Columns 4 /Predictor 12 >> >>\nstream\n" % (xref_number, xref_number + 1, len(stream))
+            + stream + b"\nendstream\nendobj\n")
+    out += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    return bytes(out)
+
+class TrailerTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="pdfc_test_")
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+
+    def analyze(self, data):
+        path = os.path.join(self.folder, "doc.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        return analyze_pdf(path)
+
+    def test_classic_xref(self):
+        data = classic_pdf(catalog_objects())
+        self.assertEqual(read_trailer(data), {"encrypted": False, "pages": 7})
+        info = self.analyze(data)
+        self.assertEqual(info["pages"], 7)
+        self.assertEqual(info["page_size"], (612.0, 792.0))
+
+    def test_xref_stream_with_catalog_in_object_stream(self):
+        data = xref_stream_pdf(catalog_objects())
+        self.assertEqual(read_trailer(data), {"encrypted": False, "pages": 7})
+        self.assertEqual(self.analyze(data)["pages"], 7)
+
+    def test_incremental_update_uses_the_newest_objects(self):
+        original = classic_pdf(catalog_objects())
+        update = bytearray(original)
+        pages_offset = len(update)
+        update += b"2 0 obj\n<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 9 >>\nendobj\n"
+        xref = len(update)
+        update += b"xref\n2 1\n%010d 00000 n \n" % pages_offset
+        update += b"trailer\n<< /Size 5 /Root 1 0 R /Prev %d >>\n" % (original.rindex(b"\nxref") + 1)
+        update += b"startxref\n%d\n%%%%EOF\n" % xref
+        self.assertEqual(read_trailer(bytes(update))["pages"], 9)
+
+    def test_encrypt_in_trailer(self):
+        objects = catalog_objects()
+        objects[10] = b"<< /Filter /Standard /V 2 /R 3 >>"
+        data = classic_pdf(objects, trailer_extra=b"/Encrypt 10 0 R ")
+        self.assertTrue(read_trailer(data)["encrypted"])
+        self.assertTrue(self.analyze(data)["encrypted"])
+
+    def test_damaged_xref_falls_back_to_scanning(self):
+        data = classic_pdf(catalog_objects(), startxref=5)
+        with self.assertRaises(ValueError):
+            read_trailer(data)
+        self.assertEqual(self.analyze(data)["pages"], 2)  # The page objects found in the file
+
+    def test_stream_bodies_are_not_scanned_when_the_xref_is_readable(self):
+        objects = catalog_objects()
+        content = b"BT (see /S /GoTo) Tj ET"
+        objects[10] = b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        self.assertEqual(self.analyze(classic_pdf(objects))["internal_links"], 0)
+        self.assertEqual(self.analyze(classic_pdf(objects, startxref=5))["internal_links"], 1)
+
+def scan(images=(), file_size=1000000, object_streams=True, uncompressed_bytes=0, encrypted=False):
+    # analyze_pdf-shaped info for classify(); images: (dpi, bytes, lossless)
+    image_list = [{"dpi": dpi, "bytes": size, "lossless": lossless, "bits": 8} for dpi, size, lossless in images]
+    return {"encrypted": encrypted, "file_size": file_size, "images": len(image_list), "image_list": image_list,
+            "image_bytes": sum(image["bytes"] for image in image_list),
+            "max_dpi": max((image["dpi"] for image in image_list), default=0.0),
+            "uncompressed_bytes": uncompressed_bytes, "object_streams": object_streams}
+
+class ClassifyTest(unittest.TestCase):
+    def test_high_resolution_scan_is_compressed(self):
+        verdict, reason, ratio = classify(scan([(600, 800000, False)]), "ebook", 0.05)
+        self.assertEqual((verdict, reason), ("compress", "expected to shrink"))
+        self.assertGreater(ratio, 0.5)
+
+    def test_text_only_file_is_skipped(self):
+        self.assertEqual(classify(scan(), "ebook", 0.05)[:2], ("skip", "text-only"))
+
+    def test_images_at_target_resolution_are_skipped(self):
+        verdict, reason, _ = classify(scan([(150, 800000, False)]), "ebook", 0.05)
+        self.assertEqual((verdict, reason), ("skip", "images already at or below 150 dpi"))
+
+    def test_lossless_images_are_reencoded_at_low_presets(self):
+        info = scan([(150, 800000, True)])
+        self.assertEqual(classify(info, "ebook", 0.05)[0], "compress")
+        self.assertEqual(classify(info, "printer", 0.05)[:2], ("skip", "images already at or below 300 dpi"))
+
+    def test_uncompressed_streams_and_old_xref_count(self):
+        self.assertEqual(classify(scan(uncompressed_bytes=200000), "ebook", 0.05)[0], "compress")
+        self.assertEqual(classify(scan(object_streams=False), "ebook", 0.05)[0], "compress")
+        self.assertEqual(classify(scan(object_streams=False), "ebook", 0.06)[0], "skip")
+
+    def test_encrypted_files_are_never_skipped(self):
+        self.assertEqual(classify(scan(encrypted=True), "ebook", 0.05), ("compress", "encrypted, cannot judge", None))
+
+if __name__ == "__main__":
+    unittest.main()
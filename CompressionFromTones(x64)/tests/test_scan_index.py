@@ -0,0 +1,74 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+from scan_index import ScanIndex
+
+class ScanIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp(prefix="pdfc_test_")
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        self.root = os.path.join(self.home, "root")
+        self.sub = os.path.join(self.root, "sub")
+        os.makedirs(self.sub)
+        self.pdf = os.path.join(self.sub, "a.pdf")
+        with open(self.pdf, "wb") as f:
+            f.write(b"%PDF-1.4\n")
+        self.age()
+        self.index = ScanIndex(os.path.join(self.home, "index.json"))
+
+    def age(self):
+        # Directory mtimes within the racy window are never trusted, so push them into the past
+        past = time.time() - 60
+        for path in (self.pdf, self.sub, self.root):
+            os.utime(path, (past, past))
+
+    def scan(self):
+        offered = []
+        stats = self.index.scan(self.root, offered.append, threading.Event())
+        return offered, stats
+
+    def test_handled_file_is_not_offered_again(self):
+        self.assertEqual(self.scan()[0], [self.pdf])
+        self.index.mark_done(self.pdf)
+        self.assertEqual(self.scan()[0], [])  # Lists the unsettled folder once more, then trusts it
+        offered, stats = self.scan()
+        self.assertEqual(offered, [])
+        self.assertEqual(stats["dirs_listed"], 0)
+
+    def test_unhandled_file_keeps_its_folder_unsettled(self):
+        self.scan()
+        self.assertEqual(self.scan()[0], [self.pdf])
+
+    def test_forgotten_file_is_rescanned(self):
+        self.scan()
+        self.index.mark_done(self.pdf)
+        self.scan()
+        self.index.forget(self.pdf)
+        offered, stats = self.scan()
+        self.assertEqual(offered, [self.pdf])
+        self.assertEqual(stats["dirs_skipped"], 1)  # Only the forgotten file's folder is listed again
+
+    def test_saved_index_survives_a_restart(self):
+        self.scan()
+        self.index.mark_done(self.pdf)
+        self.scan()
+        self.index.forget(self.pdf)
+        self.index.save()
+        self.index = ScanIndex(self.index.path)
+        self.assertEqual(self.scan()[0], [self.pdf])
+
+    def test_removed_folder_is_forgotten(self):
+        self.scan()
+        self.index.mark_done(self.pdf)
+        shutil.rmtree(self.sub)
+        self.scan()
+        self.assertNotIn(self.sub, self.index.dirs)
+        self.assertNotIn(self.pdf, self.index.files)
+
+if __name__ == "__main__":
+    unittest.main()
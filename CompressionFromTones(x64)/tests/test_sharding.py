@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import shutil
+import unittest
+
+from support import Sandbox, make_pdf
+from gs_process import ProcessTracker
+from sharding import count_pages, page_ranges, plan_shards, structure_blocker
+
+class PlanShardsTest(unittest.TestCase):
+    def test_ranges_cover_every_page_once(self):
+        for pages, shards in ((100, 4), (101, 4), (7, 3), (3, 8)):
+            ranges = page_ranges(pages, shards)
+            self.assertEqual(len(ranges), min(pages, shards))
+            self.assertEqual([p for first, last in ranges for p in range(first, last + 1)], list(range(1, pages + 1)))
+            sizes = [last - first + 1 for first, last in ranges]
+            self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+    def test_shards_respect_jobs_and_minimum_size(self):
+        self.assertEqual(plan_shards(1000, 4, 50), [(1, 250), (251, 500), (501, 750), (751, 1000)])
+        self.assertEqual(len(plan_shards(120, 8, 50)), 2)
+        self.assertEqual(plan_shards(60, 8, 50), [(1, 60)])
+        self.assertEqual(plan_shards(10, 4, 0), page_ranges(10, 4))
+
+    def test_structure_blockers(self):
+        info = {"outlines": False, "internal_links": 0, "encrypted": False}
+        self.assertIsNone(structure_blocker(info))
+        self.assertEqual(structure_blocker(dict(info, outlines=True)), "has bookmarks")
+        self.assertEqual(structure_blocker(dict(info, internal_links=3)), "has internal links")
+        self.assertEqual(structure_blocker(dict(info, encrypted=True)), "encrypted")
+
+@unittest.skipIf(sys.platform.startswith("win"), "the stand-in Ghostscript is a shebang script")
+class CountPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.sandbox = Sandbox()
+        self.addCleanup(shutil.rmtree, self.sandbox.home, ignore_errors=True)
+        self.gs = os.path.join(self.sandbox.bin, "gs")
+        self.tracker = ProcessTracker()
+
+    def test_counts_pages_through_the_tracker(self):
+        path = make_pdf(os.path.join(self.sandbox.folder, "doc.pdf"), b"/Type /Page\n" * 3)
+        self.assertEqual(count_pages(self.gs, path, self.tracker), 3)
+        self.assertEqual(self.tracker.count(), 0)
+
+    def test_times_out(self):
+        path = make_pdf(os.path.join(self.sandbox.folder, "slow.pdf"), b"SLOW")
+        started = time.monotonic()
+        self.assertIsNone(count_pages(self.gs, path, self.tracker, timeout=1))
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(self.tracker.count(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
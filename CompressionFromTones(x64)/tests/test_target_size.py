@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401  (puts the app directory on sys.path)
+from target_size import LADDER, compress_to_target, first_probe
+
+INPUT_SIZE = 100000
+
+class FakePasses:
+    # run_pass stand-in: each ladder step writes a smaller output, sizes[step] bytes
+    def __init__(self, sizes, fail_at=None):
+        self.sizes = sizes
+        self.fail_at = fail_at
+        self.steps = []
+
+    def __call__(self, extra_args, output_file):
+        dpi = int(next(a for a in extra_args if a.startswith("-dColorImageResolution=")).split("=")[1])
+        qfactor = float(next(a for a in extra_args if "/QFactor" in a).split("/QFactor ")[1].split()[0])
+        step = LADDER.index((dpi, qfactor))
+        self.steps.append(step)
+        with open(output_file, "wb") as f:
+            f.write(b"0" * (self.sizes[step] // 2))  # A partial output, as gs leaves behind on failure
+            if step == self.fail_at:
+                raise RuntimeError("gs failed")
+            f.write(b"0" * (self.sizes[step] - self.sizes[step] // 2))
+
+class TargetSizeTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="pdfc_test_")
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        self.path = os.path.join(self.folder, "doc.pdf")
+        with open(self.path, "wb") as f:
+            f.write(b"0" * INPUT_SIZE)
+
+    def leftovers(self):
+        return sorted(name for name in os.listdir(self.folder) if name != "doc.pdf")
+
+    def test_first_probe_follows_the_needed_reduction(self):
+        self.assertEqual(first_probe(INPUT_SIZE, INPUT_SIZE), 0)
+        self.assertEqual(first_probe(INPUT_SIZE, INPUT_SIZE // 2), len(LADDER) // 2)
+        self.assertEqual(first_probe(INPUT_SIZE, 1), len(LADDER) - 1)
+
+    def test_picks_the_best_quality_that_fits(self):
+        sizes = [INPUT_SIZE - 8000 * (i + 1) for i in range(len(LADDER))]
+        run_pass = FakePasses(sizes)
+        result = compress_to_target(run_pass, self.path, 50000, max_passes=len(LADDER))
+        best = min(i for i, size in enumerate(sizes) if size <= 50000)
+        self.assertTrue(result["fits"])
+        self.assertEqual(result["setting"], LADDER[best])
+        self.assertEqual(result["size"], sizes[best])
+        self.assertEqual(result["passes"], len(run_pass.steps))
+        self.assertLess(result["passes"], len(LADDER))
+        self.assertEqual(self.leftovers(), [os.path.basename(result["output"])])
+
+    def test_stops_early_close_under_the_target(self):
+        sizes = [INPUT_SIZE - 8000 * (i + 1) for i in range(len(LADDER))]
+        probe = first_probe(INPUT_SIZE, sizes[5] + 1000)
+        sizes[probe] = sizes[5] + 500  # Within the margin of the target
+        result = compress_to_target(FakePasses(sizes), self.path, sizes[5] + 1000)
+        self.assertEqual(result["passes"], 1)
+        self.assertEqual(result["setting"], LADDER[probe])
+
+    def test_nothing_fits_keeps_the_smallest_output(self):
+        sizes = [90000 - 1000 * i for i in range(len(LADDER))]
+        result = compress_to_target(FakePasses(sizes), self.path, 1000)
+        self.assertFalse(result["fits"])
+        self.assertEqual(result["passes"], 1)  # Even the lowest setting misses, so better ones are not tried
+        self.assertEqual((result["setting"], result["size"]), (LADDER[-1], sizes[-1]))
+        self.assertEqual(self.leftovers(), [os.path.basename(result["output"])])
+
+    def test_failed_pass_removes_every_output(self):
+        sizes = [INPUT_SIZE - 8000 * (i + 1) for i in range(len(LADDER))]
+        run_pass = FakePasses(sizes)
+        run_pass.fail_at = first_probe(INPUT_SIZE, 50000) + 1
+        sizes[run_pass.fail_at - 1] = 60000  # First probe misses, so the search moves on to the failing step
+        with self.assertRaises(RuntimeError):
+            compress_to_target(run_pass, self.path, 50000)
+        self.assertEqual(self.leftovers(), [])
+
+if __name__ == "__main__":
+    unittest.main()
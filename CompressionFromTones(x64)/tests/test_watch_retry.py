@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import shutil
+import unittest
+import subprocess
+
+from support import APP_DIR, Sandbox, make_pdf
+
+# Watch mode end to end, against the stand-in Ghostscript with a file it always fails on: the file
+# must be retried after its backoff, quarantined after failure_max_attempts, and attempted again
+# by a later watch once released.
+
+WATCH_CONFIG = {"jobs": 1, "settle_seconds": 1, "watch_backend": "polling", "poll_interval": 1, "preflight": False,
+                "failure_backoff_seconds": 1, "failure_max_attempts": 3}
+
+@unittest.skipIf(sys.platform.startswith("win"), "the stand-in Ghostscript is a shebang script")
+class WatchRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.sandbox = Sandbox(WATCH_CONFIG)
+        self.path = make_pdf(os.path.join(self.sandbox.folder, "bad.pdf"), b"CORRUPT")
+
+    def tearDown(self):
+        shutil.rmtree(self.sandbox.home, ignore_errors=True)
+
+    def watch_until(self, attempts, settle=3):
+        # Watches until gs has run `attempts` times (or 30s pass), then a little longer for stray runs
+        watch = self.sandbox.popen("compress.py", "--watch", self.sandbox.folder)
+        try:
+            deadline = time.monotonic() + 30
+            while self.sandbox.gs_runs() < attempts and time.monotonic() < deadline:
+                time.sleep(0.2)
+            time.sleep(settle)
+        finally:
+            watch.terminate()
+        return watch.communicate(timeout=10)[0]
+
+    def cli(self, *args):
+        return subprocess.run([sys.executable, "compress.py", *args], cwd=APP_DIR,
+                              env=self.sandbox.env(), stdout=subprocess.PIPE, text=True, check=True).stdout
+
+    def test_failing_file_is_retried_then_quarantined(self):
+        output = self.watch_until(3)
+        self.assertEqual(self.sandbox.gs_runs(), 3, output)
+        self.assertIn("Quarantined after 3 failed attempts", output)
+        self.assertIn(self.path, self.cli("--quarantine"))
+
+    def test_released_file_is_attempted_by_a_restarted_watch(self):
+        self.watch_until(3)
+        self.assertIn("Released 1 file(s).", self.cli("--release", self.path))
+        output = self.watch_until(4, settle=1)
+        self.assertGreaterEqual(self.sandbox.gs_runs(), 4, output)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# ----------------- Shared Helpers -----------------
+def is_candidate_pdf(name):
+    lower = name.lower()
+    return lower.endswith(".pdf") and not lower.endswith("_compressed.pdf")
+
+def _ignore(message):
+    pass
+
+def _ignore_scan(seconds, stats):
+    pass
+
+# ----------------- Polling Backend -----------------
+class PollingBackend:
+    name = "polling"
+
+    def __init__(self, folder, stop_event, on_file, interval=10, index=None, full_rescan_interval=3600, log=None,
+                 on_scan=None, scan_filter=None):
+        self.folder = folder
+        self.stop_event = stop_event
+        self.on_file = on_file
+        self.interval = interval
+        self.index = index
+        # In-place rewrites don't touch the directory mtime, so the index is verified
+        # with a full listing every so often
+        self.full_rescan_interval = full_rescan_interval
+        self.last_full_scan = None
+        self.log = log or _ignore
+        self.on_scan = on_scan or _ignore_scan  # Called with the duration (seconds) and index stats of every scan
+        self.scan_filter = scan_filter  # Prunes excluded folders and drops unwanted files (scan_filter.ScanFilter)
+
+    def scan(self, folder=None, full=False):
+        started = time.monotonic()
+        stats = None
+        try:
+            stats = self._scan(folder or self.folder, full)
+        finally:
+            self.on_scan(time.monotonic() - started, stats)
+
+    def _scan(self, folder, full):
+        if self.index is not None:
+            stats = self.index.scan(folder, self.on_file, self.stop_event, full=full, scan_filter=self.scan_filter)
+            self.save_index()
+            return stats
+        for root_dir, dirs, files in os.walk(folder):
+            if self.scan_filter is not None:
+                dirs[:] = [d for d in dirs if not self.scan_filter.prune(os.path.join(root_dir, d))]
+            for file in files:
+                if not is_candidate_pdf(file):
+                    continue
+                path = os.path.join(root_dir, file)
+                if self.scan_filter is None or self.scan_filter.accepts(path):
+                    self.on_file(path)
+                    if self.stop_event.is_set():
+                        return None
+        return None
+
+    def save_index(self):
+        if self.index is None:
+            return
+        try:
+            self.index.save()
+        except OSError as e:
+            self.log(f"⚠️ Could not save scan index: {e}")
+
+    def run(self):
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            full = self.last_full_scan is not None and now - self.last_full_scan >= self.full_rescan_interval
+            if self.last_full_scan is None or full:
+                self.last_full_scan = now
+            self.scan(full=full)
+            if self.stop_event.wait(self.interval):
+                break
+
+# ----------------- inotify Backend (Linux) -----------------
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Files are released when the writer closes them or when they are renamed into the tree
+# (sync clients and scanners usually write to a temp name first).
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+INDEX_SAVE_INTERVAL = 30
+
+_libc = None
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return _libc
+
+class InotifyBackend:
+    name = "inotify"
+
+    @staticmethod
+    def available():
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            return hasattr(_load_libc(), "inotify_init1")
+        except OSError:
+            return False
+
+    def __init__(self, folder, stop_event, on_file, poll_interval=10, index=None, log=None, on_scan=None,
+                 scan_filter=None):
+        self.folder = folder
+        self.stop_event = stop_event
+        self.on_file = on_file
+        self.log = log or _ignore
+        self.fd = None
+        self.watches = {}  # wd -> directory path
+        self.scan_filter = scan_filter
+        self.poller = PollingBackend(folder, stop_event, on_file, interval=poll_interval, index=index, log=log,
+                                     on_scan=on_scan, scan_filter=scan_filter)
+
+    def open(self):
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+        self._watch_tree(self.folder)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches.clear()
+
+    def _add_watch(self, path):
+        wd = _load_libc().inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                # fs.inotify.max_user_watches exhausted: the caller falls back to polling
+                raise OSError(err, "inotify watch limit reached")
+            if err not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                raise OSError(err, os.strerror(err), path)
+            return
+        self.watches[wd] = path
+
+    def _watch_tree(self, folder):
+        # Pruned folders get no watch at all, which also saves inotify watches on big trees
+        for root_dir, dirs, _ in os.walk(folder):
+            self._add_watch(root_dir)
+            if self.scan_filter is not None:
+                dirs[:] = [d for d in dirs if not self.scan_filter.prune(os.path.join(root_dir, d), report=False)]
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            yield wd, mask, name
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self.log("⚠️ File event queue overflowed, rescanning folder.")
+            self.poller.scan()
+            return
+        directory = self.watches.get(wd)
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        if directory is None or not name:
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and not (self.scan_filter and self.scan_filter.prune(path)):
+                # Files may land in a new directory before its watch exists, so sweep it once
+                self._watch_tree(path)
+                self.poller.scan(path)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and is_candidate_pdf(name):
+            self.on_file(path)
+
+    def run(self):
+        try:
+            self.open()
+        except OSError as e:
+            self.close()
+            self.log(f"⚠️ File events unavailable ({e}), falling back to polling.")
+            self.poller.run()
+            return
+        try:
+            # Events only cover changes from now on; pick up what is already there once
+            self.poller.scan()
+            last_save = time.monotonic()
+            while not self.stop_event.is_set():
+                if time.monotonic() - last_save >= INDEX_SAVE_INTERVAL:
+                    self.poller.save_index()
+                    last_save = time.monotonic()
+                ready, _, _ = select.select([self.fd], [], [], 1.0)
+                if not ready:
+                    continue
+                for wd, mask, name in self._read_events():
+                    self._handle(wd, mask, name)
+                    if self.stop_event.is_set():
+                        break
+        except OSError as e:
+            self.log(f"⚠️ File events stopped ({e}), falling back to polling.")
+        else:
+            return
+        finally:
+            self.close()
+            self.poller.save_index()
+        self.poller.run()
+
+# ----------------- Backend Selection -----------------
+# inotify only sees changes made through the local kernel: files written by other machines to a
+# network share never raise an event, so such folders are polled instead
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "ceph", "lustre", "gpfs",
+                       "glusterfs", "fuse.sshfs", "fuse.glusterfs", "fuse.rclone", "fuse.s3fs", "fuse.davfs",
+                       "fuse.gcsfuse", "fuse.cephfs"}
+
+def _mount_points():
+    # [(mount point, filesystem type)] from /proc/mounts, whose paths escape spaces etc. as octal
+    try:
+        with open("/proc/mounts") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            point = fields[1].encode().decode("unicode_escape").encode("latin-1").decode(errors="replace")
+            mounts.append((point, fields[2]))
+    return mounts
+
+def network_filesystem(folder):
+    # Type of the network filesystem folder (or a mount inside it) is on, or None
+    if not sys.platform.startswith("linux"):
+        return None
+    folder = os.path.realpath(folder)
+    owner, owner_type = "", None
+    for point, fstype in _mount_points():
+        if folder == point or folder.startswith(point.rstrip("/") + "/"):
+            if len(point) >= len(owner):
+                owner, owner_type = point, fstype
+        elif point.startswith(folder.rstrip("/") + "/") and fstype in NETWORK_FILESYSTEMS:
+            return fstype  # A share mounted below the watched folder
+    return owner_type if owner_type in NETWORK_FILESYSTEMS else None
+
+def create_backend(folder, stop_event, on_file, mode="auto", poll_interval=10, index=None,
+                   full_rescan_interval=3600, log=None, on_scan=None, scan_filter=None):
+    log = log or _ignore
+    remote = network_filesystem(folder) if mode in ("auto", "events") else None
+    if remote and mode == "auto":
+        log(f"🌐 {folder} is on a network filesystem ({remote}); polling it, as file events would miss "
+            f"files written by other machines.")
+    elif mode in ("auto", "events"):
+        if remote:
+            log(f"⚠️ {folder} is on a network filesystem ({remote}): file events only report local changes.")
+        if InotifyBackend.available():
+            return InotifyBackend(folder, stop_event, on_file, poll_interval=poll_interval, index=index, log=log,
+                                  on_scan=on_scan, scan_filter=scan_filter)
+        if mode == "events":
+            log("⚠️ File events are not supported on this platform, falling back to polling.")
+    return PollingBackend(folder, stop_event, on_file, interval=poll_interval, index=index,
+                          full_rescan_interval=full_rescan_interval, log=log, on_scan=on_scan,
+                          scan_filter=scan_filter)
@@ -0,0 +1,93 @@
+import os
+from scan_filter import ScanFilter
+
+# Watched folders and their profiles. Each root has its own preset, scan filter (see scan_filter)
+# and priority; all of them feed the one shared compression scheduler.
+#
+# Config entry: {"folder": "...", "quality": "High Quality", "include": ["invoices/*"],
+#                "exclude": ["*/archive/*"], "priority": 10, "min_size_kb": 100,
+#                "max_size_mb": 0, "max_depth": 3}
+# Filter settings left out of an entry come from the global scan_* settings; excludes add up.
+
+def _ignore(message):
+    pass
+
+def _normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+class WatchRoot:
+    def __init__(self, folder, quality=None, include=(), exclude=(), priority=0, min_size=0, max_size=0,
+                 max_depth=None):
+        self.folder = os.path.abspath(folder)
+        self.quality = quality or None  # None follows config["quality"]
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.priority = priority
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.nested = []  # Roots inside this one; their files belong to them
+
+    def contains(self, path):
+        folder = _normalize(self.folder)
+        path = _normalize(path)
+        return path == folder or path.startswith(folder.rstrip(os.sep) + os.sep)
+
+    def make_filter(self, on_skip=None):
+        return ScanFilter(self.folder, self.include, self.exclude, self.min_size, self.max_size, self.max_depth,
+                          [root.folder for root in self.nested], on_skip)
+
+    def describe(self):
+        parts = [self.quality or "default quality"]
+        if self.priority:
+            parts.append(f"priority {self.priority}")
+        if self.include:
+            parts.append("include " + ", ".join(self.include))
+        if self.exclude:
+            parts.append("exclude " + ", ".join(self.exclude))
+        if self.min_size or self.max_size:
+            parts.append(f"{self.min_size // 1024} KB to " +
+                         (f"{self.max_size / (1024 * 1024):g} MB" if self.max_size else "any size"))
+        if self.max_depth is not None:
+            parts.append(f"depth {self.max_depth}")
+        return f"{self.folder} ({'; '.join(parts)})"
+
+def parse_roots(entries, known_qualities=(), defaults=None, log=None):
+    # Config entries (dicts, or plain folder strings) -> WatchRoots; unusable entries are logged and skipped.
+    # defaults: the global filter settings, in the same keys as a root entry
+    log = log or _ignore
+    defaults = defaults or {}
+    roots = {}
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"folder": entry}
+        folder = entry.get("folder", "")
+        if not folder or not os.path.isdir(folder):
+            log(f"⚠️ Watch folder does not exist, skipping: {folder or entry}")
+            continue
+        quality = entry.get("quality")
+        if quality and known_qualities and quality not in known_qualities:
+            log(f"⚠️ Unknown quality {quality!r} for {folder}, using the default quality.")
+            quality = None
+        try:
+            priority = int(entry.get("priority", 0))
+        except (TypeError, ValueError):
+            priority = 0
+        key = _normalize(folder)
+        if key in roots:
+            log(f"⚠️ {folder} is listed twice in watch_roots, using the first entry.")
+            continue
+        settings = dict(defaults, **entry)
+        roots[key] = WatchRoot(folder, quality, settings.get("include") or (),
+                               list(defaults.get("exclude") or ()) + list(entry.get("exclude") or ()), priority,
+                               int((settings.get("min_size_kb") or 0) * 1024),
+                               int((settings.get("max_size_mb") or 0) * 1024 * 1024), settings.get("max_depth"))
+    roots = list(roots.values())
+    for root in roots:
+        root.nested = [other for other in roots if other is not root and root.contains(other.folder)]
+    return roots
+
+def owning_root(roots, path):
+    # The innermost root containing path, or None
+    matches = [root for root in roots if root.contains(path)]
+    return max(matches, key=lambda root: len(root.folder), default=None)